@@ -0,0 +1,478 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+N_FFT = 2048
+HOP_LENGTH = 512
+TEMPOGRAM_WINDOW = 384  # onset frames per autocorrelation window (~9s at 22.05 kHz)
+
+
+def analysis_sample_rate():
+    return getattr(settings, 'MUSIC_ANALYSIS_SAMPLE_RATE', 22050)
+
+
+def analysis_block_seconds():
+    return getattr(settings, 'MUSIC_ANALYSIS_BLOCK_SECONDS', 30)
+
+
+def header_info(path):
+    """
+    Duration (seconds), sample rate, channels and bitrate from the container
+    header, without decoding audio. Missing values are None.
+    """
+    from mutagen import File as MutagenFile
+
+    info = dict.fromkeys(('duration', 'sample_rate', 'channels', 'bitrate'))
+    try:
+        audio = MutagenFile(path)
+    except Exception:
+        return info
+    if audio is None:
+        return info
+    info.update(
+        duration=float(audio.info.length) if getattr(audio.info, 'length', None) else None,
+        sample_rate=getattr(audio.info, 'sample_rate', None) or None,
+        channels=getattr(audio.info, 'channels', None) or None,
+        bitrate=getattr(audio.info, 'bitrate', None) or None,
+    )
+    return info
+
+
+def _soundfile_blocks(path, block_seconds):
+    import soundfile
+
+    with soundfile.SoundFile(path) as source:
+        frames = max(1, int(source.samplerate * block_seconds))
+        for block in source.blocks(blocksize=frames, dtype='float32', always_2d=True):
+            yield block, source.samplerate
+
+
+def _ffmpeg_blocks(path, block_seconds):
+    # Formats libsndfile can't read: let ffmpeg decode into a pipe
+    info = header_info(path)
+    rate, channels = info['sample_rate'] or 44100, info['channels'] or 2
+    command = ['ffmpeg', '-v', 'error', '-i', path, '-ac', str(channels), '-ar', str(rate), '-f', 'f32le', '-']
+    frame_bytes = 4 * channels
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        try:
+            while True:
+                data = process.stdout.read(int(rate * block_seconds) * frame_bytes)
+                if not data:
+                    break
+                data = data[:len(data) - len(data) % frame_bytes]
+                yield np.frombuffer(data, dtype='<f4').reshape(-1, channels), rate
+        finally:
+            process.kill()
+
+
+def iter_blocks(path, sr=None, block_seconds=None):
+    """
+    Decode `path` once, in fixed-size blocks so memory does not grow with
+    track length. Yields (mono float32 at the analysis sample rate, native
+    frames x channels block, native sample rate); the native block is what
+    loudness is measured on.
+    """
+    import soundfile
+    import soxr
+
+    sr = sr or analysis_sample_rate()
+    block_seconds = block_seconds or analysis_block_seconds()
+    try:
+        soundfile.info(path)
+        blocks = _soundfile_blocks(path, block_seconds)
+    except Exception:
+        if shutil.which('ffmpeg') is None:
+            raise
+        blocks = _ffmpeg_blocks(path, block_seconds)
+
+    resampler = rate = None
+    channels = 1
+    for block, rate in blocks:
+        channels = block.shape[1]
+        if resampler is None and rate != sr:
+            resampler = soxr.ResampleStream(rate, sr, 1, dtype='float32')
+        mono = block.mean(axis=1)
+        if resampler is not None:
+            mono = resampler.resample_chunk(mono)
+        yield mono, block, rate
+    if resampler is not None:
+        tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        if len(tail):
+            yield tail, np.zeros((0, channels), dtype=np.float32), rate
+
+
+class TempoEstimator:
+    """
+    Streaming version of `librosa.feature.tempo`: onset strength and the
+    autocorrelation tempogram are computed block by block and only the
+    running sum of the tempogram is kept, plus enough onset frames to carry
+    the window across block boundaries.
+    """
+
+    def __init__(self, sr, hop_length=HOP_LENGTH, win_length=TEMPOGRAM_WINDOW):
+        self.sr = sr
+        self.hop_length = hop_length
+        self.win_length = win_length
+        self.total = np.zeros(win_length)
+        self.frames = 0
+        self.carry = np.zeros(0)
+
+    def update(self, block, mel_db=None):
+        import librosa
+
+        if len(block) < N_FFT:
+            return  # resampler flush at the very end; too short to matter
+        if mel_db is not None:
+            onset = librosa.onset.onset_strength(S=mel_db, sr=self.sr)
+        else:
+            onset = librosa.onset.onset_strength(y=block, sr=self.sr, hop_length=self.hop_length)
+        onset = np.concatenate([self.carry, onset])
+        if len(onset) >= self.win_length:
+            tempogram = librosa.feature.tempogram(
+                onset_envelope=onset, sr=self.sr, hop_length=self.hop_length,
+                win_length=self.win_length, center=False,
+            )
+            self.total += tempogram.sum(axis=1)
+            self.frames += tempogram.shape[1]
+            onset = onset[-(self.win_length - 1):]
+        self.carry = onset
+
+    def tempo(self, start_bpm=120.0, std_bpm=1.0, max_tempo=320.0):
+        import librosa
+
+        if not self.frames:
+            # Shorter than one window: fall back to a padded tempogram
+            if not len(self.carry):
+                return None
+            tempogram = librosa.feature.tempogram(
+                onset_envelope=self.carry, sr=self.sr, hop_length=self.hop_length, win_length=self.win_length,
+            )
+            self.total, self.frames = tempogram.sum(axis=1), tempogram.shape[1]
+
+        mean = self.total / self.frames
+        bpms = librosa.tempo_frequencies(self.win_length, hop_length=self.hop_length, sr=self.sr)
+        with np.errstate(divide='ignore'):
+            logprior = -0.5 * ((np.log2(bpms) - np.log2(start_bpm)) / std_bpm) ** 2
+        logprior[:np.argmax(bpms < max_tempo)] = -np.inf
+        return float(bpms[np.argmax(np.log1p(1e6 * mean) + logprior)])
+
+
+def spectra(block, sr):
+    """Magnitude STFT and log-mel spectrogram, shared by tempo and feature extraction."""
+    import librosa
+
+    magnitude = np.abs(librosa.stft(block, n_fft=N_FFT, hop_length=HOP_LENGTH))
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=magnitude ** 2, sr=sr))
+    return magnitude, mel_db
+
+
+ANALYSIS_STAGES = ('tempo', 'features', 'waveform', 'fingerprint', 'loudness')
+SPECTRAL_STAGES = {'tempo', 'features', 'fingerprint'}
+
+
+def analyze_audio(path, sr=None, block_seconds=None, stages=ANALYSIS_STAGES):
+    """
+    Runs the requested stages over one streamed decode. Returns the header
+    fields from `header_info` and 'duration', plus per stage:
+
+        tempo        'bpm'
+        features     'features' (similarity vector, see music.features)
+        waveform     'waveform' (peaks blob, see music.waveform)
+        fingerprint  'fingerprint' (hashes, see music.fingerprint)
+        loudness     'loudness_lufs', 'true_peak_dbtp', 'replay_gain_db'
+
+    and 'timings' ({stage: seconds}). Duration is counted from the decoded
+    samples when the header doesn't have it.
+    """
+    from .features import FeatureAccumulator
+    from .fingerprint import FingerprintAccumulator
+    from .loudness import LoudnessMeter
+    from .waveform import WaveformAccumulator
+
+    sr = sr or analysis_sample_rate()
+    stages = set(stages)
+    timings = {}
+
+    started = time.perf_counter()
+    analysis = header_info(path)
+    timings['header'] = time.perf_counter() - started
+
+    estimator = TempoEstimator(sr) if 'tempo' in stages else None
+    features = FeatureAccumulator(sr) if 'features' in stages else None
+    waveform = WaveformAccumulator() if 'waveform' in stages else None
+    fingerprint = FingerprintAccumulator() if 'fingerprint' in stages else None
+    meter = None
+    spectral = bool(stages & SPECTRAL_STAGES)
+    timings['decode'] = 0.0
+    for stage in ANALYSIS_STAGES:
+        if stage in stages:
+            timings[stage] = 0.0
+    if spectral:
+        timings['spectrum'] = 0.0
+
+    def timed(stage, function, *args):
+        started = time.perf_counter()
+        function(*args)
+        timings[stage] += time.perf_counter() - started
+
+    samples = 0
+    blocks = iter_blocks(path, sr, block_seconds)
+    while True:
+        started = time.perf_counter()
+        item = next(blocks, None)
+        timings['decode'] += time.perf_counter() - started
+        if item is None:
+            break
+        block, native, rate = item
+        samples += len(block)
+        if 'loudness' in stages:
+            meter = meter or LoudnessMeter(rate, native.shape[1])
+            timed('loudness', meter.update, native)
+        if waveform:
+            timed('waveform', waveform.update, block)
+        if not spectral or len(block) < N_FFT:
+            continue  # resampler flush at the very end; too short to matter
+        started = time.perf_counter()
+        magnitude, mel_db = spectra(block, sr)
+        timings['spectrum'] += time.perf_counter() - started
+        if estimator:
+            timed('tempo', estimator.update, block, mel_db)
+        if features:
+            timed('features', features.update, block, magnitude, mel_db)
+        if fingerprint:
+            timed('fingerprint', fingerprint.update, magnitude)
+
+    if estimator:
+        started = time.perf_counter()
+        analysis['bpm'] = estimator.tempo()
+        timings['tempo'] += time.perf_counter() - started
+    if features:
+        analysis['features'] = features.vector()
+    if waveform:
+        analysis['waveform'] = waveform.encode()
+    if fingerprint:
+        analysis['fingerprint'] = fingerprint.hashes()
+    if 'loudness' in stages:
+        started = time.perf_counter()
+        analysis.update(meter.result() if meter else dict.fromkeys(('loudness_lufs', 'true_peak_dbtp', 'replay_gain_db')))
+        timings['loudness'] += time.perf_counter() - started
+
+    if analysis['duration'] is None:
+        analysis['duration'] = samples / sr
+    analysis['timings'] = timings
+    logger.info(
+        "Analyzed %s: %.1fs (%s)", path, analysis['duration'],
+        ', '.join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items()),
+    )
+    return analysis
+
+
+# Batch analysis of the catalog (manage.py analyze_songs)
+
+ANALYSIS_FIELDS = (
+    'duration', 'bpm', 'sample_rate', 'channels', 'bitrate', 'has_features',
+    'loudness_lufs', 'true_peak_dbtp', 'replay_gain_db',
+)
+
+# What a song lacks when a stage has not run on it yet
+MISSING = {
+    'tempo': Q(bpm__isnull=True) | Q(sample_rate__isnull=True),
+    'features': Q(has_features=False),
+    'waveform': Q(waveform__isnull=True),
+    'fingerprint': Q(fingerprint__isnull=True),
+    'loudness': Q(loudness_lufs__isnull=True),
+}
+
+
+def songs_missing_analysis(stages=ANALYSIS_STAGES):
+    from .models import Song
+
+    condition = Q()
+    for stage in stages:
+        condition |= MISSING[stage]
+    return Song.objects.filter(condition)
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def local_media_path(url):
+    """Files written by LocalStorage are read in place instead of downloaded."""
+    media_url = settings.MEDIA_URL
+    if url.startswith(media_url):
+        path = os.path.join(settings.MEDIA_ROOT, url[len(media_url):])
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _analyze_file(song_id, path, sr, block_seconds, stages):
+    # Runs in a pool process; errors come back as values so one bad file
+    # doesn't take the batch down
+    try:
+        return song_id, analyze_audio(path, sr, block_seconds, stages), None
+    except Exception as e:
+        return song_id, None, str(e)
+
+
+class BatchAnalyzer:
+    """
+    Analyses songs in `id` order across a process pool. A few threads
+    download audio ahead of the pool through a bounded queue and results
+    are written with one bulk UPDATE per `batch_size` songs. There is no
+    cursor to resume from: committed songs drop out of
+    songs_missing_analysis, so an interrupted run (of any set of stages)
+    resumes by selecting what is still missing, and failed songs are
+    tried again on the next run.
+    """
+
+    def __init__(self, workers=None, prefetch=4, batch_size=50, timeout=30.0, stdout=None,
+                 stages=ANALYSIS_STAGES):
+        self.stages = tuple(stages)
+        self.workers = workers or available_cores()
+        self.prefetch = prefetch
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.stdout = stdout
+        self.session = requests.Session()
+        self.batch = []
+        self.features = {}
+        self.waveforms = {}
+        self.fingerprints = {}
+        self.analyzed = self.failed = 0
+
+    def report(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def fetch(self, song, directory):
+        """Returns (path, is_temporary)."""
+        from .assets import stream_to_file
+
+        url = song.audio_url or (song.audio_file.url if song.audio_file else '')
+        if not url:
+            raise ValueError("song has no audio")
+        path = local_media_path(url)
+        if path:
+            return path, False
+        fd, path = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(urlparse(url).path)[1])
+        with os.fdopen(fd, 'wb') as target:
+            stream_to_file(self.session, url, target, timeout=self.timeout)
+        return path, True
+
+    def record_failure(self, song, error):
+        logger.warning("Analysis of song %s failed: %s", song.id, error)
+        self.failed += 1
+
+    def commit(self):
+        from .features import feature_store
+        from .models import Song
+        from .fingerprint import save_fingerprints
+        from .waveform import save_waveforms
+
+        if not self.batch:
+            return
+        # Vectors go in first: if the UPDATE then fails the songs are
+        # simply analysed again and their newer rows win
+        vectors = [(song.id, self.features.pop(song.id)) for song in self.batch if song.id in self.features]
+        if vectors:
+            feature_store.append(*zip(*vectors))
+        with transaction.atomic():
+            Song.objects.bulk_update(self.batch, ANALYSIS_FIELDS)
+            save_waveforms({song.id: self.waveforms.pop(song.id, None) for song in self.batch})
+            save_fingerprints({song.id: self.fingerprints.pop(song.id, None) for song in self.batch})
+        self.analyzed += len(self.batch)
+        self.batch = []
+
+    def run(self, songs, limit=None):
+        songs = songs.order_by('id').only('id', 'audio_url', 'audio_file', *ANALYSIS_FIELDS)
+        if limit:
+            songs = songs[:limit]
+
+        started = time.perf_counter()
+        directory = tempfile.mkdtemp(prefix='analyze-')
+        pending = iter(songs.iterator(chunk_size=500))
+        downloads = deque()  # (song, future) in id order, at most `prefetch` deep
+        running = {}  # analysis future -> (song, path, is_temporary)
+        exhausted = False
+
+        with ThreadPoolExecutor(self.prefetch) as fetcher, ProcessPoolExecutor(self.workers) as pool:
+            try:
+                while True:
+                    while not exhausted and len(downloads) < self.prefetch:
+                        song = next(pending, None)
+                        if song is None:
+                            exhausted = True
+                            break
+                        downloads.append((song, fetcher.submit(self.fetch, song, directory)))
+
+                    # Keep every worker busy with a little slack, but no more
+                    while downloads and len(running) < self.workers * 2:
+                        song, download = downloads.popleft()
+                        try:
+                            path, temporary = download.result()
+                        except Exception as e:
+                            self.record_failure(song, e)
+                            continue
+                        future = pool.submit(
+                            _analyze_file, song.id, path, analysis_sample_rate(), analysis_block_seconds(), self.stages
+                        )
+                        running[future] = (song, path, temporary)
+
+                    if not running:
+                        if exhausted and not downloads:
+                            break
+                        continue
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        song, path, temporary = running.pop(future)
+                        if temporary:
+                            os.remove(path)
+                        _, analysis, error = future.result()
+                        if error:
+                            self.record_failure(song, error)
+                        else:
+                            if analysis.get('features') is not None:
+                                self.features[song.id] = analysis['features']
+                            self.waveforms[song.id] = analysis.get('waveform')
+                            self.fingerprints[song.id] = analysis.get('fingerprint')
+                            song.apply_analysis(analysis)
+                            self.batch.append(song)
+
+                    if len(self.batch) >= self.batch_size:
+                        self.commit()
+                        elapsed = time.perf_counter() - started
+                        self.report(
+                            f"{self.analyzed} analyzed, {self.failed} failed "
+                            f"({(self.analyzed + self.failed) / elapsed:.2f} tracks/s)"
+                        )
+                self.commit()
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'analyzed': self.analyzed,
+            'failed': self.failed,
+            'seconds': elapsed,
+            'tracks_per_second': (self.analyzed + self.failed) / elapsed if elapsed else 0.0,
+        }
@@ -1,16 +1,188 @@
-import requests
-
-def fetch_jamendo_tracks(genre='pop', limit=10):
-    url = "https://api.jamendo.com/v3.0/tracks/"
-    params = {
-        'client_id': '684b7cdc',  # Register at https://devportal.jamendo.com/
-        'format': 'json',
-        'limit': limit,
-        'tags': genre,
-        'include': 'musicinfo',
-        'audiodlformat': 'mp32',
-        'order': 'popularity_total'
-    }
-    response = requests.get(url, params=params)
-    print(response.text)
-    return response.json()
\ No newline at end of file
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+JAMENDO_TRACKS_URL = "https://api.jamendo.com/v3.0/tracks/"
+DEFAULT_ORDER = 'popularity_total'
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'jamendo')
+
+
+def jamendo_setting(name, default):
+    return getattr(settings, f'MUSIC_JAMENDO_{name}', default)
+
+
+class JamendoClient:
+    """
+    Jamendo tracks API over one pooled session (keep-alive, timeouts,
+    retries with backoff). Responses are cached per (genre, limit, order)
+    for `ttl` seconds; for `stale_ttl` seconds after that the cached copy is
+    still returned while one background thread refreshes it, so callers
+    only wait on Jamendo when nothing usable is cached. If `record_dir` is
+    set every response is also written there, as fixtures for
+    FixtureJamendoClient. Cache hits, misses and errors are logged every
+    `stats_interval` seconds.
+    """
+
+    def __init__(self, client_id=None, timeout=None, retries=None, ttl=None, stale_ttl=None, record_dir=None,
+                 base_url=JAMENDO_TRACKS_URL, stats_interval=None):
+        from .transfers import build_session
+
+        self.base_url = base_url
+        self.client_id = client_id or jamendo_setting('CLIENT_ID', '684b7cdc')  # https://devportal.jamendo.com/
+        self.timeout = timeout or jamendo_setting('TIMEOUT', (5.0, 15.0))
+        self.ttl = jamendo_setting('CACHE_TTL', 300) if ttl is None else ttl
+        self.stale_ttl = jamendo_setting('STALE_TTL', 3600) if stale_ttl is None else stale_ttl
+        self.record_dir = record_dir or jamendo_setting('RECORD_DIR', None)
+        self.session = build_session(4, jamendo_setting('RETRIES', 3) if retries is None else retries)
+        self.lock = threading.Lock()
+        self.cache = {}  # key -> (fetched_at, data)
+        self.refreshing = set()
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'errors': 0}
+        self.stats_interval = jamendo_setting('STATS_INTERVAL', 300) if stats_interval is None else stats_interval
+        self.stats_logged = time.monotonic()
+
+    def fetch(self, genre, limit, order, offset=0):
+        """One uncached API call; the crawler (music.crawl) pages through a genre with these."""
+        params = {
+            'client_id': self.client_id,
+            'format': 'json',
+            'limit': limit,
+            'offset': offset,
+            'tags': genre,
+            'include': 'musicinfo',
+            'audiodlformat': 'mp32',
+            'order': order,
+        }
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        headers = data.get('headers') or {}
+        if headers.get('status') == 'failed':
+            raise ValueError(f"Jamendo error {headers.get('code')}: {headers.get('error_message')}")
+        if self.record_dir and not offset:
+            self.record(genre, order, data)
+        return data
+
+    def record(self, genre, order, data):
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(self.record_dir, fixture_name(genre, order))
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(f'{path}.tmp', path)
+
+    def tracks(self, genre='pop', limit=10, order=DEFAULT_ORDER):
+        key = (genre, limit, order)
+        with self.lock:
+            cached = self.cache.get(key)
+            age = time.monotonic() - cached[0] if cached else None
+            if cached and age < self.ttl:
+                self._count('hits')
+                return cached[1]
+            if cached and age < self.ttl + self.stale_ttl:
+                self._count('stale')
+                if key not in self.refreshing:
+                    self.refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key,), daemon=True).start()
+                return cached[1]
+            self._count('misses')
+
+        try:
+            data = self.fetch(*key)
+        except Exception:
+            with self.lock:
+                self._count('errors')
+            if cached:  # expired, but better than nothing
+                logger.warning("Jamendo request for %s failed, serving a stale response", key, exc_info=True)
+                return cached[1]
+            raise
+        with self.lock:
+            self.cache[key] = (time.monotonic(), data)
+        return data
+
+    def _refresh(self, key):
+        try:
+            data = self.fetch(*key)
+            with self.lock:
+                self.cache[key] = (time.monotonic(), data)
+        except Exception:
+            with self.lock:
+                self._count('errors')
+            logger.warning("Background refresh of Jamendo %s failed", key, exc_info=True)
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _count(self, name):
+        # called with self.lock held
+        self.stats[name] += 1
+        now = time.monotonic()
+        if now - self.stats_logged >= self.stats_interval:
+            self.stats_logged = now
+            logger.info("Jamendo client: %(hits)d hits, %(stale)d stale, %(misses)d misses, %(errors)d errors", self.stats)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+
+def fixture_name(genre, order=DEFAULT_ORDER):
+    return f"{genre.lower().replace('/', '_')}-{order}.json"
+
+
+class FixtureJamendoClient:
+    """
+    Offline stand-in that answers from recorded responses (see
+    JamendoClient.record_dir): `<genre>-<order>.json` in `directory`, cut to
+    `limit` results from `offset`. When `order` wasn't recorded, any other
+    recording of the genre stands in, in its own order. Genres without a
+    recording return no results.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or jamendo_setting('FIXTURE_DIR', FIXTURE_DIR)
+
+    def fixture_path(self, genre, order):
+        path = os.path.join(self.directory, fixture_name(genre, order))
+        if os.path.exists(path):
+            return path
+        stem = fixture_name(genre, '').removesuffix('.json')  # '<genre>-'; orders have no '-' of their own
+        try:
+            recorded = sorted(
+                name for name in os.listdir(self.directory)
+                if name.startswith(stem) and name.endswith('.json') and '-' not in name[len(stem):]
+            )
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.directory, recorded[0]) if recorded else None
+
+    def fetch(self, genre, limit, order, offset=0):
+        path = self.fixture_path(genre, order)
+        if path is None:
+            return {'headers': {'status': 'success', 'results_count': 0}, 'results': []}
+        with open(path) as f:
+            data = json.load(f)
+        results = data.get('results', [])[offset:offset + limit]
+        return dict(data, headers=dict(data.get('headers', {}), results_count=len(results)), results=results)
+
+    def tracks(self, genre='pop', limit=10, order=DEFAULT_ORDER):
+        return self.fetch(genre, limit, order)
+
+    def clear(self):
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_jamendo_client():
+    return import_string(jamendo_setting('CLIENT', 'music.api.JamendoClient'))()
+
+
+def fetch_jamendo_tracks(genre='pop', limit=10, order=DEFAULT_ORDER):
+    return get_jamendo_client().tracks(genre=genre, limit=limit, order=order)
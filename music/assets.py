@@ -0,0 +1,109 @@
+import hashlib
+import time
+
+from .models import Artist, Album, Song
+
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def sha256_file(path, block_size=HASH_BLOCK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class HashingWriter:
+    """File wrapper that hashes everything written through it."""
+
+    def __init__(self, target):
+        self.target = target
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.target.write(data)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+class TransferError(Exception):
+    pass
+
+
+class TransferTooLarge(TransferError):
+    pass
+
+
+def stream_to_file(session, url, target, max_bytes=None, timeout=None, deadline=None, block_size=HASH_BLOCK_SIZE):
+    """
+    Copy `url` into the open file `target` block by block, hashing as it
+    goes, so memory stays at one block whatever the size of the file.
+    `timeout` is requests' (connect, read) timeout; `deadline` bounds the
+    whole transfer in seconds. Files over `max_bytes` are refused from their
+    Content-Length when they send one, and cut off once they pass it when
+    they don't. A body shorter than its Content-Length is an error rather
+    than a truncated file. Returns (size, sha256).
+    """
+    started = time.monotonic()
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        length = response.headers.get('Content-Length')
+        length = int(length) if length and length.isdigit() and 'Content-Encoding' not in response.headers else None
+        if max_bytes and length and length > max_bytes:
+            raise TransferTooLarge(f"{url} is {length} bytes, over the {max_bytes} byte limit")
+        writer = HashingWriter(target)
+        for block in response.iter_content(block_size):
+            writer.write(block)
+            if max_bytes and writer.size > max_bytes:
+                raise TransferTooLarge(f"{url} is over the {max_bytes} byte limit")
+            if deadline and time.monotonic() - started > deadline:
+                raise TransferError(f"{url} took longer than {deadline}s")
+    if length is not None and writer.size != length:
+        raise TransferError(f"{url} ended after {writer.size} of {length} bytes")
+    return writer.size, writer.hexdigest()
+
+
+# Song fields that describe where an audio file is stored, copied verbatim
+# when an upload turns out to be a file we already have.
+STORED_AUDIO_FIELDS = ('audio_file', 'audio_url', 'downloadable_link', 'duration', 'bitrate')
+
+
+def find_stored_audio(sha256):
+    """Storage fields of an existing Song with the same audio bytes, or None."""
+    if not sha256:
+        return None
+    song = (
+        Song.objects.filter(audio_sha256=sha256)
+        .exclude(audio_url='', audio_file__isnull=True)
+        .only(*STORED_AUDIO_FIELDS)
+        .first()
+    )
+    if song is None:
+        return None
+    return {field: getattr(song, field) for field in STORED_AUDIO_FIELDS if getattr(song, field)}
+
+
+def find_stored_image(sha256):
+    """Stored value (Cloudinary resource) of an existing image with the same bytes, or None."""
+    if not sha256:
+        return None
+    for model, field, hash_field in (
+        (Artist, 'image', 'image_sha256'),
+        (Album, 'cover_image', 'cover_sha256'),
+        (Song, 'art', 'art_sha256'),
+    ):
+        stored = (
+            model.objects.filter(**{hash_field: sha256})
+            .exclude(**{field: ''})
+            .exclude(**{f'{field}__isnull': True})
+            .values_list(field, flat=True)
+            .first()
+        )
+        if stored:
+            return stored
+    return None
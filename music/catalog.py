@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from django.db import transaction
+
+from .models import Album, Artist, Song, SongHLS
+from .search import get_search_backend
+from .suggest import suggestion_index
+from .transfers import queue_transfers, transfer_for
+
+SOURCE = 'jamendo'
+
+
+def track_genre(track):
+    tags = track.get('musicinfo', {}).get('tags', {})
+    genres = tags.get('genres') if isinstance(tags, dict) else None
+    return genres[0] if genres else 'Pop'
+
+
+def normalize_track(track):
+    """The fields we keep from one Jamendo API result."""
+    return {
+        'external_id': str(track['id']),
+        'title': track['name'],
+        'artist_name': track['artist_name'],
+        'artist_country': track.get('artist_country', ''),
+        'artist_image': track.get('image'),
+        'album_title': track.get('album_name') or None,
+        'album_image': track.get('album_image'),
+        'release_date': track.get('releasedate') or '2020-01-01',
+        'genre': track_genre(track),
+        'duration': timedelta(seconds=track['duration']),
+        'audio_url': track['audio'],
+        'audio_download': track.get('audiodownload'),
+        'image': track.get('image'),
+    }
+
+
+def ingest_tracks(tracks):
+    """
+    Shared catalog rows (user=None; users reach them through LibraryEntry)
+    for a page of Jamendo API results, reusing the ones that already exist;
+    returns the songs in `tracks` order. The page is normalized in memory,
+    existing rows are found with one query per model and the rest inserted
+    with bulk_create, all in one transaction, so the cost is a handful of
+    queries per page rather than several per track. The crawler and the
+    discover prefetcher ingest concurrently: the catalog unique constraints
+    drop whichever insert loses, and the rows that won are read back.
+    bulk_create sends no post_save, so the new rows are indexed for search
+    here. Only metadata is written: artwork and audio are queued for
+    `manage.py run_transfer_worker`, and new songs for `manage.py
+    transcode_songs`.
+    """
+    rows = [normalize_track(track) for track in tracks]
+    if not rows:
+        return []
+    created, transfers = [], []
+
+    with transaction.atomic():
+        artists = {}
+        for artist in Artist.objects.filter(user=None, name__in={row['artist_name'] for row in rows}):
+            artists[artist.name] = artist
+        new, new_rows = {}, {}
+        for row in rows:
+            if row['artist_name'] not in artists and row['artist_name'] not in new:
+                new[row['artist_name']] = Artist(name=row['artist_name'], user=None, country=row['artist_country'])
+                new_rows[row['artist_name']] = row
+        if new:
+            Artist.objects.bulk_create(new.values(), ignore_conflicts=True)
+            # artist_catalog_unique kept a concurrent ingest's row if it got there first
+            for artist in Artist.objects.filter(user=None, name__in=new):
+                artists[artist.name] = artist
+                if artist.pk == new[artist.name].pk:
+                    created.append(artist)
+                    transfers.append(transfer_for(artist, 'image', new_rows[artist.name]['artist_image']))
+
+        albums = {}
+        existing = Album.objects.filter(
+            user=None,
+            artist__in=[artists[row['artist_name']] for row in rows if row['album_title']],
+            title__in={row['album_title'] for row in rows if row['album_title']},
+        )
+        for album in existing:
+            albums[album.artist_id, album.title] = album
+        new, new_rows = {}, {}
+        for row in rows:
+            key = (artists[row['artist_name']].pk, row['album_title'])
+            if row['album_title'] and key not in albums and key not in new:
+                new[key] = Album(
+                    title=row['album_title'], artist=artists[row['artist_name']], user=None,
+                    release_date=row['release_date'], genre=row['genre'],
+                )
+                new_rows[key] = row
+        if new:
+            Album.objects.bulk_create(new.values(), ignore_conflicts=True)
+            existing = Album.objects.filter(
+                user=None, artist__in={artist_id for artist_id, _ in new}, title__in={title for _, title in new},
+            )
+            for album in existing:
+                key = (album.artist_id, album.title)
+                if key not in new:
+                    continue
+                albums[key] = album
+                if album.pk == new[key].pk:
+                    created.append(album)
+                    transfers.append(transfer_for(album, 'cover_image', new_rows[key]['album_image']))
+
+        songs, new_rows = {}, {}
+        for song in Song.objects.filter(user=None, source=SOURCE, external_id__in={row['external_id'] for row in rows}):
+            songs[song.external_id] = song
+        new = {}
+        for row in rows:
+            if row['external_id'] in songs or row['external_id'] in new:
+                continue
+            artist = artists[row['artist_name']]
+            new_rows[row['external_id']] = row
+            new[row['external_id']] = Song(
+                external_id=row['external_id'],
+                user=None,
+                source=SOURCE,
+                title=row['title'],
+                artist=artist,
+                album=albums.get((artist.pk, row['album_title'])),
+                downloadable_link=row['audio_download'] or row['audio_url'] or '',
+                duration=row['duration'],
+                audio_url=row['audio_url'],
+                genre=row['genre'],
+                release_date=row['release_date'],
+            )
+        Song.objects.bulk_create(new.values(), ignore_conflicts=True)
+        if new:
+            # A concurrent ingest (prefetcher and crawler) may have inserted some of
+            # these first; song_catalog_unique kept its rows, so use those
+            for song in Song.objects.filter(user=None, source=SOURCE, external_id__in=new):
+                if song.pk != new[song.external_id].pk:
+                    del new[song.external_id]
+                    songs[song.external_id] = song
+        for external_id, song in new.items():
+            row = new_rows[external_id]
+            transfers.append(transfer_for(song, 'audio_file', row['audio_download'], row['audio_url']))
+            transfers.append(transfer_for(song, 'art', row['image']))
+        created += new.values()
+        songs.update(new)
+
+        queue_transfers(transfers)
+        SongHLS.objects.bulk_create([SongHLS(song=song) for song in new.values()], ignore_conflicts=True)
+        get_search_backend().index_many(created)
+
+    for instance in created:
+        suggestion_index.index_instance(instance)
+    return [songs[row['external_id']] for row in rows]
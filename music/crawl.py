@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import transaction
+
+from .api import get_jamendo_client
+from .catalog import ingest_tracks
+from .models import CrawlCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+def crawl_genres():
+    from .discover import discover_genres
+
+    return tuple(genre.lower() for genre in getattr(settings, 'MUSIC_CRAWL_GENRES', None) or discover_genres())
+
+
+def crawl_concurrency():
+    return getattr(settings, 'MUSIC_CRAWL_CONCURRENCY', 4)
+
+
+def crawl_rate():
+    """Jamendo requests per second, across all crawl threads."""
+    return getattr(settings, 'MUSIC_CRAWL_RATE', 4.0)
+
+
+def crawl_page_size():
+    return getattr(settings, 'MUSIC_CRAWL_PAGE_SIZE', 200)  # Jamendo's maximum
+
+
+def crawl_batch_size():
+    return getattr(settings, 'MUSIC_CRAWL_BATCH_SIZE', 1000)
+
+
+def crawl_order():
+    # a stable order, so pages don't shift under the crawl the way popularity does
+    return getattr(settings, 'MUSIC_CRAWL_ORDER', 'id')
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average and bursts of up to
+    `capacity`; `acquire` blocks (outside the lock) until a token is free.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+class GenreCrawl:
+    """Paging state of one genre: pages are fetched out of order but only ingested, and checkpointed, in order."""
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.next_offset = checkpoint.offset  # next page to request
+        self.ingest_offset = checkpoint.offset  # next page to hand to the writer
+        self.end = None  # offset past the last page, once a short page has been seen
+        self.failed = False
+        self.pages = {}  # offset -> results, fetched but not yet ingestible
+        self.saved = (checkpoint.offset, checkpoint.finished)
+
+    @property
+    def exhausted(self):
+        return self.failed or (self.end is not None and self.next_offset >= self.end)
+
+
+class Crawler:
+    """
+    Walks Jamendo's catalog for `genres` a page at a time. Pages are
+    fetched by a bounded thread pool, no faster than `rate` requests per
+    second between them. They go into a buffer that is written in batches
+    with ingest_tracks. Each batch commits together with the genres'
+    CrawlCheckpoint, so an interrupted crawl picks up where its last batch
+    ended. As elsewhere, only the calling thread touches the database.
+    """
+
+    def __init__(self, genres=None, page_size=None, concurrency=None, rate=None, batch_size=None, limit=None,
+                 restart=False, client=None, stdout=None):
+        self.genres = list(genres or crawl_genres())
+        self.page_size = page_size or crawl_page_size()
+        self.concurrency = concurrency or crawl_concurrency()
+        self.bucket = TokenBucket(rate or crawl_rate())
+        self.batch_size = batch_size or crawl_batch_size()
+        self.limit = limit
+        self.restart = restart
+        self.client = client or get_jamendo_client()
+        self.stdout = stdout
+        self.order = crawl_order()
+        self.requested = self.ingested = self.failed_pages = 0
+
+    def load(self):
+        crawls = {}
+        for genre in self.genres:
+            checkpoint, _ = CrawlCheckpoint.objects.get_or_create(genre=genre)
+            if self.restart:
+                checkpoint.offset, checkpoint.finished = 0, False
+                checkpoint.save()
+            if not checkpoint.finished:
+                crawls[genre] = GenreCrawl(checkpoint)
+        return crawls
+
+    def fetch(self, genre, offset):
+        # Runs in a pool thread: HTTP only
+        self.bucket.acquire()
+        return self.client.fetch(genre, self.page_size, self.order, offset).get('results', [])
+
+    def next_page(self, crawls):
+        """The least advanced genre's next page, so genres progress together."""
+        if self.limit is not None and self.requested * self.page_size >= self.limit:
+            return None
+        open_crawls = [crawl for crawl in crawls.values() if not crawl.exhausted]
+        if not open_crawls:
+            return None
+        crawl = min(open_crawls, key=lambda crawl: crawl.next_offset)
+        offset = crawl.next_offset
+        crawl.next_offset += self.page_size
+        self.requested += 1
+        return crawl, offset
+
+    def collect(self, crawl, offset, results, buffer):
+        """File a fetched page; move whatever is now contiguous from the checkpoint into the write buffer."""
+        if crawl.checkpoint.finished:  # a page past the end, requested before the end was known
+            return
+        crawl.pages[offset] = results
+        if len(results) < self.page_size:
+            crawl.end = offset + self.page_size if crawl.end is None else min(crawl.end, offset + self.page_size)
+        while crawl.ingest_offset in crawl.pages:
+            page = crawl.pages.pop(crawl.ingest_offset)
+            buffer.extend(page)
+            if len(page) < self.page_size:
+                crawl.ingest_offset += len(page)
+                crawl.checkpoint.finished = True
+                crawl.pages.clear()
+                break
+            crawl.ingest_offset += self.page_size
+
+    def flush(self, crawls, buffer, started):
+        with transaction.atomic():
+            if buffer:
+                ingest_tracks(buffer)
+            for crawl in crawls.values():
+                if (crawl.ingest_offset, crawl.checkpoint.finished) != crawl.saved:
+                    crawl.checkpoint.offset = crawl.ingest_offset
+                    crawl.checkpoint.save()
+                    crawl.saved = (crawl.checkpoint.offset, crawl.checkpoint.finished)
+        self.ingested += len(buffer)
+        buffer.clear()
+        if self.stdout:
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{self.ingested} tracks, {self.ingested / elapsed if elapsed else 0:.1f} tracks/s")
+
+    def run(self):
+        """Returns (tracks ingested, seconds taken)."""
+        started = time.monotonic()
+        crawls = self.load()
+        buffer = []
+        running = {}  # future -> (GenreCrawl, offset)
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            while True:
+                while len(running) < self.concurrency:
+                    page = self.next_page(crawls)
+                    if page is None:
+                        break
+                    running[pool.submit(self.fetch, page[0].checkpoint.genre, page[1])] = page
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    crawl, offset = running.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # Stop this genre for the run; its checkpoint stays before the gap
+                        logger.warning("Crawling %s at offset %s failed: %s", crawl.checkpoint.genre, offset, e)
+                        crawl.failed = True
+                        self.failed_pages += 1
+                        continue
+                    if not crawl.failed:
+                        self.collect(crawl, offset, results, buffer)
+                if len(buffer) >= self.batch_size:
+                    self.flush(crawls, buffer, started)
+        self.flush(crawls, buffer, started)
+        return self.ingested, time.monotonic() - started
@@ -0,0 +1,143 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .api import fetch_jamendo_tracks
+from .catalog import ingest_tracks
+from .models import DiscoverPool, DiscoverPoolTrack, Song
+
+logger = logging.getLogger(__name__)
+
+
+def discover_genres():
+    """Genres kept warm whether or not anyone has asked for them yet."""
+    return tuple(genre.lower() for genre in getattr(settings, 'MUSIC_DISCOVER_GENRES', ('pop', 'rock')))
+
+
+def discover_pool_size():
+    return getattr(settings, 'MUSIC_DISCOVER_POOL_SIZE', 100)
+
+
+def discover_max_age():
+    """How old a pool may get before it is refreshed."""
+    return timedelta(seconds=getattr(settings, 'MUSIC_DISCOVER_MAX_AGE', 6 * 3600))
+
+
+def discover_retry_after():
+    """How long to wait after a failed refresh before trying that genre again."""
+    return timedelta(seconds=getattr(settings, 'MUSIC_DISCOVER_RETRY_AFTER', 600))
+
+
+def discover_requested_ttl():
+    """How long a genre outside MUSIC_DISCOVER_GENRES stays warm after it was last asked for."""
+    return timedelta(seconds=getattr(settings, 'MUSIC_DISCOVER_REQUESTED_TTL', 7 * 24 * 3600))
+
+
+def discover_request_interval():
+    """How often each process records demand for a genre; requests in between write nothing."""
+    return getattr(settings, 'MUSIC_DISCOVER_REQUEST_INTERVAL', 300)
+
+
+# genre -> time.monotonic() when this process last recorded a request for it
+last_noted = {}
+
+
+def pool_songs(genre):
+    """A genre's pooled songs, most popular first; a plain query, no API call."""
+    return Song.objects.filter(discover_tracks__pool_id=genre).order_by('discover_tracks__position')
+
+
+def note_request(genre):
+    """
+    Record demand for `genre`, so the prefetcher keeps it warm even if it
+    isn't configured. Only configured genres and ones that already have a
+    pool (from `prefetch_discover --genre`, say) are recorded, so arbitrary
+    strings can't create pools that spend API quota, and each process writes
+    at most once per MUSIC_DISCOVER_REQUEST_INTERVAL for a genre.
+    """
+    now = time.monotonic()
+    noted = last_noted.get(genre)
+    if noted is not None and now - noted < discover_request_interval():
+        return
+    if not DiscoverPool.objects.filter(genre=genre).update(requested_at=timezone.now()):
+        if genre not in discover_genres():
+            return
+        DiscoverPool.objects.get_or_create(genre=genre, defaults={'requested_at': timezone.now()})
+    last_noted[genre] = now
+
+
+def genres_due(now=None):
+    """
+    Genres whose pool needs a refresh, most urgent first: configured or
+    recently requested genres that were never fetched or are older than
+    MUSIC_DISCOVER_MAX_AGE, skipping any that failed within
+    MUSIC_DISCOVER_RETRY_AFTER.
+    """
+    now = now or timezone.now()
+    configured = discover_genres()
+    pools = {pool.genre: pool for pool in DiscoverPool.objects.filter(
+        Q(genre__in=configured) | Q(requested_at__gte=now - discover_requested_ttl())
+    )}
+    due = []
+    for genre in sorted(set(configured) | set(pools)):
+        pool = pools.get(genre)
+        if pool and pool.error and pool.attempted_at and now - pool.attempted_at < discover_retry_after():
+            continue
+        if pool is None or pool.fetched_at is None:
+            due.append((0, now, genre))
+        elif now - pool.fetched_at >= discover_max_age():
+            due.append((1, pool.fetched_at, genre))
+    return [genre for _, _, genre in sorted(due)]
+
+
+def prefetch_genre(genre, size=None):
+    """Refresh one genre's pool from Jamendo; returns the number of tracks in it."""
+    pool, _ = DiscoverPool.objects.get_or_create(genre=genre)
+    pool.attempted_at = timezone.now()
+    try:
+        data = fetch_jamendo_tracks(genre=genre, limit=size or discover_pool_size())
+        songs = ingest_tracks(data.get('results', []))
+    except Exception as e:
+        logger.warning("Prefetching discover genre %s failed: %s", genre, e)
+        pool.error = str(e) or type(e).__name__
+        pool.save(update_fields=['attempted_at', 'error'])
+        raise
+
+    unique = list({song.id: song for song in songs}.values())
+    with transaction.atomic():
+        # Readers see either the old pool or the new one, never half of each
+        pool.tracks.all().delete()
+        DiscoverPoolTrack.objects.bulk_create(
+            [DiscoverPoolTrack(pool=pool, song=song, position=position) for position, song in enumerate(unique)]
+        )
+        pool.track_count, pool.fetched_at, pool.error = len(unique), timezone.now(), ''
+        pool.save(update_fields=['track_count', 'fetched_at', 'attempted_at', 'error'])
+    return len(unique)
+
+
+def run_prefetcher(genres=None, once=True, poll_interval=60.0, stdout=None):
+    """
+    Refresh every genre that is due (or just `genres`, unconditionally),
+    then with `once=False` keep polling for more. Returns (refreshed, failed).
+    """
+    refreshed = failed = 0
+    while True:
+        for genre in genres or genres_due():
+            try:
+                count = prefetch_genre(genre)
+            except Exception as e:
+                failed += 1
+                if stdout:
+                    stdout.write(f"{genre}: failed ({e})")
+                continue
+            refreshed += 1
+            if stdout:
+                stdout.write(f"{genre}: {count} tracks")
+        if once or genres:
+            return refreshed, failed
+        time.sleep(poll_interval)
@@ -0,0 +1,256 @@
+import fcntl
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .analysis import HOP_LENGTH, N_FFT
+
+logger = logging.getLogger(__name__)
+
+# Per-frame features, summarised as mean and std over the whole track
+FEATURE_GROUPS = (('mfcc', 19), ('chroma', 12), ('spectral', 6))
+FRAME_FEATURES = sum(size for _, size in FEATURE_GROUPS)
+FEATURE_DIM = 2 * FRAME_FEATURES
+
+
+def feature_store_dir():
+    return getattr(settings, 'MUSIC_FEATURE_STORE_DIR', os.path.join(settings.MEDIA_ROOT, 'features'))
+
+
+def coarse_min_rows():
+    return getattr(settings, 'MUSIC_FEATURE_COARSE_MIN_ROWS', 20000)
+
+
+def coarse_nprobe():
+    return getattr(settings, 'MUSIC_FEATURE_NPROBE', 8)
+
+
+class FeatureAccumulator:
+    """
+    Running sums of the per-frame features over streamed blocks, so the
+    track-level vector needs no more memory than one block.
+    """
+
+    def __init__(self, sr):
+        self.sr = sr
+        self.total = np.zeros(FRAME_FEATURES)
+        self.squares = np.zeros(FRAME_FEATURES)
+        self.frames = 0
+
+    def update(self, block, magnitude, mel_db):
+        import librosa
+
+        nyquist = self.sr / 2
+        rows = [
+            librosa.feature.mfcc(S=mel_db, n_mfcc=20)[1:],  # drop c0, it's just loudness
+            librosa.feature.chroma_stft(S=magnitude ** 2, sr=self.sr),
+            librosa.feature.spectral_centroid(S=magnitude, sr=self.sr) / nyquist,
+            librosa.feature.spectral_bandwidth(S=magnitude, sr=self.sr) / nyquist,
+            librosa.feature.spectral_rolloff(S=magnitude, sr=self.sr) / nyquist,
+            librosa.feature.spectral_flatness(S=magnitude),
+            librosa.feature.zero_crossing_rate(block, frame_length=N_FFT, hop_length=HOP_LENGTH),
+            librosa.feature.rms(S=magnitude, frame_length=N_FFT),
+        ]
+        frames = min(row.shape[1] for row in rows)
+        stacked = np.vstack([row[:, :frames] for row in rows]).astype(np.float64)
+        self.total += stacked.sum(axis=1)
+        self.squares += (stacked ** 2).sum(axis=1)
+        self.frames += frames
+
+    def vector(self):
+        """
+        Unit-length float32 vector. Each group's mean and std are normalised
+        separately first so no single group (or unit) dominates the cosine.
+        """
+        if not self.frames:
+            return None
+        mean = self.total / self.frames
+        std = np.sqrt(np.maximum(self.squares / self.frames - mean ** 2, 0))
+        parts = []
+        start = 0
+        for _, size in FEATURE_GROUPS:
+            for stat in (mean, std):
+                part = stat[start:start + size]
+                norm = np.linalg.norm(part)
+                parts.append(part / norm if norm else part)
+            start += size
+        vector = np.concatenate(parts)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
+
+
+class FeatureStore:
+    """
+    Append-only float32 matrix of song feature vectors on disk:
+
+        vectors.f32   rows x FEATURE_DIM, memory-mapped for queries
+        ids.bin       16-byte song UUID per row
+        centroids.npy / clusters.i32   optional coarse index (see build_coarse_index)
+
+    Vectors are unit length, so cosine similarity is a dot product against
+    the mapped matrix. Re-analysing a song appends a new row; the latest
+    row for an id wins. Readers pick up appended rows incrementally.
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.loaded_from = None
+        self.rows = 0
+        self.ids = []
+        self.index = {}
+        self.matrix = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        self.centroids = None
+        self.clusters = np.zeros(0, dtype=np.int32)
+        self.coarse_stamp = None
+
+    @property
+    def directory(self):
+        return self._directory or feature_store_dir()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _size(self, name):
+        try:
+            return os.path.getsize(self.path(name))
+        except FileNotFoundError:
+            return 0
+
+    def _rows_on_disk(self):
+        # ids are written last, so a torn append never exposes a row without its vector
+        return min(self._size('ids.bin') // 16, self._size('vectors.f32') // (4 * FEATURE_DIM))
+
+    def _exclusive(self):
+        os.makedirs(self.directory, exist_ok=True)
+        handle = open(self.path('.lock'), 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def append(self, song_ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, FEATURE_DIM)
+        if not len(vectors):
+            return
+        with self._exclusive():
+            rows = self._rows_on_disk()
+            # Drop anything past the last complete row left by an interrupted append
+            for name, width in (('vectors.f32', 4 * FEATURE_DIM), ('ids.bin', 16)):
+                if os.path.exists(self.path(name)):
+                    os.truncate(self.path(name), rows * width)
+            with open(self.path('vectors.f32'), 'ab') as f:
+                f.write(vectors.tobytes())
+            if os.path.exists(self.path('centroids.npy')):
+                centroids = np.load(self.path('centroids.npy'))
+                clusters = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+                os.truncate(self.path('clusters.i32'), min(self._size('clusters.i32'), rows * 4))
+                with open(self.path('clusters.i32'), 'ab') as f:
+                    f.write(clusters.tobytes())
+            with open(self.path('ids.bin'), 'ab') as f:
+                f.write(b''.join(uuid.UUID(str(song_id)).bytes for song_id in song_ids))
+
+    def _coarse_stamp(self):
+        try:
+            return os.path.getmtime(self.path('clusters.i32'))
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        with self.lock:
+            if self.loaded_from != self.directory:
+                self.reset()
+                self.loaded_from = self.directory
+            rows = self._rows_on_disk()
+            stamp = self._coarse_stamp()
+            if rows == self.rows and stamp == self.coarse_stamp:
+                return
+            if rows < self.rows:
+                self.reset()  # store was rebuilt
+                self.loaded_from = self.directory
+            if rows > self.rows:
+                with open(self.path('ids.bin'), 'rb') as f:
+                    f.seek(self.rows * 16)
+                    data = f.read((rows - self.rows) * 16)
+                for offset in range(0, len(data), 16):
+                    song_id = uuid.UUID(bytes=data[offset:offset + 16])
+                    self.index[song_id] = len(self.ids)
+                    self.ids.append(song_id)
+                self.matrix = np.memmap(self.path('vectors.f32'), dtype=np.float32, mode='r', shape=(rows, FEATURE_DIM))
+                self.rows = rows
+            self.coarse_stamp = stamp
+            count = min(rows, self._size('clusters.i32') // 4)
+            if stamp is not None and count:
+                self.centroids = np.load(self.path('centroids.npy'))
+                self.clusters = np.memmap(self.path('clusters.i32'), dtype=np.int32, mode='r', shape=(count,))
+
+    def __contains__(self, song_id):
+        self.refresh()
+        return song_id in self.index
+
+    def similar(self, song_id, candidates, limit=10):
+        """
+        [(song_id, cosine similarity)] for the `limit` candidates closest to
+        `song_id`, best first. Returns None if the song has no vector yet.
+        """
+        self.refresh()
+        row = self.index.get(song_id)
+        if row is None:
+            return None
+        query = np.array(self.matrix[row])
+        rows = np.fromiter(
+            (self.index[c] for c in candidates if c != song_id and c in self.index), dtype=np.int64
+        )
+        if self.centroids is not None and len(rows) >= coarse_min_rows():
+            # Only score rows in the clusters nearest the query (plus any not yet assigned)
+            probe = np.argsort(self.centroids @ query)[-coarse_nprobe():]
+            assigned = rows < len(self.clusters)
+            keep = ~assigned
+            keep[assigned] = np.isin(self.clusters[rows[assigned]], probe)
+            rows = rows[keep]
+        if not len(rows):
+            return []
+        rows.sort()  # sequential reads from the map
+        scores = self.matrix[rows] @ query
+        limit = min(limit, len(rows))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def build_coarse_index(self, clusters=256, iterations=10, sample_size=100000, seed=0):
+        """Spherical k-means over the matrix; later appends are assigned to the nearest centroid."""
+        self.refresh()
+        if self.rows < clusters:
+            raise ValueError(f"Need at least {clusters} vectors to build {clusters} clusters")
+        rng = np.random.default_rng(seed)
+        sample = np.array(self.matrix[np.sort(rng.choice(self.rows, min(sample_size, self.rows), replace=False))])
+        centroids = sample[rng.choice(len(sample), clusters, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(clusters):
+                members = sample[assignment == cluster]
+                if len(members):
+                    centre = members.sum(axis=0)
+                    centroids[cluster] = centre / (np.linalg.norm(centre) or 1)
+
+        with self._exclusive():
+            rows = self._rows_on_disk()
+            matrix = np.memmap(self.path('vectors.f32'), dtype=np.float32, mode='r', shape=(rows, FEATURE_DIM))
+            with open(self.path('clusters.i32.tmp'), 'wb') as f:
+                for start in range(0, rows, 50000):
+                    f.write(np.argmax(matrix[start:start + 50000] @ centroids.T, axis=1).astype(np.int32).tobytes())
+            with open(self.path('centroids.npy.tmp'), 'wb') as f:
+                np.save(f, centroids.astype(np.float32))
+            os.replace(self.path('centroids.npy.tmp'), self.path('centroids.npy'))
+            os.replace(self.path('clusters.i32.tmp'), self.path('clusters.i32'))
+        with self.lock:
+            self.reset()
+        return rows
+
+
+feature_store = FeatureStore()
@@ -0,0 +1,190 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Spectral-peak ("constellation") fingerprints over the analysis STFT
+# (22.05 kHz, 2048-point frames, 512 hop: ~43 frames and ~10.8 Hz per bin).
+FREQ_BINS = 512  # up to ~5.5 kHz, the part of the spectrum that survives re-encoding
+PEAK_FREQ_RADIUS = 10
+PEAK_TIME_RADIUS = 5
+PEAK_MIN_DB = 10  # above the block's median level
+PEAKS_PER_FRAME = 0.5  # ~20 peaks/s after keeping the loudest
+FANOUT = 5
+MAX_DELTA_FRAMES = 63  # 6 bits
+
+HASH_DTYPE = np.dtype([('hash', '<u4'), ('offset', '<u4')])
+
+
+def min_matches():
+    return getattr(settings, 'MUSIC_FINGERPRINT_MIN_MATCHES', 20)
+
+
+def min_ratio():
+    return getattr(settings, 'MUSIC_FINGERPRINT_MIN_RATIO', 0.1)
+
+
+def _running_max(values, radius, axis):
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (radius, radius)
+    padded = np.pad(values, pad, constant_values=-np.inf)
+    return sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+
+def spectral_peaks(magnitude):
+    """(frame, bin) of local maxima in the log spectrogram, loudest first capped, sorted by time."""
+    spectrum = 20 * np.log10(magnitude[:FREQ_BINS] + 1e-10)
+    # a 2-D max filter is separable: frequency first, then time
+    local_max = _running_max(_running_max(spectrum, PEAK_FREQ_RADIUS, 0), PEAK_TIME_RADIUS, 1)
+    bins, frames = np.nonzero((spectrum == local_max) & (spectrum > np.median(spectrum) + PEAK_MIN_DB))
+    keep = int(spectrum.shape[1] * PEAKS_PER_FRAME)
+    if len(frames) > keep:
+        loudest = np.argsort(spectrum[bins, frames])[-keep:]
+        bins, frames = bins[loudest], frames[loudest]
+    order = np.lexsort((bins, frames))
+    return frames[order], bins[order]
+
+
+class FingerprintAccumulator:
+    """
+    Pairs each peak with the next FANOUT peaks into (f1, f2, dt) hashes
+    anchored at f1's frame. The last few peaks of a block are carried so
+    pairs can span block boundaries.
+    """
+
+    def __init__(self):
+        self.frame_offset = 0
+        self.carry_frames = np.zeros(0, dtype=np.int64)
+        self.carry_bins = np.zeros(0, dtype=np.int64)
+        self.chunks = []
+
+    def update(self, magnitude):
+        frames, bins = spectral_peaks(magnitude)
+        frames = np.concatenate([self.carry_frames, frames + self.frame_offset])
+        bins = np.concatenate([self.carry_bins, bins])
+        carried = len(self.carry_frames)
+        for step in range(1, FANOUT + 1):
+            anchors = np.arange(max(0, carried - step), len(frames) - step)
+            if not len(anchors):
+                continue
+            targets = anchors + step
+            delta = frames[targets] - frames[anchors]
+            valid = (delta >= 1) & (delta <= MAX_DELTA_FRAMES)
+            anchors, targets, delta = anchors[valid], targets[valid], delta[valid]
+            chunk = np.empty(len(anchors), dtype=HASH_DTYPE)
+            chunk['hash'] = (bins[anchors] << 15) | (bins[targets] << 6) | delta
+            chunk['offset'] = frames[anchors]
+            self.chunks.append(chunk)
+        self.carry_frames, self.carry_bins = frames[-FANOUT:], bins[-FANOUT:]
+        self.frame_offset += magnitude.shape[1]
+
+    def hashes(self):
+        if not self.chunks:
+            return np.zeros(0, dtype=HASH_DTYPE)
+        return np.unique(np.concatenate(self.chunks))
+
+
+def save_fingerprints(fingerprints):
+    """Replace the index rows of {song_id: hashes} in one transaction."""
+    from .models import FingerprintHash, SongFingerprint
+
+    fingerprints = {song_id: hashes for song_id, hashes in fingerprints.items() if hashes is not None}
+    if not fingerprints:
+        return
+    with transaction.atomic():
+        FingerprintHash.objects.filter(song_id__in=list(fingerprints)).delete()
+        FingerprintHash.objects.bulk_create(
+            (
+                FingerprintHash(hash=int(row['hash']), song_id=song_id, offset=int(row['offset']))
+                for song_id, hashes in fingerprints.items()
+                for row in hashes
+            ),
+            batch_size=5000,
+        )
+        SongFingerprint.objects.bulk_create(
+            [SongFingerprint(song_id=song_id, hash_count=len(hashes)) for song_id, hashes in fingerprints.items()],
+            update_conflicts=True, unique_fields=['song'], update_fields=['hash_count', 'updated_at'],
+        )
+
+
+def stored_hashes(song_id):
+    from .models import FingerprintHash
+
+    rows = FingerprintHash.objects.filter(song_id=song_id).values_list('hash', 'offset')
+    return np.array(list(rows), dtype=HASH_DTYPE)
+
+
+def find_matches(hashes, exclude=None, songs=None, minimum=None, ratio=None, chunk_size=500):
+    """
+    [(song_id, score)] best first, where score is the number of hashes that
+    line up at one consistent time offset. A match needs `minimum` aligned
+    hashes and at least `ratio` of the shorter fingerprint. Each hash is a
+    single indexed lookup, so the cost follows the query, not the size of
+    the catalog. `songs` optionally restricts the candidates (a Song queryset).
+    """
+    from .models import FingerprintHash, SongFingerprint
+
+    minimum = minimum or min_matches()
+    ratio = min_ratio() if ratio is None else ratio
+    offsets = defaultdict(list)
+    for row in hashes:
+        offsets[int(row['hash'])].append(int(row['offset']))
+
+    aligned = Counter()
+    keys = list(offsets)
+    for start in range(0, len(keys), chunk_size):
+        rows = FingerprintHash.objects.filter(hash__in=keys[start:start + chunk_size])
+        if exclude is not None:
+            rows = rows.exclude(song_id=exclude)
+        if songs is not None:
+            rows = rows.filter(song__in=songs)
+        for value, song_id, offset in rows.values_list('hash', 'song_id', 'offset').iterator():
+            for query_offset in offsets[value]:
+                aligned[song_id, offset - query_offset] += 1
+
+    best = {}
+    for (song_id, _), count in aligned.items():
+        if count >= minimum:
+            best[song_id] = max(best.get(song_id, 0), count)
+    counts = dict(SongFingerprint.objects.filter(song_id__in=list(best)).values_list('song_id', 'hash_count'))
+    return sorted(
+        (
+            (song_id, score) for song_id, score in best.items()
+            if score >= ratio * min(len(hashes), counts.get(song_id, len(hashes)))
+        ),
+        key=lambda match: -match[1],
+    )
+
+
+def find_duplicates_of(song, **kwargs):
+    """Songs that are (near-)duplicate recordings of `song`."""
+    return find_matches(stored_hashes(song.id), exclude=song.id, **kwargs)
+
+
+def duplicate_clusters(songs, minimum=None, ratio=None):
+    """
+    Groups of fingerprinted songs that match each other, as lists of
+    (song_id, best score within the group), largest groups first.
+    """
+    parent = {}
+
+    def root(song_id):
+        parent.setdefault(song_id, song_id)
+        while parent[song_id] != song_id:
+            parent[song_id] = parent[parent[song_id]]
+            song_id = parent[song_id]
+        return song_id
+
+    scores = defaultdict(int)
+    for song_id in list(songs.filter(fingerprint__isnull=False).values_list('id', flat=True)):
+        for match, score in find_matches(stored_hashes(song_id), exclude=song_id, songs=songs, minimum=minimum, ratio=ratio):
+            parent[root(match)] = root(song_id)
+            scores[song_id] = max(scores[song_id], score)
+            scores[match] = max(scores[match], score)
+
+    clusters = defaultdict(list)
+    for song_id in scores:
+        clusters[root(song_id)].append((song_id, scores[song_id]))
+    return sorted(clusters.values(), key=len, reverse=True)
@@ -0,0 +1,209 @@
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+
+from .assets import HashingWriter, find_stored_audio, find_stored_image, sha256_file
+from .models import IngestJob, SongHLS
+from .storage import get_audio_storage
+
+logger = logging.getLogger(__name__)
+
+# Fields copied from the upload request into the job payload
+SONG_FIELDS = ('title', 'genre', 'release_date', 'is_explicit', 'lyrics', 'track_number', 'album', 'artist')
+
+
+def staging_dir():
+    return getattr(settings, 'MUSIC_INGEST_STAGING_DIR', os.path.join(settings.MEDIA_ROOT, 'ingest'))
+
+
+def max_attempts():
+    return getattr(settings, 'MUSIC_INGEST_MAX_ATTEMPTS', 3)
+
+
+def job_timeout():
+    return timedelta(seconds=getattr(settings, 'MUSIC_INGEST_JOB_TIMEOUT', 600))
+
+
+def job_payload(data):
+    return {field: data[field] for field in SONG_FIELDS if data.get(field) not in (None, '')}
+
+
+def stage_upload(uploaded_file, directory):
+    """
+    Stream an uploaded file to the staging directory chunk by chunk,
+    hashing it on the way. Returns (path, sha256).
+    """
+    name = os.path.basename(uploaded_file.name or 'upload')
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as destination:
+        writer = HashingWriter(destination)
+        for chunk in uploaded_file.chunks():
+            writer.write(chunk)
+    return path, writer.hexdigest()
+
+
+def enqueue_song_upload(user, payload, audio_file, art_file=None):
+    """
+    Stage the request's files on local disk and queue a job for the worker.
+    Returns immediately; the storage upload happens in `process_job`.
+    """
+    job_id = uuid.uuid4()
+    directory = os.path.join(staging_dir(), str(job_id))
+    os.makedirs(directory, exist_ok=True)
+    audio_path, audio_sha256 = stage_upload(audio_file, directory)
+    art_path = art_sha256 = ''
+    if art_file:
+        os.makedirs(os.path.join(directory, 'art'), exist_ok=True)
+        art_path, art_sha256 = stage_upload(art_file, os.path.join(directory, 'art'))
+    return IngestJob.objects.create(
+        id=job_id,
+        user=user,
+        payload=job_payload(payload),
+        audio_path=audio_path,
+        audio_sha256=audio_sha256,
+        art_path=art_path,
+        art_sha256=art_sha256,
+    )
+
+
+def enqueue_staged_file(user, payload, path, filename, sha256=None):
+    """Queue a job for a file already on local disk (e.g. a finished chunked upload)."""
+    job_id = uuid.uuid4()
+    directory = os.path.join(staging_dir(), str(job_id))
+    os.makedirs(directory, exist_ok=True)
+    audio_path = os.path.join(directory, os.path.basename(filename) or 'upload')
+    shutil.move(path, audio_path)
+    return IngestJob.objects.create(
+        id=job_id,
+        user=user,
+        payload=job_payload(payload),
+        audio_path=audio_path,
+        audio_sha256=sha256 or sha256_file(audio_path),
+    )
+
+
+def set_progress(job, progress, **fields):
+    job.progress = progress
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=['progress', 'updated_at', *fields])
+
+
+def create_song(user, payload, stored):
+    """
+    Validate the request fields and create the Song with the fields the
+    storage backend returned. Shared by every ingestion path.
+    """
+    from .serializers import SongSerializer
+
+    serializer = SongSerializer(data=payload)
+    serializer.is_valid(raise_exception=True)
+
+    stored = dict(stored)
+    if stored.get('duration') is not None and not isinstance(stored['duration'], timedelta):
+        stored['duration'] = timedelta(seconds=float(stored['duration']))
+    return serializer.save(user=user, **{key: value for key, value in stored.items() if value is not None})
+
+
+def cleanup(job):
+    directory = os.path.dirname(job.audio_path)
+    if directory and os.path.commonpath([os.path.abspath(directory), os.path.abspath(staging_dir())]) == os.path.abspath(staging_dir()):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def process_job(job, storage=None):
+    storage = storage or get_audio_storage()
+    try:
+        set_progress(job, 10)
+        # Identical bytes already in storage: reuse them, skip the upload
+        stored = find_stored_audio(job.audio_sha256)
+        if stored is None:
+            stored = storage.upload_audio(job.audio_path, os.path.basename(job.audio_path))
+        stored['audio_sha256'] = job.audio_sha256
+        set_progress(job, 70)
+
+        if job.art_path:
+            art = find_stored_image(job.art_sha256) or storage.upload_image(job.art_path, 'song_art')
+            if art:
+                stored.update(art=art, art_sha256=job.art_sha256)
+        set_progress(job, 90)
+
+        with transaction.atomic():
+            song = create_song(job.user, job.payload, stored)
+            SongHLS.objects.create(song=song)  # queued for `manage.py transcode_songs`
+            set_progress(job, 100, status=IngestJob.SUCCEEDED, song=song, error='', finished_at=timezone.now())
+        cleanup(job)
+        return True
+    except Exception as e:
+        logger.error(f"Ingest job {job.id} failed (attempt {job.attempts}): {e}")
+        # Bad song data won't get better on a retry
+        final = isinstance(e, ValidationError) or job.attempts >= max_attempts()
+        set_progress(
+            job,
+            job.progress,
+            status=IngestJob.FAILED if final else IngestJob.PENDING,
+            error=str(e.detail) if isinstance(e, ValidationError) else str(e),
+            finished_at=timezone.now() if final else None,
+        )
+        if final:
+            cleanup(job)
+        return False
+
+
+def requeue_stale_jobs():
+    """Put jobs whose worker died mid-run back on the queue."""
+    cutoff = timezone.now() - job_timeout()
+    return IngestJob.objects.filter(status=IngestJob.RUNNING, started_at__lt=cutoff).update(
+        status=IngestJob.PENDING, worker=''
+    )
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically move the oldest pending job to running. The conditional
+    UPDATE makes this safe with several workers and no row locks, which
+    SQLite does not have.
+    """
+    while True:
+        candidate = IngestJob.objects.filter(status=IngestJob.PENDING).order_by('created_at').values_list('id', flat=True).first()
+        if candidate is None:
+            return None
+        claimed = IngestJob.objects.filter(id=candidate, status=IngestJob.PENDING).update(
+            status=IngestJob.RUNNING,
+            worker=worker_id,
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return IngestJob.objects.select_related('user').get(id=candidate)
+        # another worker won the race; try the next one
+
+
+def run_worker(poll_interval=2.0, once=False, max_jobs=None, stdout=None):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        requeue_stale_jobs()
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        ok = process_job(job)
+        processed += 1
+        if stdout:
+            stdout.write(f"{job.id}: {'done' if ok else 'failed'}")
+    return processed
@@ -0,0 +1,141 @@
+import numpy as np
+from django.conf import settings
+
+# EBU R128 / ITU-R BS.1770-4 integrated loudness and true peak, streamed.
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the absolute-gated loudness
+HISTOGRAM_STEP = 0.01  # LU per bin
+HISTOGRAM_BINS = int((10.0 - ABSOLUTE_GATE) / HISTOGRAM_STEP)
+
+
+def loudness_target():
+    return getattr(settings, 'MUSIC_LOUDNESS_TARGET', -14.0)
+
+
+def true_peak_ceiling():
+    return getattr(settings, 'MUSIC_TRUE_PEAK_CEILING', -1.0)
+
+
+def k_weighting(rate):
+    """The two BS.1770 pre-filter biquads as second-order sections, for any sample rate."""
+    # High shelf (head effects)
+    f0, gain, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # High pass (RLB weighting)
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
+
+
+def channel_weights(channels):
+    if channels == 6:  # L R C LFE Ls Rs: no LFE, surrounds +1.5 dB
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+class LoudnessMeter:
+    """
+    K-weighted mean square over 100 ms steps, gated over 400 ms blocks.
+    Block loudness goes into a fixed 0.01 LU histogram (with the exact
+    energy per bin), so gating needs no per-block history and memory is
+    constant. True peak is the maximum of the signal oversampled 4x.
+    """
+
+    def __init__(self, rate, channels):
+        import soxr
+
+        self.rate = rate
+        self.weights = channel_weights(channels)
+        self.sos = k_weighting(rate)
+        self.zi = np.zeros((len(self.sos), 2, channels))
+        self.step = int(round(rate * 0.1))
+        self.partial_sum = 0.0
+        self.partial_size = 0
+        self.recent = []  # last three 100 ms energies
+        self.counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.energy = np.zeros(HISTOGRAM_BINS)
+        self.oversampler = soxr.ResampleStream(rate, rate * 4, channels, dtype='float32') if rate < 96000 else None
+        self.peak = 0.0
+
+    def _add_steps(self, energies):
+        for energy in energies:
+            self.recent.append(energy)
+            if len(self.recent) == 4:
+                block = sum(self.recent) / 4
+                self.recent.pop(0)
+                if block <= 0:
+                    continue
+                loudness = -0.691 + 10 * np.log10(block)
+                if loudness > ABSOLUTE_GATE:
+                    index = min(int((loudness - ABSOLUTE_GATE) / HISTOGRAM_STEP), HISTOGRAM_BINS - 1)
+                    self.counts[index] += 1
+                    self.energy[index] += block
+
+    def update(self, block):
+        from scipy.signal import sosfilt
+
+        if not len(block):
+            return
+        self._peak(block, last=False)
+        filtered, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        squares = (filtered ** 2) @ self.weights
+
+        if self.partial_size:
+            take = min(self.step - self.partial_size, len(squares))
+            self.partial_sum += squares[:take].sum()
+            self.partial_size += take
+            squares = squares[take:]
+            if self.partial_size == self.step:
+                self._add_steps([self.partial_sum / self.step])
+                self.partial_sum, self.partial_size = 0.0, 0
+        full = len(squares) // self.step
+        if full:
+            self._add_steps(squares[:full * self.step].reshape(full, self.step).mean(axis=1))
+        tail = squares[full * self.step:]
+        if len(tail):
+            self.partial_sum, self.partial_size = float(tail.sum()), len(tail)
+
+    def _peak(self, block, last):
+        if self.oversampler is not None:
+            block = self.oversampler.resample_chunk(block, last=last)
+        if len(block):
+            self.peak = max(self.peak, float(np.abs(block).max()))
+
+    def integrated(self):
+        if not self.counts.any():
+            return None
+        mean = self.energy.sum() / self.counts.sum()
+        gate = -0.691 + 10 * np.log10(mean) + RELATIVE_GATE
+        start = max(0, int(np.ceil((gate - ABSOLUTE_GATE) / HISTOGRAM_STEP)))
+        counts, energy = self.counts[start:].sum(), self.energy[start:].sum()
+        if not counts:
+            return None
+        return float(-0.691 + 10 * np.log10(energy / counts))
+
+    def result(self):
+        if self.oversampler is not None:
+            self._peak(np.zeros((0, len(self.weights)), dtype=np.float32), last=True)
+        loudness = self.integrated()
+        true_peak = float(20 * np.log10(self.peak)) if self.peak > 0 else None
+        return {
+            'loudness_lufs': loudness,
+            'true_peak_dbtp': true_peak,
+            'replay_gain_db': suggested_gain(loudness, true_peak),
+        }
+
+
+def suggested_gain(loudness, true_peak, target=None, ceiling=None):
+    """Gain (dB) that brings the track to the target loudness without pushing its true peak over the ceiling."""
+    if loudness is None:
+        return None
+    gain = (loudness_target() if target is None else target) - loudness
+    if true_peak is not None:
+        gain = min(gain, (true_peak_ceiling() if ceiling is None else ceiling) - true_peak)
+    return round(gain, 2)
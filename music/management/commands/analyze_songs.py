@@ -0,0 +1,51 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from music.analysis import ANALYSIS_STAGES, BatchAnalyzer, available_cores, songs_missing_analysis
+
+class Command(BaseCommand):
+    help = 'Analyse songs that are missing bpm, loudness, features, etc., in parallel; rerun to resume or retry failures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stage', action='append', choices=ANALYSIS_STAGES, dest='stages',
+            help='Only run (and only select songs missing) this stage; repeatable. Default: all stages',
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Analyse at most this many songs')
+        parser.add_argument('--since', help='Only songs added on or after this date (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--workers', type=int, default=None, help='Analysis processes (default: available cores)')
+        parser.add_argument('--prefetch', type=int, default=4, help='Audio files downloaded ahead of the workers')
+        parser.add_argument('--batch-size', type=int, default=50, help='Songs per bulk UPDATE')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Download timeout in seconds')
+
+    def handle(self, *args, **options):
+        stages = options['stages'] or ANALYSIS_STAGES
+        songs = songs_missing_analysis(stages)
+        if options['since']:
+            since = parse_datetime(options['since']) or parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
+            if not hasattr(since, 'hour'):
+                since = timezone.make_aware(datetime.combine(since, time.min))
+            elif timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            songs = songs.filter(date_added__gte=since)
+
+        workers = options['workers'] or available_cores()
+        self.stdout.write(f'Analysing with {workers} workers')
+        stats = BatchAnalyzer(
+            workers=workers,
+            prefetch=options['prefetch'],
+            batch_size=options['batch_size'],
+            timeout=options['timeout'],
+            stdout=self.stdout,
+            stages=stages,
+        ).run(songs, limit=options['limit'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Analysed {stats['analyzed']} songs, {stats['failed']} failed in {stats['seconds']:.1f}s "
+            f"({stats['tracks_per_second']:.2f} tracks/s)"
+        ))
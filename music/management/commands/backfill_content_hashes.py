@@ -0,0 +1,79 @@
+import hashlib
+
+import requests
+from django.core.management.base import BaseCommand
+
+from music.analysis import local_media_path
+from music.assets import HASH_BLOCK_SIZE, sha256_file
+from music.models import Artist, Album, Song
+
+# (model, hash field, function returning the asset URL for a row)
+TARGETS = {
+    'artist': [(Artist, 'image_sha256', lambda row: row.image and row.image.url)],
+    'album': [(Album, 'cover_sha256', lambda row: row.cover_image and row.cover_image.url)],
+    'song': [
+        (Song, 'audio_sha256', lambda row: (row.audio_file and row.audio_file.url) or row.audio_url),
+        (Song, 'art_sha256', lambda row: row.art and row.art.url),
+    ],
+}
+
+
+def hash_url(session, url, timeout):
+    """
+    Stream a file through SHA-256 without holding it in memory: read in
+    place if LocalStorage wrote it under MEDIA_ROOT, downloaded otherwise.
+    """
+    path = local_media_path(url)
+    if path:
+        return sha256_file(path, HASH_BLOCK_SIZE)
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        for block in response.iter_content(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Compute content hashes for stored artwork and audio so duplicate uploads can be reused'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(TARGETS), action='append',
+                            help='Only backfill this model (repeatable)')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many rows per field')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        session = requests.Session()
+        for name in options['model'] or sorted(TARGETS):
+            for model, hash_field, get_url in TARGETS[name]:
+                hashed, failed = self.backfill(session, model, hash_field, get_url, options)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{model.__name__}.{hash_field}: hashed {hashed}, failed {failed}'
+                ))
+
+    def backfill(self, session, model, hash_field, get_url, options):
+        rows = model.objects.filter(**{hash_field: ''}).order_by('pk')
+        if options['limit']:
+            rows = rows[:options['limit']]
+        hashed = failed = 0
+        batch = []
+        for row in rows.iterator(chunk_size=options['batch_size']):
+            url = get_url(row)
+            if not url:
+                continue
+            try:
+                setattr(row, hash_field, hash_url(session, url, options['timeout']))
+            except (requests.RequestException, OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f'{model.__name__} {row.pk}: {e}')
+                continue
+            batch.append(row)
+            hashed += 1
+            if len(batch) >= options['batch_size']:
+                model.objects.bulk_update(batch, [hash_field])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [hash_field])
+        return hashed, failed
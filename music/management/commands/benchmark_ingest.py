@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from music.catalog import ingest_tracks
+
+
+def synthetic_tracks(count, start=0):
+    """Jamendo-shaped results: ten tracks per album, five albums per artist."""
+    return [
+        {
+            'id': f'bench-{n}',
+            'name': f'Track {n}',
+            'artist_name': f'Bench Artist {n // 50}',
+            'album_name': f'Bench Album {n // 10}',
+            'releasedate': '2020-01-01',
+            'duration': 180,
+            'audio': f'https://example.invalid/{n}.mp3',
+            'audiodownload': f'https://example.invalid/{n}/download.mp3',
+            'image': f'https://example.invalid/{n}.jpg',
+            'album_image': f'https://example.invalid/album-{n // 10}.jpg',
+            'musicinfo': {'tags': {'genres': ['pop']}},
+        }
+        for n in range(start, start + count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Measure queries and wall time of bulk Jamendo ingestion per 1,000 tracks (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=200, help='Tracks per ingest_tracks call (a Jamendo page)')
+
+    def handle(self, *args, **options):
+        tracks = synthetic_tracks(options['tracks'])
+        pages = [tracks[i:i + options['page_size']] for i in range(0, len(tracks), options['page_size'])]
+        with transaction.atomic():
+            for label in ('new tracks', 'already ingested'):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for page in pages:
+                        ingest_tracks(page)
+                    elapsed = time.perf_counter() - started
+                per_thousand = 1000 / len(tracks)
+                self.stdout.write(
+                    f'{label}: {len(queries) * per_thousand:.0f} queries, '
+                    f'{elapsed * per_thousand:.3f}s per 1,000 tracks'
+                )
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS(f'Ingested {len(tracks)} tracks in {len(pages)} pages'))
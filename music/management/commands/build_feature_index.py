@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from music.features import feature_store
+
+class Command(BaseCommand):
+    help = 'Cluster the song feature store so /similar/ only scans nearby vectors on large catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clusters', type=int, default=256)
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--sample-size', type=int, default=100000, help='Vectors used to train the centroids')
+
+    def handle(self, *args, **options):
+        try:
+            rows = feature_store.build_coarse_index(
+                clusters=options['clusters'],
+                iterations=options['iterations'],
+                sample_size=options['sample_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {rows} vectors to {options['clusters']} clusters"
+        ))
@@ -1,54 +1,31 @@
 from django.core.management.base import BaseCommand
-from music.api import fetch_jamendo_tracks
-from music.models import Artist, Album, Song
-import requests
-from datetime import timedelta
+from music.crawl import Crawler
 
 class Command(BaseCommand):
-    help = 'Fetch songs from Jamendo API'
+    help = 'Crawl Jamendo genre by genre into the local catalog, resuming from the last checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--genre', action='append', dest='genres', help='Genre to crawl (repeatable; default: MUSIC_CRAWL_GENRES)')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after about this many tracks')
+        parser.add_argument('--page-size', type=int, default=None, help='Tracks per request (default: MUSIC_CRAWL_PAGE_SIZE)')
+        parser.add_argument('--concurrency', type=int, default=None, help='Requests in flight (default: MUSIC_CRAWL_CONCURRENCY)')
+        parser.add_argument('--rate', type=float, default=None, help='Requests per second (default: MUSIC_CRAWL_RATE)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Tracks per database write (default: MUSIC_CRAWL_BATCH_SIZE)')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoints and crawl from the start')
 
     def handle(self, *args, **options):
-        data = fetch_jamendo_tracks(genre='pop', limit=20)
-        
-        for track in data['results']:
-            # Get or create artist
-            artist, _ = Artist.objects.get_or_create(
-                name=track['artist_name'],
-                defaults={
-                    'bio': '',
-                    'country': track.get('artist_country', '')
-                }
-            )
-            
-            # Get or create album (if available)
-            album = None
-            if track.get('album_name'):
-                album, _ = Album.objects.get_or_create(
-                    title=track['album_name'],
-                    artist=artist,
-                    defaults={
-                        'release_date': track.get('releasedate', '2020-01-01'),
-                        'genre': track.get('musicinfo', {}).get('genre', 'Pop')
-                    }
-                )
-            
-            # Create song
-            duration = timedelta(seconds=track['duration'])
-            Song.objects.get_or_create(
-                external_id=track['id'],
-                source='jamendo',
-                defaults={
-                    'title': track['name'],
-                    'artist': artist,
-                    'album': album,
-                    'duration': duration,
-                    'audio_url': track['audio'],
-                    'genre': track.get('musicinfo', {}).get('genre', 'Pop'),
-                    'release_date': track.get('releasedate', '2020-01-01'),
-                    'bpm': track.get('musicinfo', {}).get('bpm'),
-                    'bitrate': track.get('audioinfo', {}).get('bitrate'),
-                    'sample_rate': track.get('audioinfo', {}).get('samplerate')
-                }
-            )
-        
-        self.stdout.write(self.style.SUCCESS(f'Successfully fetched {len(data["results"])} songs'))
\ No newline at end of file
+        crawler = Crawler(
+            genres=[genre.lower() for genre in options['genres'] or ()],
+            page_size=options['page_size'],
+            concurrency=options['concurrency'],
+            rate=options['rate'],
+            batch_size=options['batch_size'],
+            limit=options['limit'],
+            restart=options['restart'],
+            stdout=self.stdout,
+        )
+        ingested, seconds = crawler.run()
+        rate = ingested / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully fetched {ingested} songs in {seconds:.1f}s ({rate:.1f} tracks/s), {crawler.failed_pages} pages failed'
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from music.fingerprint import duplicate_clusters
+from music.models import Song, User
+
+class Command(BaseCommand):
+    help = 'Report clusters of songs that are the same recording, by acoustic fingerprint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only this user\'s library (email)')
+        parser.add_argument('--min-matches', type=int, default=None, help='Aligned hashes needed for a match')
+        parser.add_argument('--min-ratio', type=float, default=None, help='Share of the shorter fingerprint that must align')
+
+    def handle(self, *args, **options):
+        songs = Song.objects.all()
+        if options['user']:
+            try:
+                songs = songs.filter(user=User.objects.get(email=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}")
+
+        clusters = duplicate_clusters(songs, minimum=options['min_matches'], ratio=options['min_ratio'])
+        titles = dict(
+            Song.objects.filter(id__in=[song_id for cluster in clusters for song_id, _ in cluster])
+            .values_list('id', 'title')
+        )
+        for number, cluster in enumerate(clusters, 1):
+            self.stdout.write(f'Cluster {number} ({len(cluster)} songs)')
+            for song_id, score in sorted(cluster, key=lambda member: -member[1]):
+                self.stdout.write(f'  {song_id}  {titles.get(song_id, "?")}  (score {score})')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Found {len(clusters)} duplicate clusters covering {sum(len(c) for c in clusters)} songs'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from music.discover import run_prefetcher
+
+class Command(BaseCommand):
+    help = 'Keep the per-genre discover pools warm by refreshing stale genres from Jamendo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--genre', action='append', dest='genres', help='Refresh this genre now, fresh or not (repeatable)')
+        parser.add_argument('--loop', action='store_true', help='Keep running, refreshing genres as they go stale')
+        parser.add_argument('--poll-interval', type=float, default=60.0, help='Seconds between checks with --loop')
+
+    def handle(self, *args, **options):
+        genres = [genre.lower() for genre in options['genres'] or ()]
+        refreshed, failed = run_prefetcher(
+            genres=genres,
+            once=not options['loop'],
+            poll_interval=options['poll_interval'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} genres, {failed} failed'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from music.ingest import run_worker
+
+class Command(BaseCommand):
+    help = 'Process queued song uploads (IngestJob rows)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=None)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when idle')
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+            max_jobs=options['max_jobs'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from music.transfers import AssetTransferrer
+
+class Command(BaseCommand):
+    help = 'Copy queued remote artwork and audio (AssetTransfer rows) into storage and attach them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=None)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when idle')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent transfers (default: MUSIC_TRANSFER_WORKERS)')
+        parser.add_argument('--per-host', type=int, default=None, help='Concurrent requests per host (default: MUSIC_TRANSFER_PER_HOST)')
+
+    def handle(self, *args, **options):
+        succeeded, failed = AssetTransferrer(
+            workers=options['workers'],
+            per_host=options['per_host'],
+            stdout=self.stdout,
+        ).run(once=options['once'], max_jobs=options['max_jobs'], poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f'Transferred {succeeded} assets, {failed} failed'))
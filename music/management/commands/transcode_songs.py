@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from music.models import Song, SongHLS
+from music.transcode import enqueue, run_transcoder, transcode_workers
+
+class Command(BaseCommand):
+    help = 'Transcode queued songs into an HLS bitrate ladder, a few ffmpeg processes at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also queue every song that has no HLS renditions yet')
+        parser.add_argument('--retry-failed', action='store_true', help='Queue failed transcodes again')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent ffmpeg processes (default: MUSIC_TRANSCODE_WORKERS)')
+        parser.add_argument('--limit', type=int, default=None, help='Transcode at most this many songs')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to sleep when idle')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            self.stdout.write(f'Queued {enqueue(Song.objects.all())} songs')
+        if options['retry_failed']:
+            retried = SongHLS.objects.filter(status=SongHLS.FAILED).update(status=SongHLS.PENDING, error='')
+            self.stdout.write(f'Retrying {retried} failed transcodes')
+
+        workers = options['workers'] or transcode_workers()
+        self.stdout.write(f'Transcoding with {workers} workers')
+        ready, failed = run_transcoder(
+            workers=workers,
+            limit=options['limit'],
+            once=not options['loop'],
+            poll_interval=options['poll_interval'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Transcoded {ready} songs, {failed} failed'))
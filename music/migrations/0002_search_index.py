@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+FTS_TABLE = 'music_searchdocument_fts'
+
+CREATE_FTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, tags, lyrics,
+        content='music_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS music_searchdocument_ai AFTER INSERT ON music_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, tags, lyrics) VALUES (new.id, new.title, new.tags, new.lyrics);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS music_searchdocument_ad AFTER DELETE ON music_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, tags, lyrics) VALUES ('delete', old.id, old.title, old.tags, old.lyrics);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS music_searchdocument_au AFTER UPDATE ON music_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, tags, lyrics) VALUES ('delete', old.id, old.title, old.tags, old.lyrics);
+        INSERT INTO {FTS_TABLE}(rowid, title, tags, lyrics) VALUES (new.id, new.title, new.tags, new.lyrics);
+    END""",
+]
+
+DROP_FTS = [
+    'DROP TRIGGER IF EXISTS music_searchdocument_ai',
+    'DROP TRIGGER IF EXISTS music_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS music_searchdocument_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_fts_index(apps, schema_editor):
+    # Other databases fall back to music.search.DatabaseSearchBackend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_FTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS:
+        schema_editor.execute(statement)
+
+
+def populate_index(apps, schema_editor):
+    SearchDocument = apps.get_model('music', 'SearchDocument')
+    sources = (
+        ('artist', apps.get_model('music', 'Artist'), 'name', 'country', None),
+        ('album', apps.get_model('music', 'Album'), 'title', 'genre', None),
+        ('song', apps.get_model('music', 'Song'), 'title', 'genre', 'lyrics'),
+        ('playlist', apps.get_model('music', 'Playlist'), 'name', None, None),
+    )
+    for kind, model, title_field, tags_field, lyrics_field in sources:
+        SearchDocument.objects.bulk_create(
+            SearchDocument(
+                kind=kind,
+                object_id=instance.pk,
+                title=getattr(instance, title_field) or '',
+                tags=(getattr(instance, tags_field) or '') if tags_field else '',
+                lyrics=(getattr(instance, lyrics_field) or '') if lyrics_field else '',
+            )
+            for instance in model.objects.all().iterator()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('artist', 'Artist'), ('album', 'Album'), ('song', 'Song'), ('playlist', 'Playlist')], max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('title', models.CharField(max_length=200)),
+                ('tags', models.CharField(blank=True, max_length=200)),
+                ('lyrics', models.TextField(blank=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['user', '-release_date', '-id'], name='album_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['user', 'name', 'id'], name='artist_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='playlist_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['user', '-date_added', '-id'], name='song_user_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0005_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='image_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='art_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='audio_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='art_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='audio_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_content_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='has_features',
+            field=models.BooleanField(default=False),
+        ),
+    ]
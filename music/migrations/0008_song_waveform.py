@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0007_song_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongWaveform',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='waveform', serialize=False, to='music.song')),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_song_waveform'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongFingerprint',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='music.song')),
+                ('hash_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FingerprintHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.IntegerField()),
+                ('offset', models.PositiveIntegerField()),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint_hashes', to='music.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hash', 'song', 'offset'], name='fingerprint_hash_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='loudness_lufs',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='replay_gain_db',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='true_peak_dbtp',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
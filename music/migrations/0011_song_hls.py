@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_loudness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongHLS',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='hls', serialize=False, to='music.song')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('renditions', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='songhls_queue_idx')],
+            },
+        ),
+    ]
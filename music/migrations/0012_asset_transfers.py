@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:29
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0011_song_hls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetTransfer',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('model', models.CharField(choices=[('artist', 'Artist'), ('album', 'Album'), ('song', 'Song')], max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('field', models.CharField(max_length=50)),
+                ('urls', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='assettransfer_queue_idx')],
+            },
+        ),
+    ]
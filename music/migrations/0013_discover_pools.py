@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_asset_transfers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoverPool',
+            fields=[
+                ('genre', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('track_count', models.PositiveIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('attempted_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DiscoverPoolTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('pool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='music.discoverpool')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discover_tracks', to='music.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pool', 'position'], name='discoverpool_order_idx')],
+                'unique_together': {('pool', 'song')},
+            },
+        ),
+    ]
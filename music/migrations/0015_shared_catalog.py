@@ -0,0 +1,138 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:44
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_external_copies(apps, schema_editor):
+    """
+    Discover used to copy every external track, with its artist and album,
+    into each user's library. Keep one row per (source, external_id) as the
+    shared catalog song, link every user that had a copy to it, repoint
+    their playlists, and drop the other copies. The catalog song's artist
+    and album move to shared (user=None) rows, found by name and title as
+    music.catalog does, and the per-user copies left empty are dropped.
+    """
+    Artist = apps.get_model('music', 'Artist')
+    Album = apps.get_model('music', 'Album')
+    Song = apps.get_model('music', 'Song')
+    LibraryEntry = apps.get_model('music', 'LibraryEntry')
+    SearchDocument = apps.get_model('music', 'SearchDocument')
+    PlaylistSongs = apps.get_model('music', 'Playlist').songs.through
+
+    catalog_artists, catalog_albums = {}, {}
+    for artist in Artist.objects.filter(user=None).order_by('id'):
+        catalog_artists.setdefault(artist.name, artist.pk)
+    for album in Album.objects.filter(user=None).order_by('id'):
+        catalog_albums.setdefault((album.artist_id, album.title), album.pk)
+
+    def catalog_artist(artist_id):
+        artist = Artist.objects.get(pk=artist_id)
+        if artist.user_id is None:
+            return artist.pk
+        if artist.name not in catalog_artists:
+            shared = Artist.objects.create(
+                user=None, name=artist.name, country=artist.country, image=artist.image, image_sha256=artist.image_sha256,
+            )
+            SearchDocument.objects.update_or_create(
+                kind='artist', object_id=shared.pk, defaults={'title': shared.name, 'tags': shared.country},
+            )
+            catalog_artists[artist.name] = shared.pk
+        return catalog_artists[artist.name]
+
+    def catalog_album(album_id):
+        album = Album.objects.get(pk=album_id)
+        if album.user_id is None:
+            return album.pk
+        key = (catalog_artist(album.artist_id), album.title)
+        if key not in catalog_albums:
+            shared = Album.objects.create(
+                user=None, title=album.title, artist_id=key[0], release_date=album.release_date, genre=album.genre,
+                cover_image=album.cover_image, cover_sha256=album.cover_sha256,
+            )
+            SearchDocument.objects.update_or_create(
+                kind='album', object_id=shared.pk, defaults={'title': shared.title, 'tags': shared.genre},
+            )
+            catalog_albums[key] = shared.pk
+        return catalog_albums[key]
+
+    copies = defaultdict(list)
+    external = Song.objects.exclude(external_id='').exclude(source='').order_by('date_added')
+    for song in external.only('id', 'user_id', 'source', 'external_id', 'artist_id', 'album_id').iterator():
+        copies[song.source, song.external_id].append(song)
+
+    old_artists, old_albums = set(), set()
+    for songs in copies.values():
+        catalog = next((song for song in songs if song.user_id is None), songs[0])
+        old_artists.update(song.artist_id for song in songs if song.artist_id)
+        old_albums.update(song.album_id for song in songs if song.album_id)
+        Song.objects.filter(pk=catalog.pk).update(
+            user=None,
+            artist_id=catalog_artist(catalog.artist_id) if catalog.artist_id else None,
+            album_id=catalog_album(catalog.album_id) if catalog.album_id else None,
+        )
+        LibraryEntry.objects.bulk_create(
+            [LibraryEntry(user_id=user_id, song_id=catalog.pk) for user_id in {song.user_id for song in songs} - {None}],
+            ignore_conflicts=True,
+        )
+        others = [song.pk for song in songs if song.pk != catalog.pk]
+        if not others:
+            continue
+        for playlist_id in PlaylistSongs.objects.filter(song_id__in=others).values_list('playlist_id', flat=True):
+            PlaylistSongs.objects.get_or_create(playlist_id=playlist_id, song_id=catalog.pk)
+        Song.objects.filter(pk__in=others).delete()
+        SearchDocument.objects.filter(kind='song', object_id__in=others).delete()
+
+    # Per-user artists and albums that only held copies are dropped; ones
+    # still holding the user's own songs or albums stay
+    old_artists.update(Album.objects.filter(pk__in=old_albums).values_list('artist_id', flat=True))
+    empty_albums = list(
+        Album.objects.filter(pk__in=old_albums, user__isnull=False, songs__isnull=True).values_list('pk', flat=True)
+    )
+    Album.objects.filter(pk__in=empty_albums).delete()
+    SearchDocument.objects.filter(kind='album', object_id__in=empty_albums).delete()
+    empty_artists = list(
+        Artist.objects.filter(pk__in=old_artists, user__isnull=False, albums__isnull=True, songs__isnull=True)
+        .values_list('pk', flat=True)
+    )
+    Artist.objects.filter(pk__in=empty_artists).delete()
+    SearchDocument.objects.filter(kind='artist', object_id__in=empty_artists).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0014_crawl_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='libraryentry',
+            name='song',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='library_entries', to='music.song'),
+        ),
+        migrations.AddField(
+            model_name='libraryentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='library', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='libraryentry',
+            unique_together={('user', 'song')},
+        ),
+        migrations.RunPython(merge_external_copies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='song',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True), models.Q(('external_id', ''), _negated=True)), fields=('source', 'external_id'), name='song_catalog_unique'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def merge_catalog_duplicates(apps, schema_editor):
+    """
+    Concurrent ingests could each create the same catalog artist or album.
+    Keep the first of each (by id, as music.catalog picks them), move the
+    others' albums and songs onto it and drop them.
+    """
+    Artist = apps.get_model('music', 'Artist')
+    Album = apps.get_model('music', 'Album')
+    Song = apps.get_model('music', 'Song')
+    SearchDocument = apps.get_model('music', 'SearchDocument')
+
+    artists = defaultdict(list)
+    for pk, name in Artist.objects.filter(user=None).order_by('id').values_list('id', 'name').iterator():
+        artists[name].append(pk)
+    for keep, *others in artists.values():
+        if others:
+            Album.objects.filter(artist_id__in=others).update(artist_id=keep)
+            Song.objects.filter(artist_id__in=others).update(artist_id=keep)
+            Artist.objects.filter(pk__in=others).delete()
+            SearchDocument.objects.filter(kind='artist', object_id__in=others).delete()
+
+    albums = defaultdict(list)
+    for pk, artist_id, title in Album.objects.filter(user=None).order_by('id').values_list('id', 'artist_id', 'title').iterator():
+        albums[artist_id, title].append(pk)
+    for keep, *others in albums.values():
+        if others:
+            Song.objects.filter(album_id__in=others).update(album_id=keep)
+            Album.objects.filter(pk__in=others).delete()
+            SearchDocument.objects.filter(kind='album', object_id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_shared_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_catalog_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='album',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('artist', 'title'), name='album_catalog_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='artist',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('name',), name='artist_catalog_unique'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:17
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_owners(apps, schema_editor):
+    SearchDocument = apps.get_model('music', 'SearchDocument')
+    sources = {
+        'artist': apps.get_model('music', 'Artist').objects.all(),
+        'album': apps.get_model('music', 'Album').objects.all(),
+        'song': apps.get_model('music', 'Song').objects.all(),
+        # public playlists have no owner, so they match nothing here
+        'playlist': apps.get_model('music', 'Playlist').objects.filter(is_public=False),
+    }
+    for kind, objects in sources.items():
+        SearchDocument.objects.filter(kind=kind).update(
+            owner=Subquery(objects.filter(pk=OuterRef('object_id')).values('user_id')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0016_catalog_artist_album_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchdocument',
+            name='owner',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(populate_owners, migrations.RunPython.noop),
+    ]
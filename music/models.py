@@ -1,7 +1,5 @@
 from datetime import timedelta
 from django.db import models
-from pydub import AudioSegment
-import librosa
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 import uuid
@@ -55,6 +53,18 @@ class User(AbstractUser):
         self.username = self.username.lower()
         super().save(*args, **kwargs)
 
+class CreditQuerySet(models.QuerySet):
+    """Artists and albums, which users reach through their songs (see SongQuerySet)."""
+
+    def in_library(self, user):
+        """The user's own rows plus the shared ones behind catalog songs in their library."""
+        catalog = Song.objects.in_library(user).filter(user__isnull=True)
+        return self.filter(models.Q(user=user) | models.Q(songs__in=catalog)).distinct()
+
+    def available_to(self, user):
+        return self.filter(models.Q(user=user) | models.Q(user__isnull=True))
+
+
 class Artist(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, default=None, on_delete=models.CASCADE, null=True, blank=True)
@@ -63,6 +73,19 @@ class Artist(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     country = models.CharField(max_length=100, blank=True)
     image = CloudinaryField(default='', null=True, blank=True, folder='artist_art/')
+    image_sha256 = models.CharField(max_length=64, blank=True, db_index=True)  # content hash for dedup
+
+    objects = CreditQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination of a user's library (music.pagination)
+            models.Index(fields=['user', 'name', 'id'], name='artist_user_keyset_idx'),
+        ]
+        constraints = [
+            # one shared catalog artist per name, however many ingests race to create it
+            models.UniqueConstraint(fields=['name'], condition=models.Q(user__isnull=True), name='artist_catalog_unique'),
+        ]
     
     def __str__(self):
         return self.name
@@ -74,13 +97,39 @@ class Album(models.Model):
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='albums')
     release_date = models.DateField()
     cover_image = CloudinaryField(default='', null=True, blank=True, folder='cover_art/')
+    cover_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     genre = models.CharField(max_length=100)
+
+    objects = CreditQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-release_date', '-id'], name='album_user_keyset_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['artist', 'title'], condition=models.Q(user__isnull=True), name='album_catalog_unique',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.artist.name}"
 
+class SongQuerySet(models.QuerySet):
+    def in_library(self, user):
+        """The user's own songs plus the shared catalog songs they have added (LibraryEntry)."""
+        return self.filter(
+            models.Q(user=user) | models.Q(id__in=LibraryEntry.objects.filter(user=user).values('song_id'))
+        )
+
+    def available_to(self, user):
+        """What the user may play or add to a playlist: their own songs and the whole shared catalog."""
+        return self.filter(models.Q(user=user) | models.Q(user__isnull=True))
+
+
 class Song(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # None for the shared catalog of external tracks, which users link to with LibraryEntry
     user = models.ForeignKey(User, default=None, on_delete=models.CASCADE, null=True, blank=True)
     title = models.CharField(max_length=200)
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='songs', null=True, blank=True)
@@ -93,12 +142,15 @@ class Song(models.Model):
         blank=True
     )
     audio_url = models.URLField(blank=True)  # For streaming from external source
+    audio_sha256 = models.CharField(max_length=64, blank=True, db_index=True)  # content hash for dedup
     track_number = models.PositiveIntegerField(null=True, blank=True)
     art = CloudinaryField(resource_type='image', default='', null=True, blank=True, folder='song_art/')
+    art_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     # art = models.ImageField(upload_to='songs_art/', blank=True, null=True, default='')
     genre = models.CharField(max_length=100, blank=True)
     release_date = models.DateField(null=True, blank=True)
     bpm = models.PositiveIntegerField(null=True, blank=True)
+    has_features = models.BooleanField(default=False)  # vector is in the feature store (music.features)
     downloadable_link=models.URLField(default='')
     external_id = models.CharField(max_length=100, blank=True)  # ID from external API
     source = models.CharField(max_length=50, blank=True)  # 'jamendo', 'deezer', etc.
@@ -109,28 +161,190 @@ class Song(models.Model):
     bitrate = models.PositiveIntegerField(null=True, blank=True)
     sample_rate = models.PositiveIntegerField(null=True, blank=True)
     channels = models.PositiveSmallIntegerField(default=2)
+    loudness_lufs = models.FloatField(null=True, blank=True)  # EBU R128 integrated loudness
+    true_peak_dbtp = models.FloatField(null=True, blank=True)
+    replay_gain_db = models.FloatField(null=True, blank=True)  # gain to the playback target (music.loudness)
     date_added = models.DateTimeField(auto_now_add=True)
+
+    objects = SongQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date_added', '-id'], name='song_user_keyset_idx'),
+        ]
+        constraints = [
+            # one shared catalog row per external track
+            models.UniqueConstraint(
+                fields=['source', 'external_id'],
+                condition=models.Q(user__isnull=True) & ~models.Q(external_id=''),
+                name='song_catalog_unique',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.artist.name if self.artist else 'Unknown'}"
     
-    def extract_metadata(self):
-        if self.audio_file:
-            try:
-                audio = AudioSegment.from_file(self.audio_file.path)
-                self.duration = timedelta(milliseconds=len(audio))
-                # self.bitrate = audio.frame_rate
-                # self.channels = audio.channels
-                
-                # Advanced features with librosa
-                y, sr = librosa.load(self.audio_file.path)
-                self.bpm = librosa.beat.tempo(y=y, sr=sr)[0]
-                self.save()
-                return True
-            except Exception as e:
-                print(f"Error processing audio: {e}")
-                return False
-        return False
+    def extract_metadata(self, path=None):
+        """
+        Duration, tempo, loudness and the rest from a single streamed decode of the audio file
+        (see music.analysis). Returns the analysis, including per-stage
+        timings, or None if the file could not be analysed.
+        """
+        from .analysis import analyze_audio
+
+        path = path or (self.audio_file and getattr(self.audio_file, 'path', None))
+        if not path:
+            return None
+        try:
+            analysis = analyze_audio(path)
+        except Exception as e:
+            print(f"Error processing audio: {e}")
+            return None
+        if analysis.get('features') is not None:
+            from .features import feature_store
+            feature_store.append([self.id], [analysis['features']])
+        fields = self.apply_analysis(analysis)
+        self.save(update_fields=None if self._state.adding else fields)
+        if analysis.get('waveform'):
+            from .waveform import save_waveforms
+            save_waveforms({self.id: analysis['waveform']})
+        if analysis.get('fingerprint') is not None:
+            from .fingerprint import save_fingerprints
+            save_fingerprints({self.id: analysis['fingerprint']})
+        return analysis
+
+    def apply_analysis(self, analysis):
+        """Copy an `analyze_audio` result onto the song; returns the fields set."""
+        fields = ['duration']
+        self.duration = timedelta(seconds=analysis['duration'])
+        if analysis.get('bpm'):
+            self.bpm = round(analysis['bpm'])
+            fields.append('bpm')
+        if analysis.get('features') is not None:
+            self.has_features = True
+            fields.append('has_features')
+        for field in ('sample_rate', 'channels', 'bitrate'):
+            if analysis.get(field):
+                setattr(self, field, int(analysis[field]))
+                fields.append(field)
+        for field in ('loudness_lufs', 'true_peak_dbtp', 'replay_gain_db'):
+            if analysis.get(field) is not None:
+                setattr(self, field, round(analysis[field], 2))
+                fields.append(field)
+        return fields
+
+class LibraryEntry(models.Model):
+    """A shared catalog song in a user's library."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='library')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='library_entries')
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'song')
+
+    def __str__(self):
+        return f"{self.song_id} in {self.user_id}'s library"
+
+
+class SongWaveform(models.Model):
+    """Precomputed min/max peaks for the player, at a few resolutions (see music.waveform)."""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='waveform')
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Waveform for {self.song_id}"
+
+
+class SongFingerprint(models.Model):
+    """Marks a song as fingerprinted; the hashes live in FingerprintHash (see music.fingerprint)."""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    hash_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Fingerprint for {self.song_id}"
+
+
+class SongHLS(models.Model):
+    """HLS renditions of a song (see music.transcode); the files live under MUSIC_HLS_DIR."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='hls')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    renditions = models.JSONField(default=list)  # [{'name', 'bitrate', 'bandwidth'}], lowest first
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='songhls_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"HLS for {self.song_id} ({self.status})"
+
+
+class DiscoverPool(models.Model):
+    """
+    The prefetched discover tracks for one genre (see music.discover),
+    refreshed from Jamendo by `manage.py prefetch_discover`.
+    """
+    genre = models.CharField(max_length=100, primary_key=True)  # lower-cased Jamendo tag
+    track_count = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField(null=True, blank=True)  # last successful refresh
+    attempted_at = models.DateTimeField(null=True, blank=True)
+    requested_at = models.DateTimeField(null=True, blank=True)  # last discover request for the genre
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.genre} ({self.track_count} tracks)"
+
+
+class DiscoverPoolTrack(models.Model):
+    pool = models.ForeignKey(DiscoverPool, on_delete=models.CASCADE, related_name='tracks')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='discover_tracks')
+    position = models.PositiveIntegerField()  # Jamendo's popularity order
+
+    class Meta:
+        unique_together = ('pool', 'song')
+        indexes = [
+            models.Index(fields=['pool', 'position'], name='discoverpool_order_idx'),
+        ]
+
+
+class CrawlCheckpoint(models.Model):
+    """How far `manage.py fetch_songs` has got through one genre's Jamendo pages (see music.crawl)."""
+    genre = models.CharField(max_length=100, primary_key=True)
+    offset = models.PositiveIntegerField(default=0)  # every track before this is ingested
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.genre} @ {self.offset}{' (finished)' if self.finished else ''}"
+
+
+class FingerprintHash(models.Model):
+    """Inverted index row: one spectral-peak pair hash of a song, at a frame offset."""
+    hash = models.IntegerField()
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='fingerprint_hashes')
+    offset = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # covering index: a lookup by hash never touches the table
+            models.Index(fields=['hash', 'song', 'offset'], name='fingerprint_hash_idx'),
+        ]
+
 
 class Playlist(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -139,6 +353,144 @@ class Playlist(models.Model):
     songs = models.ManyToManyField(Song)
     created_at = models.DateTimeField(auto_now_add=True)
     is_public = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='playlist_user_keyset_idx'),
+        ]
     
     def __str__(self):
         return self.name
+
+
+class SearchDocument(models.Model):
+    """Denormalised row per searchable object, mirrored into the FTS index."""
+    KIND_CHOICES = (
+        ('artist', 'Artist'),
+        ('album', 'Album'),
+        ('song', 'Song'),
+        ('playlist', 'Playlist'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    title = models.CharField(max_length=200)
+    tags = models.CharField(max_length=200, blank=True)  # country / genre
+    lyrics = models.TextField(blank=True)
+    # id of the only user who may find it; None for the shared catalog and public playlists
+    owner = models.UUIDField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+
+class IngestJob(models.Model):
+    """A queued song upload, processed by `manage.py run_ingest_worker`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingest_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)  # percent
+    payload = models.JSONField(default=dict)  # song fields from the request
+    audio_path = models.CharField(max_length=500)  # staged upload on local disk
+    art_path = models.CharField(max_length=500, blank=True)
+    audio_sha256 = models.CharField(max_length=64, blank=True)  # computed while staging
+    art_sha256 = models.CharField(max_length=64, blank=True)
+    song = models.ForeignKey(Song, on_delete=models.SET_NULL, null=True, blank=True, related_name='ingest_jobs')
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ingestjob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class AssetTransfer(models.Model):
+    """
+    A remote file (artwork, audio) to copy into storage and attach to a row
+    created without it, processed by `manage.py run_transfer_worker`.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+    MODEL_CHOICES = (
+        ('artist', 'Artist'),
+        ('album', 'Album'),
+        ('song', 'Song'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.UUIDField()
+    field = models.CharField(max_length=50)  # image, cover_image, art or audio_file
+    urls = models.JSONField(default=list)  # tried in order until one downloads
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='assettransfer_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}.{self.field} for {self.object_id} ({self.status})"
+
+
+class UploadSession(models.Model):
+    """A resumable, chunked audio upload (see music.uploads)."""
+    OPEN = 'open'
+    COMPLETE = 'complete'
+    ABORTED = 'aborted'
+    STATUS_CHOICES = (
+        (OPEN, 'Open'),
+        (COMPLETE, 'Complete'),
+        (ABORTED, 'Aborted'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()  # declared total in bytes
+    received = models.PositiveBigIntegerField(default=0)  # contiguous bytes on disk
+    sha256 = models.CharField(max_length=64, blank=True)  # optional whole-file checksum
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=OPEN)
+    job = models.ForeignKey(IngestJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
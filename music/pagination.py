@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPagination:
+    """
+    Cursor pagination on a fixed, unique ordering, e.g. ('-date_added', '-id').
+
+    The cursor carries the sort key of the last row served, so the next page
+    is a `WHERE key < last ORDER BY key LIMIT n` range read rather than an
+    OFFSET scan; page cost stays flat however deep the client goes. The last
+    ordering field must be unique (the primary key) to break ties.
+    """
+    cursor_param = 'cursor'
+    page_size_param = 'page_size'
+    max_page_size = 100
+    salt = 'music.pagination.cursor'
+
+    class InvalidCursor(Exception):
+        pass
+
+    def __init__(self, ordering, page_size=None):
+        self.ordering = tuple(ordering)
+        self.page_size = page_size or settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+        self.next_cursor = None
+        self.limit = self.page_size
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.page_size_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def fields(self, model):
+        return [
+            (model._meta.get_field(name.lstrip('-')), name.startswith('-'))
+            for name in self.ordering
+        ]
+
+    def encode_cursor(self, model, row):
+        values = [field.value_to_string(row) for field, _ in self.fields(model)]
+        return signing.dumps(values, salt=self.salt, compress=True)
+
+    def decode_cursor(self, model, cursor):
+        try:
+            values = signing.loads(cursor, salt=self.salt)
+            fields = self.fields(model)
+            if len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for (field, _), value in zip(fields, values)]
+        except (signing.BadSignature, ValidationError, ValueError, TypeError) as e:
+            raise self.InvalidCursor(str(e))
+
+    def after(self, model, values):
+        # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND (b > y OR (b = y AND c > z)))
+        condition = None
+        for (field, descending), value in reversed(list(zip(self.fields(model), values))):
+            lookup = 'lt' if descending else 'gt'
+            beyond = Q(**{f'{field.name}__{lookup}': value})
+            if condition is None:
+                condition = beyond
+            else:
+                condition = beyond | (Q(**{field.name: value}) & condition)
+        return condition
+
+    def paginate_queryset(self, queryset, request):
+        self.limit = self.get_limit(request)
+        model = queryset.model
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_param)
+        if cursor:
+            queryset = queryset.filter(self.after(model, self.decode_cursor(model, cursor)))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:self.limit + 1])
+        page = rows[:self.limit]
+        self.next_cursor = self.encode_cursor(model, page[-1]) if len(rows) > self.limit else None
+        return page
+
+    def get_pagination(self):
+        return {
+            'next': self.next_cursor,
+            'page_size': self.limit,
+        }
@@ -6,7 +6,8 @@ def create_response(
     message="",
     data=None,
     errors=None,
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    pagination=None
 ):
     if data is None:
         data = []
@@ -19,5 +20,7 @@ def create_response(
         "data": data,
         "errors": errors
     }
+    if pagination is not None:
+        response_data["pagination"] = pagination
     
     return Response(response_data, status=status_code)
\ No newline at end of file
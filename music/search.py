@@ -0,0 +1,215 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Artist, Album, Song, Playlist, SearchDocument
+
+FTS_TABLE = 'music_searchdocument_fts'
+
+# kind -> (model, title field, tags field, lyrics field)
+SEARCHABLE = {
+    'artist': (Artist, 'name', 'country', None),
+    'album': (Album, 'title', 'genre', None),
+    'song': (Song, 'title', 'genre', 'lyrics'),
+    'playlist': (Playlist, 'name', None, None),
+}
+
+KIND_FOR_MODEL = {model: kind for kind, (model, *_) in SEARCHABLE.items()}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def document_owner(kind, instance):
+    """The only user who may find the object, or None when everyone may (the shared catalog, public playlists)."""
+    if kind == 'playlist' and instance.is_public:
+        return None
+    return instance.user_id
+
+
+def document_values(kind, instance):
+    _, title_field, tags_field, lyrics_field = SEARCHABLE[kind]
+    return {
+        'title': getattr(instance, title_field) or '',
+        'tags': (getattr(instance, tags_field) or '') if tags_field else '',
+        'lyrics': (getattr(instance, lyrics_field) or '') if lyrics_field else '',
+        'owner': document_owner(kind, instance),
+    }
+
+
+class BaseSearchBackend:
+    """
+    Keeps SearchDocument rows in sync with the catalog. Subclasses decide how
+    a query is matched and ranked; `search` returns (kind, object_id) pairs,
+    best match first. Given a `user`, `search` and `count` only see that
+    user's documents and those with no owner.
+    """
+
+    def index(self, instance):
+        kind = KIND_FOR_MODEL.get(type(instance))
+        if kind is None:
+            return
+        SearchDocument.objects.update_or_create(
+            kind=kind,
+            object_id=instance.pk,
+            defaults=document_values(kind, instance),
+        )
+
+    def index_many(self, instances):
+        """Index rows that were just bulk-created (and so sent no post_save), in one insert."""
+        SearchDocument.objects.bulk_create([
+            SearchDocument(kind=KIND_FOR_MODEL[type(instance)], object_id=instance.pk,
+                           **document_values(KIND_FOR_MODEL[type(instance)], instance))
+            for instance in instances if type(instance) in KIND_FOR_MODEL
+        ])
+
+    def remove(self, instance):
+        kind = KIND_FOR_MODEL.get(type(instance))
+        if kind is None:
+            return
+        SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+    def rebuild(self, batch_size=500):
+        SearchDocument.objects.all().delete()
+        total = 0
+        for kind, (model, *_) in SEARCHABLE.items():
+            batch = []
+            for instance in model.objects.all().iterator(chunk_size=batch_size):
+                batch.append(SearchDocument(kind=kind, object_id=instance.pk, **document_values(kind, instance)))
+                if len(batch) >= batch_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                SearchDocument.objects.bulk_create(batch)
+                total += len(batch)
+        return total
+
+    def search(self, query, kinds=None, limit=None, offset=0, user=None):
+        raise NotImplementedError
+
+    def count(self, query, kinds=None, user=None):
+        """Number of matches per kind, without loading any rows."""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Portable fallback: one icontains scan over the SearchDocument table
+    instead of four over the catalog tables. Title hits rank above tag hits,
+    which rank above lyric hits.
+    """
+
+    def matching(self, query, kinds=None, user=None):
+        documents = SearchDocument.objects.filter(
+            Q(title__icontains=query) | Q(tags__icontains=query) | Q(lyrics__icontains=query)
+        )
+        if kinds:
+            documents = documents.filter(kind__in=kinds)
+        if user is not None:
+            documents = documents.filter(Q(owner__isnull=True) | Q(owner=user.pk))
+        return documents
+
+    def search(self, query, kinds=None, limit=None, offset=0, user=None):
+        query = query.strip()
+        if not query:
+            return []
+        documents = self.matching(query, kinds, user).annotate(
+            score=Case(
+                When(title__iexact=query, then=Value(0)),
+                When(title__istartswith=query, then=Value(1)),
+                When(title__icontains=query, then=Value(2)),
+                When(tags__icontains=query, then=Value(3)),
+                default=Value(4),
+                output_field=IntegerField(),
+            )
+        ).order_by('score', 'title', 'id').values_list('kind', 'object_id')
+        if limit is not None:
+            return list(documents[offset:offset + limit])
+        return list(documents[offset:])
+
+    def count(self, query, kinds=None, user=None):
+        query = query.strip()
+        if not query:
+            return {}
+        rows = self.matching(query, kinds, user).values('kind').annotate(total=Count('id'))
+        return {row['kind']: row['total'] for row in rows}
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 external-content index over SearchDocument (see migration
+    0002). Triggers keep the FTS table in step with SearchDocument, so this
+    backend only needs to override querying and rebuilding.
+    """
+    # bm25 weights for the title, tags and lyrics columns
+    weights = (10.0, 3.0, 1.0)
+
+    def match_expression(self, query):
+        # Quote every token so user input can't inject FTS syntax, and
+        # prefix-match so partially typed words still hit.
+        tokens = TOKEN_RE.findall(query)
+        return ' '.join('"%s"*' % token for token in tokens)
+
+    def rebuild(self, batch_size=500):
+        total = super().rebuild(batch_size=batch_size)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        return total
+
+    def matching_sql(self, expression, kinds=None, user=None, columns='d.kind, d.object_id'):
+        sql = [
+            f"SELECT {columns} FROM {FTS_TABLE} f",
+            f"JOIN {SearchDocument._meta.db_table} d ON d.id = f.rowid",
+            f"WHERE {FTS_TABLE} MATCH %s",
+        ]
+        params = [expression]
+        if kinds:
+            sql.append("AND d.kind IN (%s)" % ', '.join(['%s'] * len(kinds)))
+            params.extend(kinds)
+        if user is not None:
+            sql.append("AND (d.owner IS NULL OR d.owner = %s)")
+            params.append(SearchDocument._meta.get_field('owner').get_db_prep_value(user.pk, connection))
+        return sql, params
+
+    def search(self, query, kinds=None, limit=None, offset=0, user=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        sql, params = self.matching_sql(expression, kinds, user)
+        sql.append(f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s), d.id")
+        params.extend(self.weights)
+        sql.append("LIMIT %s OFFSET %s")
+        params.extend([-1 if limit is None else limit, offset])
+
+        object_id = SearchDocument._meta.get_field('object_id')
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [
+                (kind, object_id.to_python(value))
+                for kind, value in cursor.fetchall()
+            ]
+
+    def count(self, query, kinds=None, user=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return {}
+        sql, params = self.matching_sql(expression, kinds, user, columns='d.kind, COUNT(*)')
+        sql.append("GROUP BY d.kind")
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return dict(cursor.fetchall())
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'MUSIC_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
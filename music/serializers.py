@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Artist, Album, Song, Playlist
+from django.db.models import Prefetch
+from .models import Artist, Album, Song, Playlist, IngestJob, UploadSession
 from django.contrib.auth import authenticate
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
@@ -74,64 +75,148 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         exclude = ['password']
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        return queryset.prefetch_related(f'{prefix}groups', f'{prefix}user_permissions')
 
-class AlbumSerializer(serializers.ModelSerializer):
+
+def parse_field_paths(value):
+    """
+    Turn "id,title,albums.title,albums.songs" into
+    {'id': {}, 'title': {}, 'albums': {'title': {}, 'songs': {}}}.
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.split('.'):
+            part = part.strip()
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets and opt-in expansion.
+
+    `fields` limits the output to the named fields. Nested collections listed
+    in `expandable_fields` are left out unless named in `expand`. Both take
+    dotted paths (or the parsed dict) that are handed down to nested
+    serializers, e.g. ?expand=albums.songs&fields=id,name,albums.title
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = parse_field_paths(fields) if isinstance(fields, str) else (fields or {})
+        self.requested_expand = parse_field_paths(expand) if isinstance(expand, str) else (expand or {})
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.expandable_fields:
+            if name not in self.requested_expand:
+                fields.pop(name, None)
+        if self.requested_fields:
+            for name in list(fields):
+                if name not in self.requested_fields:
+                    fields.pop(name)
+        return fields
+
+    def nested_options(self, name):
+        return {
+            'fields': self.requested_fields.get(name),
+            'expand': self.requested_expand.get(name),
+        }
+
+
+class AlbumSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     artist_name = serializers.CharField(source='artist.name', read_only=True)
     cover_image = serializers.ImageField(required=False, allow_null=True)
     cover_image_url = serializers.SerializerMethodField(read_only=True)
     songs = serializers.SerializerMethodField()  # For songs not in albums or all songs
+    expandable_fields = ('songs',)
     
     class Meta:
         model = Album
         fields = '__all__'
         read_only_fields = ('id',)
+        # album_catalog_unique only covers catalog rows, which the API never writes
+        validators = []
     
     def get_cover_image_url(self, obj):
         if obj.cover_image:
             return obj.cover_image.url
         return None
     
+    @staticmethod
+    def setup_eager_loading(queryset, expand=None):
+        expand = expand or {}
+        queryset = queryset.select_related('artist')
+        if 'songs' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('songs', queryset=SongSerializer.setup_eager_loading(Song.objects.all(), expand['songs']))
+            )
+        return queryset
+
     def get_songs(self, obj):
-        # Get all songs by this artist (through albums)
-        songs = Song.objects.filter(album=obj)
-        serializer = SongSerializer(songs, many=True, context=self.context)
+        # Reads the prefetched `songs` cache when the view set one up
+        serializer = SongSerializer(obj.songs.all(), many=True, context=self.context, **self.nested_options('songs'))
         return serializer.data
 
 
-class ArtistSerializer(serializers.ModelSerializer):
+class ArtistSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False, allow_null=True)
     image_url = serializers.SerializerMethodField(read_only=True)
-    albums = AlbumSerializer(many=True, read_only=True)
+    albums = serializers.SerializerMethodField()
     songs = serializers.SerializerMethodField()  # For songs not in albums or all songs
+    expandable_fields = ('albums', 'songs')
+
     class Meta:
         model = Artist
         fields = '__all__'
         read_only_fields = ('id',)
+        # artist_catalog_unique only covers catalog rows, which the API never writes
+        validators = []
     
     def get_image_url(self, obj):
         if obj.image:
             return obj.image.url
         return None
     
+    @staticmethod
+    def setup_eager_loading(queryset, expand=None):
+        expand = expand or {}
+        if 'albums' not in expand and 'songs' not in expand:
+            return queryset
+        # Artist songs are read through albums, so either expansion needs them
+        album_expand = dict(expand.get('albums') or {})
+        if 'songs' in expand:
+            album_expand['songs'] = expand['songs']
+        return queryset.prefetch_related(
+            Prefetch('albums', queryset=AlbumSerializer.setup_eager_loading(Album.objects.all(), album_expand))
+        )
+
+    def get_albums(self, obj):
+        serializer = AlbumSerializer(obj.albums.all(), many=True, context=self.context, **self.nested_options('albums'))
+        return serializer.data
+
     def get_songs(self, obj):
-        # Get all songs by this artist (through albums)
-        songs = Song.objects.filter(album__artist=obj)
-        serializer = SongSerializer(songs, many=True, context=self.context)
+        # Get all songs by this artist (through albums), reusing the
+        # albums -> songs prefetch instead of a query per artist
+        songs = [song for album in obj.albums.all() for song in album.songs.all()]
+        serializer = SongSerializer(songs, many=True, context=self.context, **self.nested_options('songs'))
         return serializer.data
 
 
-class SongSerializer(serializers.ModelSerializer):
+class SongSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     album_title = serializers.CharField(source='album.title', read_only=True)
     artist_name = serializers.CharField(source='album.artist.name', read_only=True)
     art = serializers.SerializerMethodField()
     art = serializers.ImageField(required=False, allow_null=True)
     art_url = serializers.SerializerMethodField(read_only=True)
     audio_file = serializers.SerializerMethodField()
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all(),
-        required=False,
-        allow_null=True
-    )
+    # Set by the view or ingest job, never by the client: null is the shared catalog
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
     album = serializers.PrimaryKeyRelatedField(
         queryset=Album.objects.all(),
         required=False,
@@ -148,14 +233,23 @@ class SongSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = [
             'id', 'sample_rate',
-            'channels', 'date_added', 'bpm'
+            'channels', 'date_added', 'bpm',
+            'loudness_lufs', 'true_peak_dbtp', 'replay_gain_db'
         ]
+        # song_catalog_unique only covers catalog rows (music.catalog), which
+        # the API never writes; DRF's validator for it would require `user`
+        validators = []
     
     # def get_art(self, obj):
     #     if obj.art:
     #         return obj.art.url
     #     return None
     
+    @staticmethod
+    def setup_eager_loading(queryset, expand=None):
+        # album_title and artist_name walk album -> artist
+        return queryset.select_related('album__artist')
+
     def get_art_url(self, obj):
         if obj.art:
             return obj.art.url
@@ -167,14 +261,37 @@ class SongSerializer(serializers.ModelSerializer):
         return obj.audio_url  # Fallback external URL
 
 
-class PlaylistSerializer(serializers.ModelSerializer):
+class PlaylistSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    songs = SongSerializer(many=True, read_only=True)
+    songs = serializers.SerializerMethodField()
+    expandable_fields = ('songs',)
     
     class Meta:
         model = Playlist
         fields = '__all__'
         read_only_fields = ('id', 'created_at', 'user')
+
+    @staticmethod
+    def setup_eager_loading(queryset, expand=None):
+        expand = expand or {}
+        if 'user' in expand:
+            queryset = UserSerializer.setup_eager_loading(queryset.select_related('user'), prefix='user__')
+        if 'songs' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('songs', queryset=SongSerializer.setup_eager_loading(Song.objects.all(), expand['songs']))
+            )
+        return queryset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Only the owner's id unless the full profile is asked for
+        if 'user' in fields and 'user' not in self.requested_expand:
+            fields['user'] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
+
+    def get_songs(self, obj):
+        serializer = SongSerializer(obj.songs.all(), many=True, context=self.context, **self.nested_options('songs'))
+        return serializer.data
     
     def create(self, validated_data):
         # Get the current user from the request context
@@ -183,4 +300,27 @@ class PlaylistSerializer(serializers.ModelSerializer):
         
         playlist = Playlist.objects.create(user=user, **validated_data)
         playlist.songs.set(songs_data)
-        return playlist
\ No newline at end of file
+        return playlist
+
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    song = SongSerializer(read_only=True)
+
+    class Meta:
+        model = IngestJob
+        fields = ['id', 'status', 'progress', 'error', 'song', 'created_at', 'updated_at', 'finished_at']
+        read_only_fields = fields
+
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'received', 'status', 'job', 'chunk_size', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+    def get_chunk_size(self, obj):
+        from .uploads import max_chunk_size
+        return max_chunk_size()
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+
+from .models import Artist, Album, Song, Playlist
+from .search import get_search_backend
+from .suggest import suggestion_index
+
+SEARCHABLE_MODELS = (Artist, Album, Song, Playlist)
+
+
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:  # loaddata
+        return
+    get_search_backend().index(instance)
+    suggestion_index.index_instance(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance)
+    suggestion_index.remove_instance(instance)
+
+
+# Connected per model rather than globally so unrelated models keep
+# Django's fast-delete path.
+for model in SEARCHABLE_MODELS:
+    post_save.connect(update_search_index, sender=model, dispatch_uid=f'search-index-{model.__name__}')
+    post_delete.connect(remove_from_search_index, sender=model, dispatch_uid=f'search-unindex-{model.__name__}')
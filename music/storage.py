@@ -0,0 +1,93 @@
+import os
+import shutil
+import uuid
+from functools import lru_cache
+
+import cloudinary.uploader
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class AudioStorage:
+    """
+    Where ingested audio and artwork end up. `upload_audio` returns the
+    fields to set on the Song; `upload_image` returns the value for an image
+    field (a Cloudinary public id, or '' when the backend has nowhere to
+    put it).
+    """
+
+    def upload_audio(self, path, filename=None):
+        raise NotImplementedError
+
+    def upload_image(self, path, folder):
+        raise NotImplementedError
+
+
+class CloudinaryStorage(AudioStorage):
+
+    def upload_audio(self, path, filename=None):
+        response = cloudinary.uploader.upload_large(
+            path,
+            resource_type="video",  # Cloudinary treats audio as video
+            folder="songs/",
+            use_filename=True,
+            unique_filename=False
+        )
+        return {
+            'audio_url': response.get('secure_url'),
+            'downloadable_link': response.get('secure_url'),
+            'duration': response.get('duration'),
+            'bitrate': (response.get('audio') or {}).get('bit_rate'),
+        }
+
+    def upload_image(self, path, folder):
+        response = cloudinary.uploader.upload(path, folder=f"{folder}/", resource_type='image')
+        return response['public_id']
+
+
+class LocalStorage(AudioStorage):
+    """
+    Stand-in for Cloudinary that copies files under MEDIA_ROOT, so the
+    ingestion pipeline can run and be tested without network access.
+    Artwork is kept on disk but not attached, since the image fields only
+    understand Cloudinary public ids.
+    """
+
+    def __init__(self, root=None, base_url=None):
+        self.root = root or os.path.join(settings.MEDIA_ROOT, 'local_storage')
+        self.base_url = base_url or settings.MEDIA_URL.rstrip('/') + '/local_storage'
+
+    def _store(self, path, folder, filename=None):
+        name = f"{uuid.uuid4().hex}_{os.path.basename(filename or path)}"
+        target_dir = os.path.join(self.root, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.copyfile(path, os.path.join(target_dir, name))
+        return f"{self.base_url}/{folder}/{name}"
+
+    def upload_audio(self, path, filename=None):
+        from mutagen import File as MutagenFile
+
+        url = self._store(path, 'songs', filename)
+        duration = bitrate = None
+        try:
+            audio = MutagenFile(path)
+            if audio is not None:
+                duration = audio.info.length
+                bitrate = getattr(audio.info, 'bitrate', None)
+        except Exception:
+            pass
+        return {
+            'audio_url': url,
+            'downloadable_link': url,
+            'duration': duration,
+            'bitrate': bitrate,
+        }
+
+    def upload_image(self, path, folder):
+        self._store(path, folder)
+        return ''
+
+
+@lru_cache(maxsize=None)
+def get_audio_storage():
+    return import_string(getattr(settings, 'MUSIC_AUDIO_STORAGE', 'music.storage.CloudinaryStorage'))()
@@ -0,0 +1,241 @@
+import fcntl
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urljoin, urlparse
+
+import requests
+from django.conf import settings
+
+from .assets import TransferError, stream_to_file
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def audio_cache_dir():
+    return getattr(settings, 'MUSIC_AUDIO_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'audio_cache'))
+
+
+def audio_cache_max_bytes():
+    return getattr(settings, 'MUSIC_AUDIO_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+
+
+def audio_cache_timeout():
+    return getattr(settings, 'MUSIC_AUDIO_CACHE_TIMEOUT', 30.0)
+
+
+def audio_cache_stats_interval():
+    return getattr(settings, 'MUSIC_AUDIO_CACHE_STATS_INTERVAL', 300)
+
+
+def audio_fetch_hosts():
+    """Hosts (and their subdomains) the cache may download from: where this service stores and ingests audio."""
+    return tuple(getattr(settings, 'MUSIC_AUDIO_FETCH_HOSTS', ('res.cloudinary.com', 'jamendo.com')))
+
+
+def is_fetchable(url):
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    return parsed.scheme in ('http', 'https') and any(
+        host == allowed or host.endswith('.' + allowed) for allowed in audio_fetch_hosts()
+    )
+
+
+def check_redirect(response, *args, **kwargs):
+    # Redirects are followed by requests itself, so vet each hop before it is requested
+    if response.is_redirect and not is_fetchable(urljoin(response.url, response.headers['Location'])):
+        response.close()
+        raise TransferError(f"{response.url} redirects outside the allowed audio hosts")
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, None to send the
+    whole file (no header, or a form we don't serve, like multiple ranges),
+    or raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix: the last N bytes
+        length = int(last)
+        if not length or not size:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRange:
+    """
+    `length` bytes of an open file from `start`. `read` stops at the end of
+    the range; `fileno` is the file's own, positioned at `start`, so a WSGI
+    server's sendfile (which sends Content-Length bytes from the current
+    offset) serves the range without copying it through Python.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class AudioCache:
+    """
+    Size-bounded on-disk LRU of upstream audio files. Entries are keyed by
+    the audio's content hash when known (so identical uploads share one
+    entry), else by URL. Files are filled on first use and atomically
+    renamed into place; a lock file per key keeps concurrent misses from
+    downloading twice. Only URLs on `audio_fetch_hosts` are downloaded, and
+    a fill is abandoned once it takes longer than the cache timeout. Recency is the file's mtime, bumped on every hit,
+    and the oldest entries are evicted after each fill, along with their
+    lock files. Hit/miss counts are logged every stats interval.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self.session = requests.Session()
+        self.session.hooks['response'].append(check_redirect)
+        self.stats_lock = threading.Lock()
+        self.stats = Counter()
+        self.stats_logged = time.monotonic()
+
+    @property
+    def directory(self):
+        return self._directory or audio_cache_dir()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes or audio_cache_max_bytes()
+
+    def count(self, **amounts):
+        with self.stats_lock:
+            self.stats.update(amounts)
+            now = time.monotonic()
+            if now - self.stats_logged < audio_cache_stats_interval():
+                return
+            self.stats_logged = now
+            stats = self.stats.copy()
+        logger.info("Audio cache: %s", self.summary(stats))
+
+    @staticmethod
+    def summary(stats):
+        lookups = stats['hits'] + stats['misses']
+        rate = 100 * stats['hits'] / lookups if lookups else 0
+        return (f"{stats['hits']} hits, {stats['misses']} misses ({rate:.0f}% hit rate), "
+                f"{stats['bytes_fetched']} bytes fetched, {stats['evictions']} evictions")
+
+    @staticmethod
+    def key_for(url, sha256=None):
+        key = sha256 or hashlib.sha256(url.encode()).hexdigest()
+        return key + (os.path.splitext(urlparse(url).path)[1].lower() or '.audio')
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, url, sha256=None):
+        """Returns (path, hit), downloading the file on a miss."""
+        if not is_fetchable(url):
+            raise TransferError(f"{urlparse(url).hostname or url} is not an allowed audio host")
+        key = self.key_for(url, sha256)
+        path = self.path(key)
+        if self._touch(path):
+            self.count(hits=1)
+            return path, True
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(f'.{key}.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._touch(path):  # filled while we waited
+                self.count(hits=1)
+                return path, True
+            self.count(misses=1)
+            size = self._fetch(url, path)
+            self.count(bytes_fetched=size)
+        self.evict(keep=path)
+        return path, False
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _fetch(self, url, path):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.fill-')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                size, _ = stream_to_file(
+                    self.session, url, target, max_bytes=self.max_bytes, timeout=audio_cache_timeout(),
+                    deadline=audio_cache_timeout(), block_size=256 * 1024,
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return size
+
+    def entries(self):
+        """[(mtime, size, path)] of cached files, oldest first."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Drop least recently used files until the cache fits; open readers keep their file."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            for stale in (path, self.path(f'.{os.path.basename(path)}.lock')):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.count(evictions=1)
+            logger.info("Evicted %s from the audio cache", os.path.basename(path))
+
+
+def content_type_for(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+audio_cache = AudioCache()
@@ -0,0 +1,304 @@
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from itertools import islice
+
+from django.conf import settings
+
+from .models import Artist, Album, Song, Playlist
+
+logger = logging.getLogger(__name__)
+
+# kind -> (model, display field)
+SUGGEST_SOURCES = {
+    'artist': (Artist, 'name'),
+    'album': (Album, 'title'),
+    'song': (Song, 'title'),
+    'playlist': (Playlist, 'name'),
+}
+
+KIND_FOR_MODEL = {model: kind for kind, (model, _) in SUGGEST_SOURCES.items()}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.casefold().strip()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+# Prefixes up to this long can match a large share of the index, so the
+# best entries for each are ranked at build time instead of per keystroke.
+TOP_PREFIX_LENGTH = 3
+MAX_CHAR = '\U0010ffff'
+
+
+def prefix_rank(normalized, name, prefix):
+    """Whole-name prefix first, then shorter names."""
+    return (0 if normalized.startswith(prefix) else 1, len(name), normalized)
+
+
+def entry_owner(kind, user_id, is_public=False):
+    """Who may see a suggestion: None for everyone (the shared catalog, public playlists), else its owner's id."""
+    if user_id is None or (kind == 'playlist' and is_public):
+        return None
+    return str(user_id)
+
+
+class SuggestionIndex:
+    """
+    Per-process typeahead index over artist, album, song and playlist names.
+
+    Every word of every name is kept in a sorted list of (token, kind, id)
+    tuples, so a prefix lookup is a bisect plus a scan of the range.
+    Entries everyone may see (the shared catalog, public playlists) are in
+    one list; each user's private entries are in a list of their own, so a
+    lookup reads the shared list plus the caller's and never another
+    user's. Short prefixes ("a", "th") cover much of the shared list, so
+    for those whose range is longer than `max_candidates` the best
+    `max_candidates` entries are ranked when the index is built and read in
+    rank order. The built lists are never edited: writes in this process
+    (through signals) go to a small `delta` list, and entries whose name
+    or owner has changed are skipped when a stale token is read. A
+    periodic background rebuild folds them in and picks up writes from
+    other workers; writes made while it loads are replayed onto the new
+    snapshot. Memory is capped by `max_entries`.
+    """
+
+    def __init__(self, max_entries=None, max_tokens=None, refresh_seconds=None, max_candidates=None):
+        self.max_entries = max_entries or getattr(settings, 'MUSIC_SUGGEST_MAX_ENTRIES', 200000)
+        self.max_tokens = max_tokens or getattr(settings, 'MUSIC_SUGGEST_MAX_TOKENS', 8)
+        self.refresh_seconds = refresh_seconds or getattr(settings, 'MUSIC_SUGGEST_REFRESH_SECONDS', 300)
+        self.max_candidates = max_candidates or getattr(settings, 'MUSIC_SUGGEST_MAX_CANDIDATES', 1000)
+        self._lock = threading.RLock()
+        self._entries = {}  # (kind, id) -> (display name, normalized name, tokens, owner)
+        self._tokens = []   # sorted (token, kind, id) of shared entries as of the last build
+        self._owned = {}    # owner -> sorted (token, kind, id) of their private entries, same
+        self._delta = []    # sorted (token, kind, id) written since, whoever owns them
+        self._top = {}      # short prefix -> [(rank, kind, id, normalized)] of shared entries, best first
+        self._truncated = set()  # prefixes in _top with more matches than they hold
+        self._journal = None  # writes seen while a rebuild loads
+        self._built_at = None
+        self._refreshing = False
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry_tokens(self, normalized):
+        # de-duplicated, order preserved, capped per entry
+        return tuple(dict.fromkeys(TOKEN_RE.findall(normalized)))[:self.max_tokens]
+
+    def _load(self):
+        entries = {}
+        tokens, owned = [], {}
+        for kind, (model, field) in SUGGEST_SOURCES.items():
+            remaining = self.max_entries - len(entries)
+            if remaining <= 0:
+                logger.warning("Suggestion index full at %s entries, skipping %ss", self.max_entries, kind)
+                break
+            columns = ['id', field, 'user_id'] + (['is_public'] if kind == 'playlist' else [])
+            rows = model.objects.exclude(**{field: ''}).values_list(*columns)[:remaining]
+            for pk, name, *visibility in rows.iterator(chunk_size=2000):
+                normalized = normalize(name)
+                object_id = str(pk)
+                owner = entry_owner(kind, *visibility)
+                entry_tokens = self._entry_tokens(normalized)
+                entries[(kind, object_id)] = (name, normalized, entry_tokens, owner)
+                target = tokens if owner is None else owned.setdefault(owner, [])
+                target.extend((token, kind, object_id) for token in entry_tokens)
+        tokens.sort()
+        for owner_tokens in owned.values():
+            owner_tokens.sort()
+        top, truncated = self._rank_short_prefixes(entries, tokens)
+        return entries, tokens, owned, top, truncated
+
+    def _rank_short_prefixes(self, entries, tokens):
+        top, truncated = {}, set()
+        for length in range(1, TOP_PREFIX_LENGTH + 1):
+            position = 0
+            while position < len(tokens):
+                prefix = tokens[position][0][:length]
+                if len(prefix) < length:
+                    position += 1
+                    continue
+                end = bisect_left(tokens, (prefix + MAX_CHAR,), position)
+                if end - position > self.max_candidates:
+                    ranks = {}
+                    for _, kind, object_id in islice(tokens, position, end):
+                        if (kind, object_id) not in ranks:
+                            name, normalized, *_ = entries[(kind, object_id)]
+                            ranks[(kind, object_id)] = prefix_rank(normalized, name, prefix)
+                    best = heapq.nsmallest(self.max_candidates, ranks.items(), key=lambda item: item[1])
+                    top[prefix] = [(rank, kind, object_id, rank[2]) for (kind, object_id), rank in best]
+                    if len(ranks) > self.max_candidates:
+                        truncated.add(prefix)
+                position = end
+        return top, truncated
+
+    def build(self):
+        with self._lock:
+            self._journal = []
+        try:
+            entries, tokens, owned, top, truncated = self._load()
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            journal, self._journal = self._journal, None
+            self._entries, self._tokens, self._owned, self._delta = entries, tokens, owned, []
+            self._top, self._truncated = top, truncated
+            self._built_at = time.monotonic()
+            # writes that landed after _load read their table
+            for key, name, owner in journal:
+                self._apply(key, name, owner)
+        return len(entries)
+
+    def _refresh_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            logger.error(f"Failed to refresh suggestion index: {e}")
+        finally:
+            self._refreshing = False
+
+    def ensure_fresh(self):
+        if not self.is_built:
+            with self._lock:
+                if not self.is_built:
+                    self.build()
+            return
+        if self._refreshing or time.monotonic() - self._built_at < self.refresh_seconds:
+            return
+        # Keep serving the current snapshot while a new one loads
+        self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _apply(self, key, name, owner):
+        """Set (or with name=None drop) one entry; only new tokens touch `delta`, never the built lists."""
+        normalized = normalize(name) if name is not None else ''
+        previous = self._entries.pop(key, None)
+        if not normalized or len(self._entries) >= self.max_entries:
+            return
+        if previous is not None and previous[1] == normalized and previous[3] == owner:
+            self._entries[key] = (name, normalized, previous[2], owner)
+            return
+        entry_tokens = self._entry_tokens(normalized)
+        self._entries[key] = (name, normalized, entry_tokens, owner)
+        for token in entry_tokens:
+            insort(self._delta, (token, *key))
+
+    def _write(self, kind, object_id, name, owner=None):
+        key = (kind, str(object_id))
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((key, name, owner))
+            if self.is_built:
+                self._apply(key, name, owner)
+
+    def add(self, kind, object_id, name, owner=None):
+        """`owner` is the id of the only user who may see it, None for everyone."""
+        self._write(kind, object_id, name, None if owner is None else str(owner))
+
+    def remove(self, kind, object_id):
+        self._write(kind, object_id, None)
+
+    def index_instance(self, instance):
+        kind = KIND_FOR_MODEL.get(type(instance))
+        if kind is not None:
+            owner = entry_owner(kind, instance.user_id, getattr(instance, 'is_public', False))
+            self.add(kind, instance.pk, getattr(instance, SUGGEST_SOURCES[kind][1]), owner)
+
+    def remove_instance(self, instance):
+        kind = KIND_FOR_MODEL.get(type(instance))
+        if kind is not None:
+            self.remove(kind, instance.pk)
+
+    def _live(self, key, kinds, user):
+        """The entry behind a token if it still exists and the caller may see it."""
+        if kinds and key[0] not in kinds:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or (entry[3] is not None and entry[3] != user):
+            return None
+        return entry
+
+    def _scan(self, tokens, anchor, others, normalized_query, kinds, user, seen, candidates):
+        """Rank every visible entry with a word starting with `anchor` in one sorted token list."""
+        position = bisect_left(tokens, (anchor,))
+        while position < len(tokens):
+            token, kind, object_id = tokens[position]
+            position += 1
+            if not token.startswith(anchor):
+                break
+            key = (kind, object_id)
+            if key in seen:
+                continue
+            entry = self._live(key, kinds, user)
+            if entry is None or token not in entry[2]:  # removed, hidden or renamed since
+                continue
+            seen.add(key)
+            name, normalized, *_ = entry
+            if others:
+                words = TOKEN_RE.findall(normalized)
+                if not all(any(word.startswith(other) for word in words) for other in others):
+                    continue
+            candidates.append((prefix_rank(normalized, name, normalized_query), kind, object_id, name))
+
+    def _from_top(self, prefix, limit, kinds, user, seen, candidates):
+        """
+        The pre-ranked shared entries for a single-word query; False if they
+        can't be trusted to hold the best `limit` (filtered out past the cut).
+        """
+        found = 0
+        for rank, kind, object_id, normalized in self._top[prefix]:
+            entry = self._live((kind, object_id), kinds, user)
+            if entry is None or entry[1] != normalized:
+                continue
+            seen.add((kind, object_id))
+            candidates.append((rank, kind, object_id, entry[0]))
+            found += 1
+            if found >= limit:
+                return True
+        return prefix not in self._truncated
+
+    def suggest(self, query, limit=10, kinds=None, user=None):
+        """Best matches `user` may see: theirs and everyone's (only everyone's without a user)."""
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        normalized_query = ' '.join(query_tokens)
+        # The longest query token has the narrowest prefix range
+        anchor = max(query_tokens, key=len)
+        others = [token for token in query_tokens if token != anchor]
+        user = None if user is None else str(user.pk)
+
+        with self._lock:
+            seen, candidates = set(), []
+            if others or anchor not in self._top or not self._from_top(anchor, limit, kinds, user, seen, candidates):
+                seen, candidates = set(), []
+                self._scan(self._tokens, anchor, others, normalized_query, kinds, user, seen, candidates)
+            if user is not None:
+                self._scan(self._owned.get(user, ()), anchor, others, normalized_query, kinds, user, seen, candidates)
+            self._scan(self._delta, anchor, others, normalized_query, kinds, user, seen, candidates)
+
+        return [
+            {'id': object_id, 'type': kind, 'name': name}
+            for _, kind, object_id, name in heapq.nsmallest(limit, candidates)
+        ]
+
+
+suggestion_index = SuggestionIndex()
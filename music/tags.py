@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+TAG_FIELDS = (
+    ('title', 'title'),
+    ('artist', 'artist'),
+    ('album', 'album'),
+    ('genre', 'genre'),
+    ('track_number', 'tracknumber'),
+    ('bpm', 'bpm'),
+    ('year', 'date'),
+)
+
+
+def tag_batch_max_files():
+    return getattr(settings, 'MUSIC_TAG_BATCH_MAX_FILES', 50)
+
+
+def tag_workers():
+    return getattr(settings, 'MUSIC_TAG_WORKERS', 8)
+
+
+class UnsupportedAudio(ValueError):
+    pass
+
+
+def read_tags(upload):
+    """
+    Header and tag metadata of an uploaded file. mutagen is handed the
+    upload's own temp file path, or the in-memory upload's underlying file
+    object, so the audio is never read into (or copied between) buffers;
+    mutagen only seeks to the header and tag frames it needs.
+    """
+    from mutagen import File
+
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        source = upload.file
+        source.seek(0)
+    try:
+        audio = File(source, easy=True)
+    finally:
+        if not isinstance(source, str):
+            source.seek(0)  # leave the upload readable for whoever comes next
+    if not audio:
+        raise UnsupportedAudio("Unsupported audio format")
+
+    result = {
+        'duration': round(audio.info.length, 2),
+        'bitrate': getattr(audio.info, 'bitrate', None),
+        'sample_rate': getattr(audio.info, 'sample_rate', None),
+        'channels': getattr(audio.info, 'channels', 2),
+    }
+    if hasattr(audio, 'tags'):
+        tags = audio.tags or {}
+        result.update({key: tags.get(tag, [''])[0] if tags.get(tag) else None for key, tag in TAG_FIELDS})
+    return result
+
+
+def _read_one(upload):
+    try:
+        return {'file': upload.name, 'success': True, 'metadata': read_tags(upload)}
+    except Exception as e:
+        return {'file': upload.name, 'success': False, 'error': str(e)}
+
+
+def read_tags_batch(uploads):
+    """Per-file results (in upload order) with the files parsed concurrently."""
+    if len(uploads) <= 1:
+        return [_read_one(upload) for upload in uploads]
+    with ThreadPoolExecutor(min(tag_workers(), len(uploads))) as pool:
+        return list(pool.map(_read_one, uploads))
@@ -1,9 +1,53 @@
+import datetime
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+import uuid
+from unittest import mock
+
+import requests
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
-from django.contrib.auth.models import User
-from .models import Artist, Album, Song, Playlist
-import datetime
+
+from .analysis import analyze_audio
+from .assets import TransferTooLarge, stream_to_file
+from .api import FixtureJamendoClient, JamendoClient, get_jamendo_client
+from .catalog import ingest_tracks
+from .crawl import Crawler, TokenBucket
+from .discover import genres_due, last_noted, pool_songs, run_prefetcher
+from .features import FEATURE_DIM, FeatureStore, feature_store
+from .fingerprint import find_duplicates_of
+from .ingest import run_worker
+from .loudness import LoudnessMeter, suggested_gain
+from .management.commands.benchmark_ingest import synthetic_tracks
+from .models import (
+    Album, Artist, AssetTransfer, CrawlCheckpoint, DiscoverPool, IngestJob, LibraryEntry,
+    Playlist, SearchDocument, Song, SongHLS, SongWaveform, UploadSession, User as MusicUser,
+)
+from .search import DatabaseSearchBackend, SQLiteFTSBackend, get_search_backend
+from .storage import get_audio_storage
+from .streaming import AudioCache, audio_cache, parse_range
+from .suggest import SuggestionIndex, suggestion_index
+from .transcode import ffmpeg_command, ladder_for, run_transcoder, song_directory
+from .transfers import AssetTransferrer, HostLimiter, queue_transfers, transfer_for
+from .uploads import UploadError, part_path, write_chunk
+from .waveform import WaveformAccumulator, decode_levels, encode_levels, resample
 
 class MusicAPITests(APITestCase):
     def setUp(self):
@@ -108,4 +152,1523 @@ class MusicAPITests(APITestCase):
         
         url = reverse('playlist-list')
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class SearchIndexTests(APITestCase):
+    def setUp(self):
+        self.user = MusicUser.objects.create_user(
+            email='search@example.com',
+            password='testpass123',
+            first_name='Search',
+            last_name='User'
+        )
+        self.client.force_authenticate(self.user)
+        self.artist = Artist.objects.create(name='Night Owls', country='Iceland', user=self.user)
+        self.album = Album.objects.create(
+            title='Northern Lights',
+            artist=self.artist,
+            release_date='2020-01-01',
+            genre='Ambient',
+            user=self.user
+        )
+        self.song = Song.objects.create(
+            title='Aurora',
+            album=self.album,
+            artist=self.artist,
+            genre='Ambient',
+            lyrics='dancing under the northern sky',
+            user=self.user
+        )
+
+    def search(self, **params):
+        return self.client.get(reverse('search-all'), params)
+
+    def test_index_follows_saves_and_deletes(self):
+        backend = get_search_backend()
+        self.assertIn(('song', self.song.id), backend.search('aurora'))
+
+        self.song.title = 'Borealis'
+        self.song.save()
+        self.assertEqual(backend.search('aurora'), [])
+        self.assertIn(('song', self.song.id), backend.search('borealis'))
+
+        self.song.delete()
+        self.assertEqual(backend.search('borealis'), [])
+
+    def test_sections_and_counts(self):
+        response = self.search(q='northern')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual(data['counts'], {'artist': 0, 'album': 1, 'song': 1, 'playlist': 0})
+        self.assertEqual(sorted(data['sections']), ['album', 'song'])
+        self.assertEqual(data['sections']['album']['results'][0]['title'], 'Northern Lights')
+
+    def test_type_filter_and_prefix_match(self):
+        response = self.search(q='nigh', type='artist')
+        section = response.data['data']['sections']['artist']
+        self.assertEqual(len(section['results']), 1)
+        self.assertEqual(section['results'][0]['name'], 'Night Owls')
+        self.assertIsNone(section['next'])
+
+    def test_cursor_pages_through_one_type(self):
+        for number in range(6):
+            Song.objects.create(title=f'Aurora {number}', user=self.user)
+
+        first = self.search(q='aurora')
+        section = first.data['data']['sections']['song']
+        self.assertEqual(first.data['data']['counts']['song'], 7)
+        self.assertEqual(len(section['results']), 5)
+
+        second = self.search(q='aurora', cursor=section['next'])
+        page = second.data['data']['sections']['song']
+        self.assertEqual(list(second.data['data']['sections']), ['song'])
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNone(page['next'])
+        seen = {row['id'] for row in section['results'] + page['results']}
+        self.assertEqual(len(seen), 7)
+
+    def test_cursor_is_tied_to_query(self):
+        for number in range(6):
+            Song.objects.create(title=f'Aurora {number}', user=self.user)
+        cursor = self.search(q='aurora').data['data']['sections']['song']['next']
+        response = self.search(q='borealis', cursor=cursor)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_results_and_counts_are_scoped_to_the_caller(self):
+        other = MusicUser.objects.create_user(
+            email='other@example.com', password='testpass123', first_name='Other', last_name='User'
+        )
+        Song.objects.create(title='Aurora Private', user=other)
+        Song.objects.create(title='Aurora Catalog', user=None)
+        Playlist.objects.create(name='Aurora Secret', user=other, is_public=False)
+        Playlist.objects.create(name='Aurora Shared', user=other, is_public=True)
+
+        data = self.search(q='aurora').data['data']
+        self.assertEqual(data['counts'], {'artist': 0, 'album': 0, 'song': 2, 'playlist': 1})
+        self.assertEqual({row['title'] for row in data['sections']['song']['results']}, {'Aurora', 'Aurora Catalog'})
+        self.assertEqual([row['name'] for row in data['sections']['playlist']['results']], ['Aurora Shared'])
+
+        for backend in (SQLiteFTSBackend(), DatabaseSearchBackend()):
+            with self.subTest(backend=type(backend).__name__):
+                self.assertEqual(backend.count('aurora', user=other), {'song': 2, 'playlist': 2})
+                self.assertEqual(len(backend.search('aurora', kinds=['song'], user=self.user)), 2)
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(get_search_backend().search('aurora'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertIn(('song', self.song.id), get_search_backend().search('aurora'))
+
+
+class SuggestTests(APITestCase):
+    def setUp(self):
+        self.user = MusicUser.objects.create_user(
+            email='suggest@example.com',
+            password='testpass123',
+            first_name='Suggest',
+            last_name='User'
+        )
+        self.client.force_authenticate(self.user)
+        self.artist = Artist.objects.create(name='Beyoncé', user=self.user)
+        self.song = Song.objects.create(title='Halo', artist=self.artist, user=self.user)
+        # the index lives for the whole process, so rebuild it from this test's rows
+        suggestion_index.build()
+
+    def suggest(self, **params):
+        return self.client.get(reverse('suggest'), params)
+
+    def test_prefix_match_ignores_accents(self):
+        response = self.suggest(q='beyo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data'], [
+            {'id': str(self.artist.id), 'type': 'artist', 'name': 'Beyoncé'}
+        ])
+
+    def test_signals_keep_index_current(self):
+        song = Song.objects.create(title='Crazy in Love', artist=self.artist, user=self.user)
+        self.assertEqual([s['id'] for s in self.suggest(q='crazy lo').data['data']], [str(song.id)])
+
+        song.title = 'Drunk in Love'
+        song.save()
+        self.assertEqual(self.suggest(q='crazy').data['data'], [])
+
+        song.delete()
+        self.assertEqual(self.suggest(q='drunk').data['data'], [])
+
+    def test_type_filter_and_limit(self):
+        Song.objects.create(title='Hold Up', artist=self.artist, user=self.user)
+        response = self.suggest(q='h', type='song', limit=1)
+        self.assertEqual(len(response.data['data']), 1)
+        self.assertEqual(response.data['data'][0]['name'], 'Halo')
+
+    def test_ranks_whole_prefix_range_past_candidate_cap(self):
+        for title in ('Hymn for the Weekend', 'Heartbeats', 'Hurt', 'Harder Better Faster Stronger'):
+            Song.objects.create(title=title, user=None)  # shared, so ranked ahead
+        index = SuggestionIndex(max_candidates=2)
+        index.build()
+        # 'h' has more shared matches than the cap; the shortest names, shared or the user's own, still win
+        self.assertEqual([s['name'] for s in index.suggest('h', limit=2, user=self.user)], ['Halo', 'Hurt'])
+        self.assertEqual([s['name'] for s in index.suggest('hu', limit=1, user=self.user)], ['Hurt'])
+        index.add('song', 'new', 'Hi')
+        index.remove('song', self.song.id)
+        self.assertEqual([s['name'] for s in index.suggest('h', limit=2, user=self.user)], ['Hi', 'Hurt'])
+        self.assertEqual([s['name'] for s in index.suggest('h', limit=2, kinds=['artist'], user=self.user)], [])
+
+    def test_only_the_callers_and_shared_names_are_suggested(self):
+        other = MusicUser.objects.create_user(
+            email='other@example.com', password='testpass123', first_name='Other', last_name='User'
+        )
+        Song.objects.create(title='Halogen', user=other)
+        Song.objects.create(title='Halcyon', user=None)
+        Playlist.objects.create(name='Hallway Secrets', user=other, is_public=False)
+        shared = Playlist.objects.create(name='Hallway Mix', user=other, is_public=True)
+        self.assertEqual({s['name'] for s in self.suggest(q='hal').data['data']}, {'Halo', 'Halcyon', 'Hallway Mix'})
+
+        # a playlist made private leaves everyone else's suggestions
+        shared.is_public = False
+        shared.save()
+        self.assertEqual({s['name'] for s in self.suggest(q='hallway').data['data']}, set())
+        self.client.force_authenticate(other)
+        self.assertEqual({s['name'] for s in self.suggest(q='hal').data['data']},
+                         {'Halogen', 'Halcyon', 'Hallway Secrets', 'Hallway Mix'})
+
+    def test_rebuild_replays_writes_made_while_loading(self):
+        index = SuggestionIndex()
+        index.build()
+        load = index._load
+
+        def load_then_write():
+            loaded = load()
+            index.add('song', 'late', 'Hallelujah')
+            return loaded
+
+        with mock.patch.object(index, '_load', load_then_write):
+            index.build()
+        self.assertEqual([s['name'] for s in index.suggest('hall', user=self.user)], ['Hallelujah'])
+
+
+class QueryCountTests(APITestCase):
+    """List endpoints must cost the same number of queries for 1 or many rows."""
+
+    def setUp(self):
+        self.user = MusicUser.objects.create_user(
+            email='queries@example.com',
+            password='testpass123',
+            first_name='Query',
+            last_name='User'
+        )
+        self.client.force_authenticate(self.user)
+        self.playlist = Playlist.objects.create(name='Everything', user=self.user)
+
+    def add_catalog(self, artists):
+        for number in range(artists):
+            artist = Artist.objects.create(name=f'Artist {number}', user=self.user)
+            for album_number in range(2):
+                album = Album.objects.create(
+                    title=f'Album {number}.{album_number}',
+                    artist=artist,
+                    release_date='2020-01-01',
+                    genre='Rock',
+                    user=self.user
+                )
+                for track in range(3):
+                    song = Song.objects.create(
+                        title=f'Song {number}.{album_number}.{track}',
+                        album=album,
+                        artist=artist,
+                        track_number=track,
+                        user=self.user
+                    )
+                    self.playlist.songs.add(song)
+            Playlist.objects.create(name=f'Playlist {number}', user=self.user).songs.add(song)
+
+    def count_queries(self, url_name, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context), len(response.data['data'])
+
+    def assertConstantQueries(self, url_name, **params):
+        self.add_catalog(1)
+        small, small_rows = self.count_queries(url_name, params)
+        self.add_catalog(5)
+        large, large_rows = self.count_queries(url_name, params)
+        self.assertGreater(large_rows, small_rows)
+        self.assertEqual(small, large)
+
+    def test_artist_list(self):
+        self.assertConstantQueries('artist-list', expand='albums.songs,songs')
+
+    def test_album_list(self):
+        self.assertConstantQueries('album-list', expand='songs')
+
+    def test_song_list(self):
+        self.assertConstantQueries('song-list')
+
+    def test_playlist_list(self):
+        self.assertConstantQueries('playlist-list', expand='songs,user')
+
+
+class FieldSelectionTests(APITestCase):
+    def setUp(self):
+        self.user = MusicUser.objects.create_user(
+            email='fields@example.com',
+            password='testpass123',
+            first_name='Fields',
+            last_name='User'
+        )
+        self.client.force_authenticate(self.user)
+        self.artist = Artist.objects.create(name='Solo', user=self.user)
+        self.album = Album.objects.create(
+            title='First', artist=self.artist, release_date='2020-01-01', genre='Pop', user=self.user
+        )
+        self.song = Song.objects.create(
+            title='Opener', album=self.album, artist=self.artist, lyrics='la la', user=self.user
+        )
+        self.playlist = Playlist.objects.create(name='Mix', user=self.user)
+        self.playlist.songs.add(self.song)
+
+    def test_nested_collections_omitted_by_default(self):
+        artist = self.client.get(reverse('artist-list')).data['data'][0]
+        self.assertNotIn('albums', artist)
+        self.assertNotIn('songs', artist)
+
+        playlist = self.client.get(reverse('playlist-detail', args=[self.playlist.id])).data['data']
+        self.assertNotIn('songs', playlist)
+        self.assertEqual(playlist['user'], self.user.id)
+
+    def test_expand_and_fields_follow_dotted_paths(self):
+        response = self.client.get(reverse('artist-list'), {
+            'expand': 'albums.songs',
+            'fields': 'id,name,albums.title,albums.songs.title',
+        })
+        artist = response.data['data'][0]
+        self.assertEqual(set(artist), {'id', 'name', 'albums'})
+        self.assertEqual(artist['albums'], [{'title': 'First', 'songs': [{'title': 'Opener'}]}])
+
+    def test_sparse_song_fields_skip_lyrics(self):
+        response = self.client.get(reverse('playlist-list'), {'expand': 'songs', 'fields': 'name,songs.title'})
+        self.assertEqual(response.data['data'], [{'name': 'Mix', 'songs': [{'title': 'Opener'}]}])
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = MusicUser.objects.create_user(
+            email='pages@example.com',
+            password='testpass123',
+            first_name='Page',
+            last_name='User'
+        )
+        self.client.force_authenticate(self.user)
+        for number in range(25):
+            Song.objects.create(title=f'Track {number}', user=self.user)
+
+    def test_pages_cover_library_once_in_order(self):
+        url = reverse('song-list')
+        seen = []
+        params = {'page_size': 10}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [(song['date_added'], song['id']) for song in response.data['data']]
+            cursor = response.data['pagination']['next']
+            if not cursor:
+                break
+            params['cursor'] = cursor
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_default_page_size_and_bad_cursor(self):
+        response = self.client.get(reverse('song-list'))
+        self.assertEqual(len(response.data['data']), 20)
+        self.assertEqual(response.data['pagination']['page_size'], 20)
+
+        response = self.client.get(reverse('song-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LocalStorageTestCase(APITestCase):
+    """Runs the ingest pipeline against LocalStorage in a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            MUSIC_AUDIO_STORAGE='music.storage.LocalStorage',
+            MUSIC_INGEST_STAGING_DIR=os.path.join(self.media_root, 'ingest'),
+            MUSIC_FEATURE_STORE_DIR=os.path.join(self.media_root, 'features'),
+        )
+        self.settings_override.enable()
+        get_audio_storage.cache_clear()
+
+        self.user = MusicUser.objects.create_user(
+            email='ingest@example.com',
+            password='testpass123',
+            first_name='Ingest',
+            last_name='User'
+        )
+        self.client.force_authenticate(self.user)
+        self.artist = Artist.objects.create(name='Uploader', user=self.user)
+        self.album = Album.objects.create(
+            title='Demos', artist=self.artist, release_date='2020-01-01', genre='Lo-fi', user=self.user
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        get_audio_storage.cache_clear()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+
+class IngestPipelineTests(LocalStorageTestCase):
+    def upload(self, **extra):
+        data = {
+            'title': 'Demo One',
+            'album': str(self.album.id),
+            'artist': str(self.artist.id),
+            'audio_file': SimpleUploadedFile('demo.mp3', b'\x00' * 2048, content_type='audio/mpeg'),
+        }
+        data.update(extra)
+        return self.client.post(reverse('song-list'), data, format='multipart')
+
+    def test_upload_is_queued_then_processed(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data['data']['id']
+        self.assertEqual(response.data['data']['status'], IngestJob.PENDING)
+        self.assertFalse(Song.objects.filter(title='Demo One').exists())
+
+        self.assertEqual(run_worker(once=True), 1)
+
+        job = self.client.get(reverse('ingest-job-detail', args=[job_id])).data['data']
+        self.assertEqual(job['status'], IngestJob.SUCCEEDED)
+        self.assertEqual(job['progress'], 100)
+        self.assertEqual(job['song']['title'], 'Demo One')
+        self.assertTrue(job['song']['audio_url'].startswith('/media/local_storage/songs/'))
+        # staged copy is removed once stored
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'ingest', job_id)))
+        # and the new song is queued for HLS transcoding
+        self.assertEqual(SongHLS.objects.get(song__title='Demo One').status, SongHLS.PENDING)
+
+    def test_invalid_reference_is_rejected_before_queueing(self):
+        response = self.upload(album=str(uuid.uuid4()))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IngestJob.objects.count(), 0)
+
+    def test_failed_job_reports_error(self):
+        self.upload()
+        self.album.delete()  # song validation now fails in the worker
+        run_worker(once=True)
+        job = IngestJob.objects.get()
+        self.assertEqual(job.status, IngestJob.FAILED)
+        self.assertIn('album', job.error)
+
+    def test_jobs_are_private(self):
+        job_id = self.upload().data['data']['id']
+        other = MusicUser.objects.create_user(
+            email='other@example.com', password='testpass123', first_name='O', last_name='U'
+        )
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('ingest-job-detail', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_duplicate_audio_reuses_stored_file(self):
+        self.upload()
+        self.upload(title='Demo One (again)')
+        self.assertEqual(run_worker(once=True), 2)
+
+        first, second = Song.objects.order_by('date_added')
+        self.assertEqual(first.audio_sha256, hashlib.sha256(b'\x00' * 2048).hexdigest())
+        self.assertEqual(second.audio_sha256, first.audio_sha256)
+        self.assertEqual(second.audio_url, first.audio_url)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'local_storage', 'songs'))), 1)
+
+    def test_backfilled_local_file_is_reused(self):
+        self.upload()
+        run_worker(once=True)
+        stored = Song.objects.get()
+        Song.objects.filter(id=stored.id).update(audio_sha256='')  # stored before hashes were kept
+
+        out = io.StringIO()
+        call_command('backfill_content_hashes', model=['song'], stdout=out, stderr=io.StringIO())
+        self.assertIn('Song.audio_sha256: hashed 1, failed 0', out.getvalue())
+        stored.refresh_from_db()
+        self.assertEqual(stored.audio_sha256, hashlib.sha256(b'\x00' * 2048).hexdigest())
+
+        self.upload(title='Demo One (again)')
+        run_worker(once=True)
+        self.assertEqual(Song.objects.get(title='Demo One (again)').audio_url, stored.audio_url)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'local_storage', 'songs'))), 1)
+
+
+class ChunkedUploadTests(LocalStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload_override = override_settings(
+            MUSIC_UPLOAD_DIR=os.path.join(self.media_root, 'uploads'),
+            MUSIC_UPLOAD_MAX_CHUNK_SIZE=1024,
+        )
+        self.upload_override.enable()
+        self.payload = bytes(range(256)) * 10  # 2560 bytes
+
+    def tearDown(self):
+        self.upload_override.disable()
+        super().tearDown()
+
+    def start(self, **extra):
+        data = {'filename': 'long-take.mp3', 'size': len(self.payload)}
+        data.update(extra)
+        response = self.client.post(reverse('upload-session-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['data']['id']
+
+    def put(self, session_id, start, end, checksum=None):
+        chunk = self.payload[start:end + 1]
+        headers = {'HTTP_CONTENT_RANGE': f'bytes {start}-{end}/{len(self.payload)}'}
+        if checksum:
+            headers['HTTP_X_CHUNK_SHA256'] = checksum
+        return self.client.put(
+            reverse('upload-session-detail', args=[session_id]),
+            data=chunk,
+            content_type='application/octet-stream',
+            **headers
+        )
+
+    def complete(self, session_id):
+        return self.client.post(reverse('upload-session-complete', args=[session_id]), {
+            'title': 'Long Take',
+            'album': str(self.album.id),
+            'artist': str(self.artist.id),
+        }, format='json')
+
+    def test_chunks_resume_and_finalize_into_ingest_job(self):
+        session_id = self.start(sha256=hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(self.put(session_id, 0, 1023).data['data']['received'], 1024)
+
+        # a retried/out-of-order chunk is refused with the offset to resume from
+        response = self.put(session_id, 2048, 2559)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['data']['received'], 1024)
+
+        status_response = self.client.get(reverse('upload-session-detail', args=[session_id]))
+        self.assertEqual(status_response.data['data']['received'], 1024)
+
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_409_CONFLICT)
+
+        self.put(session_id, 1024, 2047)
+        self.put(session_id, 2048, 2559)
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        run_worker(once=True)
+        job = IngestJob.objects.get(id=response.data['data']['id'])
+        self.assertEqual(job.status, IngestJob.SUCCEEDED)
+        self.assertEqual(job.song.title, 'Long Take')
+        self.assertEqual(UploadSession.objects.get(id=session_id).status, UploadSession.COMPLETE)
+        # finalizing twice does not queue a second job
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_409_CONFLICT)
+
+    def test_bad_chunk_checksum_is_discarded(self):
+        session_id = self.start()
+        response = self.put(session_id, 0, 1023, checksum='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get(id=session_id).received, 0)
+
+        good = hashlib.sha256(self.payload[:1024]).hexdigest()
+        self.assertEqual(self.put(session_id, 0, 1023, checksum=good).status_code, status.HTTP_200_OK)
+
+    def test_losing_duplicate_chunk_leaves_committed_bytes_alone(self):
+        session_id = self.start()
+        stale = UploadSession.objects.get(id=session_id)  # read before the winner committed
+        good = hashlib.sha256(self.payload[:1024]).hexdigest()
+        self.assertEqual(self.put(session_id, 0, 1023, checksum=good).status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(UploadError):
+            write_chunk(stale, io.BytesIO(b'x' * 1024), 0, 1024, checksum=good)
+        with self.assertRaises(UploadError) as raised:
+            write_chunk(stale, io.BytesIO(self.payload[:1024]), 0, 1024, checksum=good)
+        self.assertEqual(raised.exception.status_code, 409)
+
+        session = UploadSession.objects.get(id=session_id)
+        self.assertEqual(session.received, 1024)
+        with open(part_path(session), 'rb') as part:
+            self.assertEqual(part.read(), self.payload[:1024])
+        self.assertEqual(os.listdir(os.path.dirname(part_path(session))), [os.path.basename(part_path(session))])
+
+    def test_whole_file_checksum_checked_on_finalize(self):
+        session_id = self.start(sha256='0' * 64)
+        for start in range(0, len(self.payload), 1024):
+            self.put(session_id, start, min(start + 1023, len(self.payload) - 1))
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IngestJob.objects.count(), 0)
+
+    def test_oversized_chunk_rejected(self):
+        session_id = self.start()
+        self.assertEqual(self.put(session_id, 0, 2047).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AudioAnalysisTests(LocalStorageTestCase):
+    def write_click_track(self, bpm, seconds=40, sr=44100):
+        import librosa
+        import numpy as np
+        import soundfile
+
+        path = os.path.join(self.media_root, f'clicks-{bpm}.wav')
+        clicks = librosa.clicks(times=np.arange(0, seconds, 60 / bpm), sr=sr, length=sr * seconds)
+        soundfile.write(path, clicks.astype('float32'), sr)
+        return path
+
+    def test_streamed_tempo_matches_whole_file_estimate(self):
+        import librosa
+
+        path = self.write_click_track(128)
+        y, sr = librosa.load(path)
+        expected = librosa.feature.tempo(y=y, sr=sr)[0]
+
+        with override_settings(MUSIC_ANALYSIS_BLOCK_SECONDS=7):
+            analysis = analyze_audio(path)
+        self.assertAlmostEqual(analysis['bpm'], expected, places=3)
+        self.assertAlmostEqual(analysis['duration'], 40, places=1)
+        self.assertEqual(set(analysis['timings']), {
+            'header', 'decode', 'waveform', 'spectrum', 'tempo', 'features', 'fingerprint', 'loudness',
+        })
+        self.assertEqual(analysis['features'].shape, (FEATURE_DIM,))
+
+    def test_extract_metadata_updates_song(self):
+        song = Song.objects.create(title='Clicks', artist=self.artist, album=self.album, user=self.user)
+        analysis = song.extract_metadata(self.write_click_track(90))
+        song.refresh_from_db()
+        self.assertEqual(song.bpm, round(analysis['bpm']))
+        self.assertEqual(round(song.duration.total_seconds()), 40)
+
+    def test_unreadable_file_reports_failure(self):
+        path = os.path.join(self.media_root, 'noise.mp3')
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * 2048)
+        song = Song.objects.create(title='Noise', user=self.user)
+        self.assertIsNone(song.extract_metadata(path))
+
+    def test_analyze_songs_command_picks_up_missing_and_failed_songs(self):
+        songs = []
+        for bpm in (90, 128, 140):
+            path = self.write_click_track(bpm, seconds=20)
+            url = settings.MEDIA_URL + os.path.relpath(path, self.media_root)
+            songs.append(Song.objects.create(title=f'Clicks {bpm}', audio_url=url, user=self.user))
+        broken = Song.objects.create(title='Missing', audio_url='/media/nowhere.mp3', user=self.user)
+
+        out = io.StringIO()
+        call_command('analyze_songs', workers=2, batch_size=2, stdout=out)
+        self.assertIn('Analysed 3 songs, 1 failed', out.getvalue())
+        self.assertIn('tracks/s', out.getvalue())
+        for song in songs:
+            song.refresh_from_db()
+            self.assertIsNotNone(song.bpm)
+            self.assertEqual(song.sample_rate, 44100)
+            self.assertEqual(song.channels, 1)
+        broken.refresh_from_db()
+        self.assertIsNone(broken.bpm)
+
+        # a rerun only selects what is still missing, so just the failed song is tried again
+        out = io.StringIO()
+        call_command('analyze_songs', stdout=out)
+        self.assertIn('Analysed 0 songs, 1 failed', out.getvalue())
+
+        # every analysed song got a vector and a waveform
+        for song in songs:
+            self.assertIn(song.id, feature_store)
+            self.assertTrue(SongWaveform.objects.filter(song=song).exists())
+
+
+class SimilarSongsTests(LocalStorageTestCase):
+    def vector(self, *values):
+        import numpy as np
+
+        vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+        vector[:len(values)] = values
+        return vector / np.linalg.norm(vector)
+
+    def add_song(self, title, vector):
+        song = Song.objects.create(title=title, user=self.user, has_features=True)
+        feature_store.append([song.id], [vector])
+        return song
+
+    def test_ranks_by_cosine_similarity(self):
+        seed = self.add_song('Seed', self.vector(1, 0))
+        near = self.add_song('Near', self.vector(1, 0.1))
+        far = self.add_song('Far', self.vector(0, 1))
+        self.add_song('Middle', self.vector(1, 1))
+
+        response = self.client.get(reverse('song-similar', args=[seed.id]), {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual([row['title'] for row in data], ['Near', 'Middle'])
+        self.assertGreater(data[0]['similarity'], data[1]['similarity'])
+
+        # appends are picked up without a rebuild, and the newest vector wins
+        feature_store.append([far.id], [self.vector(1, 0.01)])
+        data = self.client.get(reverse('song-similar', args=[seed.id]), {'limit': 1}).data['data']
+        self.assertEqual(data[0]['id'], str(far.id))
+        self.assertNotEqual(data[0]['id'], str(near.id))
+
+    def test_only_the_callers_songs_are_candidates(self):
+        seed = self.add_song('Seed', self.vector(1, 0))
+        other = MusicUser.objects.create_user(
+            email='other@example.com', password='testpass123', first_name='O', last_name='U'
+        )
+        stranger = Song.objects.create(title='Theirs', user=other, has_features=True)
+        feature_store.append([stranger.id], [self.vector(1, 0)])
+        response = self.client.get(reverse('song-similar', args=[seed.id]))
+        self.assertEqual(response.data['data'], [])
+
+    def test_unanalysed_song_is_404(self):
+        song = Song.objects.create(title='Fresh', user=self.user)
+        response = self.client.get(reverse('song-similar', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_coarse_index_limits_scan_to_nearby_clusters(self):
+        import numpy as np
+
+        store = FeatureStore(os.path.join(self.media_root, 'coarse'))
+        rng = np.random.default_rng(1)
+        ids = [uuid.uuid4() for _ in range(200)]
+        centres = np.eye(FEATURE_DIM, dtype=np.float32)[:4]
+        vectors = centres[np.arange(200) % 4] + 0.05 * rng.standard_normal((200, FEATURE_DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        store.append(ids, vectors)
+        store.build_coarse_index(clusters=4, sample_size=200)
+
+        late = uuid.uuid4()
+        store.append([late], [vectors[0]])  # assigned to a cluster on append
+        with override_settings(MUSIC_FEATURE_COARSE_MIN_ROWS=10, MUSIC_FEATURE_NPROBE=1):
+            matches = store.similar(ids[0], ids + [late], limit=60)
+        self.assertEqual(matches[0][0], late)
+        self.assertEqual(len(matches), 50)  # only the query's own cluster was scanned
+        self.assertTrue(all(ids.index(song_id) % 4 == 0 for song_id, _ in matches[1:]))
+
+
+class WaveformTests(LocalStorageTestCase):
+    def test_streamed_peaks_match_whole_signal(self):
+        import numpy as np
+
+        signal = np.random.default_rng(3).uniform(-1, 1, 300000).astype(np.float32)
+        accumulator = WaveformAccumulator(max_points=64)
+        for start in range(0, len(signal), 7777):  # odd block size crosses bucket edges
+            accumulator.update(signal[start:start + 7777])
+        mins, maxs = accumulator.peaks()
+        self.assertLessEqual(len(mins), 2 * 64 + 1)
+        self.assertGreaterEqual(len(mins), 64)
+        self.assertEqual(mins.min(), signal.min())
+        self.assertEqual(maxs.max(), signal.max())
+
+        # each peak covers `bucket` samples, so the first one is exact
+        self.assertEqual(mins[0], signal[:accumulator.bucket].min())
+        self.assertEqual(maxs[0], signal[:accumulator.bucket].max())
+
+    def test_blob_round_trip(self):
+        import numpy as np
+
+        mins = np.linspace(-1, 0, 100, dtype=np.float32)
+        maxs = np.linspace(0, 1, 100, dtype=np.float32)
+        blob = encode_levels([resample(mins, maxs, 10), resample(mins, maxs, 50)])
+        coarse, fine = decode_levels(blob)
+        self.assertEqual((len(coarse), len(fine)), (20, 100))
+        self.assertEqual((coarse[0], coarse[1]), (-127, round(9 / 99 * 127)))
+
+    def test_endpoint_serves_requested_points_with_caching(self):
+        import numpy as np
+
+        song = Song.objects.create(title='Wave', user=self.user)
+        accumulator = WaveformAccumulator()
+        accumulator.update(np.sin(np.linspace(0, 200, 2000000)).astype(np.float32))
+        SongWaveform.objects.create(song=song, data=accumulator.encode())
+        url = reverse('song-waveform', args=[song.id])
+
+        response = self.client.get(url, {'points': 300})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['points'], 300)
+        self.assertEqual(len(response.data['data']['peaks']), 600)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        cached = self.client.get(url, {'points': 300}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(url, {'points': 100}, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_200_OK)
+
+    def test_unanalysed_song_is_404(self):
+        song = Song.objects.create(title='Fresh', user=self.user)
+        self.assertEqual(self.client.get(reverse('song-waveform', args=[song.id])).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FingerprintTests(LocalStorageTestCase):
+    def melody(self, seed, seconds=20, sr=44100):
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        t = np.arange(sr // 4) / sr
+        notes = []
+        for _ in range(seconds * 4):
+            pitch = rng.choice([220, 247, 262, 294, 330, 349, 392, 440, 494, 523, 587, 659])
+            notes.append(sum(np.sin(2 * np.pi * pitch * k * t) / k for k in (1, 2, 3)) * np.exp(-3 * t))
+        signal = np.concatenate(notes)
+        return signal / np.abs(signal).max() * 0.8
+
+    def add_song(self, title, signal, sr=44100):
+        import soundfile
+
+        path = os.path.join(self.media_root, f'{title}.wav')
+        soundfile.write(path, signal.astype('float32'), sr)
+        song = Song.objects.create(title=title, user=self.user)
+        song.extract_metadata(path)
+        return song
+
+    def test_re_encoded_copy_is_found_and_other_songs_are_not(self):
+        import numpy as np
+
+        original = self.melody(1)
+        song = self.add_song('Original', original)
+        # quieter, noisy and starting later: the same recording under another title
+        copy = np.concatenate([np.zeros(16000), original * 0.5])
+        copy += 0.02 * np.random.default_rng(0).standard_normal(len(copy))
+        duplicate = self.add_song('Original (upload)', copy)
+        self.add_song('Something else', self.melody(2))
+
+        self.assertTrue(song.fingerprint.hash_count > 0)
+        matches = find_duplicates_of(song)
+        self.assertEqual([song_id for song_id, _ in matches], [duplicate.id])
+
+        out = io.StringIO()
+        call_command('find_duplicates', user=self.user.email, stdout=out)
+        self.assertIn('Found 1 duplicate clusters covering 2 songs', out.getvalue())
+        self.assertIn('Original (upload)', out.getvalue())
+
+
+class LoudnessTests(LocalStorageTestCase):
+    def sine(self, amplitude, seconds=10, sr=48000, channels=2, frequency=1000, phase=0.0):
+        import numpy as np
+
+        t = np.arange(sr * seconds) / sr
+        tone = (amplitude * np.sin(2 * np.pi * frequency * t + phase)).astype(np.float32)
+        return np.repeat(tone[:, None], channels, axis=1)
+
+    def test_reference_tone_levels(self):
+        # BS.1770: a full-scale-relative 1 kHz sine reads the same at any rate,
+        # and a stereo pair is 3 LU louder than either channel alone
+        for sr in (22050, 44100, 48000):
+            meter = LoudnessMeter(sr, 2)
+            signal = self.sine(0.1, sr=sr)
+            for start in range(0, len(signal), 12345):
+                meter.update(signal[start:start + 12345])
+            self.assertAlmostEqual(meter.result()['loudness_lufs'], -20.0, delta=0.05)
+        meter = LoudnessMeter(48000, 1)
+        meter.update(self.sine(0.1, channels=1))
+        self.assertAlmostEqual(meter.result()['loudness_lufs'], -23.0, delta=0.05)
+
+    def test_true_peak_sees_between_samples(self):
+        import numpy as np
+
+        # fs/4 at 45 degrees: every sample is at 0.707 of the real peak
+        meter = LoudnessMeter(48000, 1)
+        signal = self.sine(0.5, frequency=12000, channels=1, phase=np.pi / 4)
+        meter.update(signal)
+        result = meter.result()
+        self.assertLess(20 * np.log10(np.abs(signal).max()), -8.9)
+        self.assertAlmostEqual(result['true_peak_dbtp'], -6.02, delta=0.3)
+
+    def test_gain_respects_true_peak_ceiling(self):
+        self.assertEqual(suggested_gain(-20.0, -10.0, target=-14.0, ceiling=-1.0), 6.0)
+        self.assertEqual(suggested_gain(-20.0, -3.0, target=-14.0, ceiling=-1.0), 2.0)
+        self.assertIsNone(suggested_gain(None, None))
+
+    def test_loudness_stage_backfill_and_serializer(self):
+        import soundfile
+
+        path = os.path.join(self.media_root, 'tone.wav')
+        soundfile.write(path, self.sine(0.1, sr=44100), 44100)
+        url = settings.MEDIA_URL + os.path.relpath(path, self.media_root)
+        song = Song.objects.create(title='Tone', audio_url=url, user=self.user, bpm=120)
+
+        analysis = analyze_audio(path, stages=('loudness',))
+        self.assertEqual(set(analysis['timings']), {'header', 'decode', 'loudness'})
+        self.assertNotIn('bpm', analysis)
+
+        out = io.StringIO()
+        call_command('analyze_songs', stage=['loudness'], workers=1, stdout=out)
+        self.assertIn('Analysed 1 songs', out.getvalue())
+        song.refresh_from_db()
+        self.assertAlmostEqual(song.loudness_lufs, -20.0, delta=0.05)
+        self.assertAlmostEqual(song.replay_gain_db, 6.0, delta=0.05)
+        self.assertEqual(song.bpm, 120)  # other stages untouched
+        self.assertFalse(SongWaveform.objects.filter(song=song).exists())
+
+        response = self.client.get(reverse('song-detail', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(response.data['data']['loudness_lufs'], -20.0, delta=0.05)
+
+
+class SongTagTests(LocalStorageTestCase):
+    def tagged_flac(self, title, seconds=2):
+        import numpy as np
+        import soundfile
+        from mutagen.flac import FLAC
+
+        path = os.path.join(self.media_root, f'{title}.flac')
+        soundfile.write(path, np.zeros((44100 * seconds, 2), dtype=np.float32), 44100)
+        audio = FLAC(path)
+        audio['title'], audio['artist'], audio['tracknumber'] = title, 'Band', '3'
+        audio.save()
+        return path
+
+    def upload(self, path):
+        with open(path, 'rb') as f:
+            return SimpleUploadedFile(os.path.basename(path), f.read(), content_type='audio/flac')
+
+    def test_single_file_tags(self):
+        response = self.client.post(reverse('song-tag'), {'file': self.upload(self.tagged_flac('One'))}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metadata = response.data['metadata']
+        self.assertEqual((metadata['title'], metadata['artist'], metadata['track_number']), ('One', 'Band', '3'))
+        self.assertEqual(metadata['duration'], 2.0)
+        self.assertEqual(metadata['sample_rate'], 44100)
+
+        junk = self.client.post(reverse('song-tag'), {'file': io.BytesIO(b'not audio')}, format='multipart')
+        self.assertEqual(junk.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_reports_each_file(self):
+        paths = [self.tagged_flac(title) for title in ('A', 'B', 'C')]
+        # Django spools a request body over FILE_UPLOAD_MAX_MEMORY_SIZE to temp
+        # files and keeps a smaller one in memory; check both paths
+        for max_memory_size in (100, 10 * 1024 * 1024):
+            files = [self.upload(path) for path in paths]
+            files.insert(1, SimpleUploadedFile('notes.txt', b'not audio'))
+            with self.subTest(max_memory_size=max_memory_size), \
+                    self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=max_memory_size):
+                response = self.client.post(reverse('song-tag-batch'), {'files': files}, format='multipart')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                results = response.data['results']
+                self.assertEqual([result['file'] for result in results], ['A.flac', 'notes.txt', 'B.flac', 'C.flac'])
+                self.assertEqual([result['success'] for result in results], [True, False, True, True])
+                self.assertEqual(results[3]['metadata']['title'], 'C')
+
+        with self.settings(MUSIC_TAG_BATCH_MAX_FILES=2):
+            response = self.client.post(
+                reverse('song-tag-batch'), {'files': [self.upload(self.tagged_flac('D'))] * 3}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OriginServerTestCase(LocalStorageTestCase):
+    """Serves files from `self.origin` over real HTTP, standing in for a remote host."""
+
+    def setUp(self):
+        import functools
+        import threading
+        from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+        super().setUp()
+        self.origin = os.path.join(self.media_root, 'origin')
+        os.makedirs(self.origin)
+        class QuietHandler(SimpleHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        handler = functools.partial(QuietHandler, directory=self.origin)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.handle_error = lambda request, address: None  # clients hanging up early is expected
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def serve(self, name, data):
+        with open(os.path.join(self.origin, name), 'wb') as f:
+            f.write(data)
+        return f'http://127.0.0.1:{self.server.server_port}/{name}'
+
+
+class SongStreamTests(OriginServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hosts_override = override_settings(MUSIC_AUDIO_FETCH_HOSTS=('127.0.0.1',))
+        self.hosts_override.enable()
+        audio_cache.stats.clear()
+
+    def tearDown(self):
+        self.hosts_override.disable()
+        super().tearDown()
+
+    def remote_song(self, name, data):
+        return Song.objects.create(title=name, audio_url=self.serve(name, data), user=self.user)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-5000', 1000), (990, 999))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=1000-', 1000)
+
+    def test_ranges_served_from_cache(self):
+        data = os.urandom(100000)
+        song = self.remote_song('track.mp3', data)
+        url = reverse('song-stream', args=[song.id])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1999/100000')
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self.body(response), data[1000:2000])
+
+        # the origin is gone, but the cache still has it
+        os.remove(os.path.join(self.origin, 'track.mp3'))
+        full = self.client.get(url)
+        self.assertEqual(full.status_code, status.HTTP_200_OK)
+        self.assertEqual(full['X-Cache'], 'HIT')
+        self.assertEqual(self.body(full), data)
+        self.assertEqual((audio_cache.stats['hits'], audio_cache.stats['misses']), (1, 1))
+
+        # a stale If-Range gets the whole (new) file instead of a mismatched slice
+        stale = self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+        fresh = self.client.get(url, HTTP_RANGE='bytes=-10', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(self.body(fresh), data[-10:])
+
+        unsatisfiable = self.client.get(url, HTTP_RANGE='bytes=200000-')
+        self.assertEqual(unsatisfiable.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(unsatisfiable['Content-Range'], 'bytes */100000')
+
+    def test_only_allowed_hosts_are_fetched(self):
+        song = self.remote_song('track.mp3', b'audio')
+        song.audio_url = song.audio_url.replace('127.0.0.1', 'localhost')
+        song.save()
+        response = self.client.get(reverse('song-stream', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(audio_cache.stats['misses'], 0)
+
+        # nor can an allowed host redirect the cache somewhere else
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        target = self.serve('track.mp3', b'audio')
+
+        class RedirectHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(302)
+                self.send_header('Location', target)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        redirector = ThreadingHTTPServer(('127.0.0.1', 0), RedirectHandler)
+        threading.Thread(target=redirector.serve_forever, daemon=True).start()
+        self.addCleanup(redirector.server_close)
+        self.addCleanup(redirector.shutdown)
+        song.audio_url = f'http://localhost:{redirector.server_port}/track.mp3'
+        song.save()
+        with self.settings(MUSIC_AUDIO_FETCH_HOSTS=('localhost',)):
+            response = self.client.get(reverse('song-stream', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertIn('redirects outside', response.data['message'])
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = AudioCache(os.path.join(self.media_root, 'lru'), max_bytes=25000)
+        songs = [self.remote_song(f'{name}.mp3', os.urandom(10000)) for name in 'abc']
+        first, _ = cache.get(songs[0].audio_url)
+        time.sleep(0.01)
+        cache.get(songs[1].audio_url)
+        time.sleep(0.01)
+        self.assertTrue(cache.get(songs[0].audio_url)[1])  # a hit makes it the most recent
+        time.sleep(0.01)
+        cache.get(songs[2].audio_url)  # 30000 bytes > 25000: b goes
+        names = sorted(os.path.basename(path) for _, _, path in cache.entries())
+        self.assertEqual(names, sorted(AudioCache.key_for(songs[i].audio_url) for i in (0, 2)))
+        self.assertEqual(cache.stats['evictions'], 1)
+        locks = sorted(name for name in os.listdir(cache.directory) if name.endswith('.lock'))
+        self.assertEqual(locks, sorted(f'.{AudioCache.key_for(songs[i].audio_url)}.lock' for i in (0, 2)))
+
+    def test_cache_stats_are_logged(self):
+        song = self.remote_song('track.mp3', b'audio')
+        cache = AudioCache(os.path.join(self.media_root, 'stats'))
+        cache.get(song.audio_url)
+        with self.settings(MUSIC_AUDIO_CACHE_STATS_INTERVAL=0), self.assertLogs('music.streaming', 'INFO') as logs:
+            cache.get(song.audio_url)
+        self.assertEqual(logs.output, [
+            'INFO:music.streaming:Audio cache: 1 hits, 1 misses (50% hit rate), 5 bytes fetched, 0 evictions'
+        ])
+
+    def test_missing_audio_is_not_found(self):
+        song = Song.objects.create(title='Gone', audio_url='/media/local_storage/songs/gone.mp3', user=self.user)
+        response = self.client.get(reverse('song-stream', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # evicted between the cache lookup and the open
+        song = self.remote_song('track.mp3', b'audio')
+        with mock.patch.object(audio_cache, 'get', return_value=(os.path.join(self.media_root, 'evicted.mp3'), True)):
+            response = self.client.get(reverse('song-stream', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HLSTests(LocalStorageTestCase):
+    def ready_song(self):
+        song = Song.objects.create(title='Ladder', user=self.user)
+        SongHLS.objects.create(song=song, status=SongHLS.READY, renditions=[
+            {'name': '64k', 'bitrate': 64000, 'bandwidth': 70000},
+            {'name': '128k', 'bitrate': 128000, 'bandwidth': 140000},
+        ])
+        for name in ('64k', '128k'):
+            directory = os.path.join(song_directory(song.id), name)
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'index.m3u8'), 'w') as f:
+                f.write('#EXTM3U\n#EXTINF:6.0,\nseg00000.ts\n#EXT-X-ENDLIST\n')
+            with open(os.path.join(directory, 'seg00000.ts'), 'wb') as f:
+                f.write(b'G' * 188)
+        return song
+
+    def test_ladder_never_upscales(self):
+        with self.settings(MUSIC_HLS_LADDER=(192, 64, 128)):
+            self.assertEqual(ladder_for(320000), (64, 128, 192))
+            self.assertEqual(ladder_for(128000), (64, 128))
+            self.assertEqual(ladder_for(32000), (64,))
+            self.assertEqual(ladder_for(None), (64, 128, 192))
+
+    def test_one_ffmpeg_run_encodes_every_rung(self):
+        command = ffmpeg_command('in.mp3', '/out', (64, 128), 6)
+        self.assertEqual(command.count('-i'), 1)
+        self.assertEqual(command[command.index('-var_stream_map') + 1], 'a:0,name:64k a:1,name:128k')
+        self.assertIn('128k', command)
+
+    def test_manifest_and_segments(self):
+        song = self.ready_song()
+        response = self.client.get(reverse('song-hls', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        manifest = response.content.decode()
+        self.assertTrue(manifest.startswith('#EXTM3U'))
+        self.assertIn('BANDWIDTH=140000', manifest)
+        self.assertEqual([line for line in manifest.splitlines() if not line.startswith('#')],
+                         ['64k/index.m3u8', '128k/index.m3u8'])
+
+        segment = self.client.get(reverse('song-hls-file', args=[song.id, '64k', 'seg00000.ts']))
+        self.assertEqual(segment['Content-Type'], 'video/mp2t')
+        self.assertEqual(b''.join(segment.streaming_content), b'G' * 188)
+        missing = self.client.get(reverse('song-hls-file', args=[song.id, '256k', 'index.m3u8']))
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pending_song_has_no_manifest(self):
+        song = Song.objects.create(title='Queued', user=self.user)
+        SongHLS.objects.create(song=song)
+        response = self.client.get(reverse('song-hls', args=[song.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['data']['status'], SongHLS.PENDING)
+
+    def test_transcoder_records_failures(self):
+        song = Song.objects.create(title='Silent', user=self.user)
+        SongHLS.objects.create(song=song)
+        self.assertEqual(run_transcoder(workers=2), (0, 1))
+        hls = SongHLS.objects.get(song=song)
+        self.assertEqual(hls.status, SongHLS.FAILED)
+        self.assertIn('no audio', hls.error)
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_transcode_command(self):
+        import numpy as np
+        import soundfile
+
+        path = os.path.join(self.media_root, 'tone.wav')
+        soundfile.write(path, np.zeros((44100 * 15, 2), dtype=np.float32), 44100)
+        song = Song.objects.create(title='Tone', user=self.user, bitrate=1411000,
+                                   audio_url=settings.MEDIA_URL + 'tone.wav')
+        out = io.StringIO()
+        call_command('transcode_songs', all=True, stdout=out)
+        self.assertIn('Transcoded 1 songs, 0 failed', out.getvalue())
+        hls = SongHLS.objects.get(song=song)
+        self.assertEqual([r['name'] for r in hls.renditions], ['64k', '128k', '192k'])
+        self.assertTrue(os.path.exists(os.path.join(song_directory(song.id), '128k', 'index.m3u8')))
+
+
+class AssetTransferTests(OriginServerTestCase):
+    def test_audio_is_stored_and_attached(self):
+        data = os.urandom(50000)
+        song = Song.objects.create(title='Remote', user=self.user, audio_url='http://example.invalid/stream.mp3')
+        missing = f'http://127.0.0.1:{self.server.server_port}/gone.mp3'
+        queue_transfers([transfer_for(song, 'audio_file', missing, self.serve('track.mp3', data)), None])
+
+        out = io.StringIO()
+        call_command('run_transfer_worker', once=True, stdout=out)
+        self.assertIn('Transferred 1 assets, 0 failed', out.getvalue())
+        song.refresh_from_db()
+        self.assertTrue(song.audio_url.startswith('/media/local_storage/songs/'))  # fell back to the second URL
+        self.assertEqual(song.audio_sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(AssetTransfer.objects.get().status, AssetTransfer.SUCCEEDED)
+
+        # the same bytes for another song reuse the stored file instead of uploading again
+        other = Song.objects.create(title='Same', user=self.user)
+        queue_transfers([transfer_for(other, 'audio_file', self.serve('copy.mp3', data))])
+        AssetTransferrer().run(once=True)
+        other.refresh_from_db()
+        self.assertEqual(other.audio_url, song.audio_url)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'local_storage', 'songs'))), 1)
+
+    def test_failures_are_retried_then_given_up(self):
+        song = Song.objects.create(title='Broken', user=self.user)
+        queue_transfers([transfer_for(song, 'art', f'http://127.0.0.1:{self.server.server_port}/nothing.jpg')])
+        with self.settings(MUSIC_TRANSFER_MAX_ATTEMPTS=2, MUSIC_TRANSFER_RETRIES=0):
+            self.assertEqual(AssetTransferrer().run(once=True), (0, 1))
+        transfer = AssetTransfer.objects.get()
+        self.assertEqual((transfer.status, transfer.attempts), (AssetTransfer.FAILED, 2))
+        self.assertIn('404', transfer.error)
+
+    def test_host_limit(self):
+        limiter = HostLimiter(2)
+        self.assertIs(limiter('a.example'), limiter('a.example'))
+        self.assertIsNot(limiter('a.example'), limiter('b.example'))
+        semaphore = limiter('a.example')
+        self.assertTrue(semaphore.acquire(blocking=False))
+        self.assertTrue(semaphore.acquire(blocking=False))
+        self.assertFalse(semaphore.acquire(blocking=False))
+
+    def test_streamed_transfer_memory_is_bounded(self):
+        data = os.urandom(16 * 1024 * 1024)
+        url = self.serve('big.mp3', data)
+        session = requests.Session()
+        with tempfile.TemporaryFile() as target:
+            tracemalloc.start()
+            try:
+                size, sha256 = stream_to_file(session, url, target, block_size=64 * 1024)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        self.assertEqual((size, sha256), (len(data), hashlib.sha256(data).hexdigest()))
+        self.assertLess(peak, 2 * 1024 * 1024)  # a few blocks, not the 16 MB file
+
+        # refused from Content-Length, before a byte is written
+        with tempfile.TemporaryFile() as target:
+            with self.assertRaises(TransferTooLarge):
+                stream_to_file(session, url, target, max_bytes=1024 * 1024)
+            self.assertEqual(target.tell(), 0)
+
+    def test_oversized_file_is_not_retried(self):
+        song = Song.objects.create(title='Huge', user=self.user)
+        queue_transfers([transfer_for(song, 'art', self.serve('huge.jpg', b'x' * 4096))])
+        with self.settings(MUSIC_TRANSFER_MAX_IMAGE_BYTES=1024):
+            self.assertEqual(AssetTransferrer().run(once=True), (0, 1))
+        transfer = AssetTransfer.objects.get()
+        self.assertEqual((transfer.status, transfer.attempts), (AssetTransfer.FAILED, 1))
+        self.assertIn('byte limit', transfer.error)
+
+
+class JamendoClientTests(OriginServerTestCase):
+    def response(self, *names):
+        return json.dumps({'headers': {'status': 'success'}, 'results': [{'name': name} for name in names]}).encode()
+
+    def test_stale_while_revalidate(self):
+        url = self.serve('tracks.json', self.response('First'))
+        client = JamendoClient(base_url=url, ttl=0, stale_ttl=60, retries=0)
+        self.assertEqual(client.tracks('pop', 5)['results'][0]['name'], 'First')
+
+        self.serve('tracks.json', self.response('Second'))
+        # past its TTL: the cached copy comes back at once and is refreshed behind it
+        self.assertEqual(client.tracks('pop', 5)['results'][0]['name'], 'First')
+        for _ in range(100):
+            if not client.refreshing:
+                break
+            time.sleep(0.02)
+        self.assertEqual(client.tracks('pop', 5)['results'][0]['name'], 'Second')
+        self.assertEqual((client.stats['misses'], client.stats['stale']), (1, 2))
+
+        # other keys are cached separately
+        client.tracks('pop', 10)
+        self.assertEqual(client.stats['misses'], 2)
+
+    def test_expired_response_is_served_when_jamendo_is_down(self):
+        url = self.serve('tracks.json', self.response('Cached'))
+        client = JamendoClient(base_url=url, ttl=0, stale_ttl=0, retries=0)
+        client.tracks('rock', 5)
+        os.remove(os.path.join(self.origin, 'tracks.json'))
+        self.assertEqual(client.tracks('rock', 5)['results'][0]['name'], 'Cached')
+        self.assertEqual(client.stats['errors'], 1)
+        with self.assertRaises(requests.HTTPError):
+            client.tracks('jazz', 5)
+
+    def test_stats_are_logged(self):
+        url = self.serve('tracks.json', self.response('Logged'))
+        client = JamendoClient(base_url=url, retries=0, stats_interval=0)
+        with self.assertLogs('music.api', 'INFO') as logs:
+            client.tracks('pop', 5)
+            client.tracks('pop', 5)
+        self.assertEqual(logs.output[-1], 'INFO:music.api:Jamendo client: 1 hits, 0 stale, 1 misses, 0 errors')
+
+    def test_recorded_responses_replay_offline(self):
+        record_dir = os.path.join(self.media_root, 'recorded')
+        url = self.serve('tracks.json', self.response('A', 'B', 'C'))
+        JamendoClient(base_url=url, record_dir=record_dir, retries=0).tracks('pop', 3)
+
+        fixtures = FixtureJamendoClient(record_dir)
+        self.assertEqual([track['name'] for track in fixtures.tracks('pop', 2)['results']], ['A', 'B'])
+        self.assertEqual(fixtures.tracks('metal', 2)['results'], [])
+
+
+@override_settings(MUSIC_JAMENDO_CLIENT='music.api.FixtureJamendoClient', MUSIC_DISCOVER_GENRES=('pop', 'rock'))
+class DiscoverPrefetchTests(LocalStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        get_jamendo_client.cache_clear()
+        self.addCleanup(get_jamendo_client.cache_clear)
+        last_noted.clear()  # the request throttle lives for the whole process
+
+    def test_prefetch_fills_pools_and_discover_reads_them(self):
+        out = io.StringIO()
+        call_command('prefetch_discover', stdout=out)
+        self.assertIn('Refreshed 2 genres, 0 failed', out.getvalue())
+        self.assertEqual(DiscoverPool.objects.get(genre='pop').track_count, 6)
+        self.assertEqual(pool_songs('rock').count(), 4)
+        # catalog rows belong to no user; artwork and audio wait for the transfer worker
+        self.assertFalse(Song.objects.filter(source='jamendo', user__isnull=False).exists())
+        self.assertTrue(AssetTransfer.objects.filter(model='song', field='audio_file').exists())
+
+        # the endpoint never calls Jamendo: an unloadable client would raise
+        get_jamendo_client.cache_clear()
+        with self.settings(MUSIC_JAMENDO_CLIENT='music.api.NoSuchClient'):
+            response = self.client.get(reverse('discover-songs'), {'genre': 'pop', 'limit': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [song['id'] for song in response.data['data']],
+            [str(song_id) for song_id in pool_songs('pop').values_list('id', flat=True)[:4]],
+        )
+
+    def test_freshness_policy(self):
+        call_command('prefetch_discover', stdout=io.StringIO())
+        self.assertEqual(genres_due(), [])
+        later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=7)
+        self.assertEqual(genres_due(later), ['pop', 'rock'])
+        with self.settings(MUSIC_DISCOVER_MAX_AGE=0):
+            self.assertEqual(genres_due(), ['pop', 'rock'])
+
+        # a refresh replaces the pool and reuses the catalog rows already there
+        call_command('prefetch_discover', genres=['pop'], stdout=io.StringIO())
+        self.assertEqual(pool_songs('pop').count(), 6)
+        self.assertEqual(Song.objects.filter(source='jamendo').count(), 10)
+
+    def test_requested_genres_are_warmed_next(self):
+        # an arbitrary genre is answered but not recorded, so it can't spend API quota
+        response = self.client.get(reverse('discover-songs'), {'genre': 'Lo-fi'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data'], [])  # no pool and no songs of the user's own in the genre
+        self.assertFalse(DiscoverPool.objects.filter(genre='lo-fi').exists())
+        self.assertEqual(genres_due(), ['pop', 'rock'])
+
+        # once it has a pool, demand for it is recorded, at most once per interval
+        DiscoverPool.objects.create(genre='lo-fi')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('discover-songs'), {'genre': 'Lo-fi'})
+            self.client.get(reverse('discover-songs'), {'genre': 'Lo-fi'})
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+        self.assertEqual(genres_due(), ['lo-fi', 'pop', 'rock'])
+
+        # a genre Jamendo can't serve is retried only after MUSIC_DISCOVER_RETRY_AFTER
+        get_jamendo_client.cache_clear()
+        with self.settings(MUSIC_JAMENDO_CLIENT='music.api.NoSuchClient'), self.assertLogs('music.discover', 'WARNING'):
+            refreshed, failed = run_prefetcher(genres=['lo-fi'])
+        self.assertEqual((refreshed, failed), (0, 1))
+        self.assertNotIn('lo-fi', genres_due())
+
+
+class CatalogIngestTests(LocalStorageTestCase):
+    def test_page_is_ingested_in_a_fixed_number_of_queries(self):
+        tracks = synthetic_tracks(200)
+        with CaptureQueriesContext(connection) as queries:
+            songs = ingest_tracks(tracks + tracks[:3])  # repeats within a page map to one row
+        self.assertLess(len(queries), 40)
+        self.assertEqual(len(songs), 203)
+        self.assertEqual(songs[200].pk, songs[0].pk)
+        self.assertEqual(Song.objects.filter(source='jamendo').count(), 200)
+        self.assertEqual(Album.objects.filter(user__isnull=True).count(), 20)
+        self.assertEqual(songs[11].album.artist, songs[0].artist)
+        self.assertEqual(AssetTransfer.objects.filter(model='song').count(), 400)
+        self.assertEqual(SongHLS.objects.filter(status=SongHLS.PENDING, song__source='jamendo').count(), 200)
+        # bulk_create sends no post_save, so indexing happens in the ingest
+        self.assertEqual(get_search_backend().search('Track 42', kinds={'song'})[0], ('song', songs[42].pk))
+
+        # a second pass overlapping the first reuses what is there
+        with CaptureQueriesContext(connection) as queries:
+            again = ingest_tracks(synthetic_tracks(100, start=150))
+        self.assertLess(len(queries), 20)
+        self.assertEqual(again[0].pk, songs[150].pk)
+        self.assertEqual(Song.objects.filter(source='jamendo').count(), 250)
+        self.assertEqual(SongHLS.objects.count(), 250)
+        self.assertEqual(Artist.objects.filter(name='Bench Artist 3').count(), 1)
+
+    def test_losing_a_race_reuses_the_winners_artist_and_album(self):
+        track, = tracks = synthetic_tracks(1)
+        artist_bulk_create, album_bulk_create = Artist.objects.bulk_create, Album.objects.bulk_create
+
+        # another ingest commits the same rows between our lookups and inserts
+        def artist_first(objs, **kwargs):
+            Artist.objects.create(name=track['artist_name'], user=None)
+            return artist_bulk_create(objs, **kwargs)
+
+        def album_first(objs, **kwargs):
+            Album.objects.create(title=track['album_name'], artist=Artist.objects.get(user=None), user=None,
+                                 release_date='2020-01-01', genre='pop')
+            return album_bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Artist.objects, 'bulk_create', artist_first), \
+                mock.patch.object(Album.objects, 'bulk_create', album_first):
+            song, = ingest_tracks(tracks)
+        self.assertEqual(Artist.objects.filter(user__isnull=True).count(), 1)
+        self.assertEqual(Album.objects.filter(user__isnull=True).count(), 1)
+        self.assertEqual((song.artist, song.album), (Artist.objects.get(user__isnull=True), Album.objects.get(user__isnull=True)))
+        # artwork is only queued for rows this ingest created
+        self.assertEqual(set(AssetTransfer.objects.values_list('model', flat=True)), {'song'})
+
+    def test_benchmark_rolls_back(self):
+        out = io.StringIO()
+        call_command('benchmark_ingest', tracks=100, page_size=50, stdout=out)
+        self.assertIn('per 1,000 tracks', out.getvalue())
+        self.assertFalse(Song.objects.filter(source='jamendo').exists())
+
+
+@override_settings(MUSIC_JAMENDO_CLIENT='music.api.FixtureJamendoClient')
+class CrawlerTests(LocalStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        get_jamendo_client.cache_clear()
+        self.addCleanup(get_jamendo_client.cache_clear)
+
+    def test_crawl_resumes_from_its_checkpoint(self):
+        ingested, _ = Crawler(genres=['pop'], page_size=2, concurrency=2, rate=100, limit=4).run()
+        self.assertEqual(ingested, 4)
+        checkpoint = CrawlCheckpoint.objects.get(genre='pop')
+        self.assertEqual((checkpoint.offset, checkpoint.finished), (4, False))
+
+        out = io.StringIO()
+        call_command('fetch_songs', genres=['pop', 'rock'], page_size=2, concurrency=3, rate=100, batch_size=3, stdout=out)
+        self.assertIn('Successfully fetched 6 songs', out.getvalue())  # the last 2 of pop and all 4 of rock
+        self.assertIn('tracks/s', out.getvalue())
+        self.assertEqual(Song.objects.filter(source='jamendo').count(), 10)
+        self.assertEqual(
+            list(CrawlCheckpoint.objects.order_by('genre').values_list('genre', 'offset', 'finished')),
+            [('pop', 6, True), ('rock', 4, True)],
+        )
+
+        # finished genres are skipped until --restart
+        self.assertEqual(Crawler(genres=['pop', 'rock'], rate=100).run()[0], 0)
+        self.assertEqual(Crawler(genres=['rock'], page_size=3, rate=100, restart=True).run()[0], 4)
+        self.assertEqual(Song.objects.filter(source='jamendo').count(), 10)
+
+    def test_token_bucket_limits_the_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)  # one token up front, then one per 20ms
+
+
+@override_settings(MUSIC_JAMENDO_CLIENT='music.api.FixtureJamendoClient')
+class SharedCatalogTests(LocalStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        get_jamendo_client.cache_clear()
+        self.addCleanup(get_jamendo_client.cache_clear)
+        self.other = MusicUser.objects.create_user(
+            email='other@example.com', password='testpass123', first_name='Other', last_name='User'
+        )
+        self.own = Song.objects.create(title='Mine', user=self.user, artist=self.artist, album=self.album)
+
+    def test_users_share_one_row_per_external_track(self):
+        call_command('prefetch_discover', genres=['pop'], stdout=io.StringIO())
+        call_command('fetch_songs', genres=['pop'], page_size=4, rate=100, stdout=io.StringIO())
+        self.assertEqual(Song.objects.filter(source='jamendo').count(), 6)
+        catalog = pool_songs('pop').first()
+
+        response = self.client.post(reverse('song-library', kwargs={'pk': catalog.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        listed = {song['id'] for song in self.client.get(reverse('song-list')).data['data']}
+        self.assertEqual(listed, {str(self.own.pk), str(catalog.pk)})
+
+        # anyone may play a catalog song or put it in a playlist; nobody may edit it
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(reverse('song-list')).data['data'], [])
+        self.assertEqual(self.client.get(reverse('song-detail', kwargs={'pk': catalog.pk})).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('song-detail', kwargs={'pk': self.own.pk})).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.patch(reverse('song-detail', kwargs={'pk': catalog.pk}), {'title': 'Renamed'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        playlist = Playlist.objects.create(name='Mix', user=self.other)
+        response = self.client.post(reverse('playlist-detail', kwargs={'pk': playlist.pk}), {'song_id': catalog.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(playlist.songs.all()), [catalog])
+
+        # deleting it from a library only drops the link
+        self.client.force_authenticate(self.user)
+        response = self.client.delete(reverse('song-detail', kwargs={'pk': catalog.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(LibraryEntry.objects.exists())
+        self.assertTrue(Song.objects.filter(pk=catalog.pk).exists())
+
+    def test_song_owner_cannot_be_changed_through_the_api(self):
+        url = reverse('song-detail', kwargs={'pk': self.own.pk})
+        for user in ('', str(self.other.pk)):
+            response = self.client.patch(url, {'user': user, 'title': 'Still mine'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['data']['user'], self.user.pk)
+        self.own.refresh_from_db()
+        self.assertEqual((self.own.user, self.own.title), (self.user, 'Still mine'))
+
+    def test_catalog_artists_and_albums_follow_the_library(self):
+        songs = ingest_tracks(synthetic_tracks(2) + synthetic_tracks(1, start=50))
+        LibraryEntry.objects.create(user=self.user, song=songs[0])
+        LibraryEntry.objects.create(user=self.user, song=songs[1])  # same artist and album: listed once
+        catalog, elsewhere = songs[0], songs[2]
+
+        listed = [artist['id'] for artist in self.client.get(reverse('artist-list')).data['data']]
+        self.assertEqual(listed, [str(catalog.artist_id), str(self.artist.pk)])
+        listed = {album['id'] for album in self.client.get(reverse('album-list')).data['data']}
+        self.assertEqual(listed, {str(catalog.album_id), str(self.album.pk)})
+
+        # catalog rows can be read by anyone, library or not, but changed by no one
+        for name, row in (('artist-detail', elsewhere.artist), ('album-detail', elsewhere.album)):
+            url = reverse(name, kwargs={'pk': row.pk})
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.patch(url, {'name': 'Renamed', 'title': 'Renamed'}).status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(reverse('artist-list')).data['data'], [])
+        self.assertEqual(self.client.get(reverse('artist-detail', kwargs={'pk': self.artist.pk})).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_migration_merges_per_user_copies(self):
+        copies = {}
+        for user in (self.user, self.other):
+            artist = Artist.objects.create(name='Band', user=user)
+            album = Album.objects.create(title='Record', artist=artist, user=user, release_date='2020-01-01', genre='pop')
+            copies[user] = Song.objects.create(
+                title='Track', user=user, artist=artist, album=album, source='jamendo', external_id='42'
+            )
+        first, second = copies[self.user], copies[self.other]
+        own = Song.objects.create(title='Demo', user=self.user, artist=first.artist)  # keeps that artist around
+        playlist = Playlist.objects.create(name='Mix', user=self.other)
+        playlist.songs.add(second)
+
+        migration = importlib.import_module('music.migrations.0015_shared_catalog')
+        migration.merge_external_copies(django_apps, None)
+
+        catalog = Song.objects.get(source='jamendo', external_id='42')
+        self.assertEqual((catalog.pk, catalog.user_id), (first.pk, None))
+        self.assertEqual(set(LibraryEntry.objects.values_list('user_id', flat=True)), {self.user.pk, self.other.pk})
+        self.assertEqual(list(playlist.songs.all()), [catalog])
+        self.assertEqual(set(Song.objects.in_library(self.other)), {catalog})
+
+        # the catalog song's artist and album are shared rows now; copies left empty are gone
+        self.assertEqual((catalog.artist.user_id, catalog.artist.name), (None, 'Band'))
+        self.assertEqual((catalog.album.user_id, catalog.album.artist_id), (None, catalog.artist_id))
+        self.assertEqual(list(Artist.objects.filter(name='Band').exclude(pk=catalog.artist_id)), [first.artist])
+        self.assertEqual(Song.objects.get(pk=own.pk).artist_id, first.artist_id)
+        self.assertEqual(list(Album.objects.filter(title='Record')), [catalog.album])
@@ -0,0 +1,218 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# AAC-LC; what every HLS player decodes
+AUDIO_CODECS = 'mp4a.40.2'
+PLAYLIST = 'index.m3u8'
+
+
+def hls_dir():
+    return getattr(settings, 'MUSIC_HLS_DIR', os.path.join(settings.MEDIA_ROOT, 'hls'))
+
+
+def hls_ladder():
+    """Rendition bitrates in kbit/s, lowest first."""
+    return tuple(sorted(getattr(settings, 'MUSIC_HLS_LADDER', (64, 128, 192))))
+
+
+def hls_segment_seconds():
+    return getattr(settings, 'MUSIC_HLS_SEGMENT_SECONDS', 6)
+
+
+def transcode_workers():
+    return getattr(settings, 'MUSIC_TRANSCODE_WORKERS', 2)
+
+
+def transcode_timeout():
+    return timedelta(seconds=getattr(settings, 'MUSIC_TRANSCODE_TIMEOUT', 600))
+
+
+def song_directory(song_id):
+    return os.path.join(hls_dir(), str(song_id))
+
+
+def ladder_for(source_bitrate):
+    """The rungs worth encoding for a source of `source_bitrate` bit/s: never upscale, always keep the lowest."""
+    ladder = hls_ladder()
+    if not source_bitrate:
+        return ladder
+    rungs = tuple(rung for rung in ladder if rung * 1000 <= source_bitrate)
+    return rungs or ladder[:1]
+
+
+def ffmpeg_command(source, directory, rungs, segment_seconds):
+    """
+    One ffmpeg run for the whole ladder: the source is decoded once and
+    each rung is a separate AAC encode of the same stream, segmented into
+    `<rung>k/seg00000.ts` files and a `<rung>k/index.m3u8` VOD playlist.
+    """
+    command = ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', '-i', source]
+    for index, rung in enumerate(rungs):
+        command += ['-map', '0:a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', f'{rung}k', f'-ac:a:{index}', '2']
+    command += [
+        '-f', 'hls',
+        '-hls_time', str(segment_seconds),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(directory, '%v', 'seg%05d.ts'),
+        '-var_stream_map', ' '.join(f'a:{index},name:{rung}k' for index, rung in enumerate(rungs)),
+        os.path.join(directory, '%v', PLAYLIST),
+    ]
+    return command
+
+
+def transcode(song_id, source, rungs, segment_seconds=None):
+    """
+    Write the HLS renditions of `source` for `song_id`; returns the rendition
+    list stored on SongHLS. Output goes to a scratch directory that replaces
+    the song's directory only once ffmpeg has succeeded.
+    """
+    os.makedirs(hls_dir(), exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=hls_dir(), prefix=f'.{song_id}-')
+    try:
+        subprocess.run(
+            ffmpeg_command(source, scratch, rungs, segment_seconds or hls_segment_seconds()),
+            check=True, capture_output=True, timeout=transcode_timeout().total_seconds(),
+        )
+        renditions = []
+        for rung in rungs:
+            name = f'{rung}k'
+            if not os.path.exists(os.path.join(scratch, name, PLAYLIST)):
+                raise RuntimeError(f"ffmpeg wrote no playlist for {name}")
+            sizes = [entry.stat().st_size for entry in os.scandir(os.path.join(scratch, name)) if entry.name.endswith('.ts')]
+            renditions.append({'name': name, 'bitrate': rung * 1000, 'bandwidth': peak_bandwidth(scratch, name, sizes)})
+        target = song_directory(song_id)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(scratch, target)
+        return renditions
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(e.stderr.decode(errors='replace').strip() or str(e))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def peak_bandwidth(directory, name, sizes):
+    """BANDWIDTH for the master playlist: the largest segment over the target duration, in bit/s."""
+    with open(os.path.join(directory, name, PLAYLIST)) as f:
+        durations = [float(line.split(':', 1)[1].rstrip(',')) for line in f if line.startswith('#EXTINF:')]
+    longest = max(durations, default=hls_segment_seconds()) or hls_segment_seconds()
+    return int(max(sizes, default=0) * 8 / longest)
+
+
+def master_playlist(renditions):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in renditions:
+        lines.append(
+            f'#EXT-X-STREAM-INF:BANDWIDTH={rendition["bandwidth"]},'
+            f'AVERAGE-BANDWIDTH={rendition["bitrate"]},CODECS="{AUDIO_CODECS}"'
+        )
+        lines.append(f'{rendition["name"]}/{PLAYLIST}')
+    return '\n'.join(lines) + '\n'
+
+
+def enqueue(songs):
+    """Queue HLS transcodes for songs that don't have one yet."""
+    from .models import SongHLS
+
+    return len(SongHLS.objects.bulk_create(
+        [SongHLS(song_id=song_id) for song_id in songs.filter(hls__isnull=True).values_list('id', flat=True)],
+        ignore_conflicts=True,
+    ))
+
+
+def requeue_stale():
+    from .models import SongHLS
+
+    cutoff = timezone.now() - 2 * transcode_timeout()
+    return SongHLS.objects.filter(status=SongHLS.RUNNING, updated_at__lt=cutoff).update(status=SongHLS.PENDING)
+
+
+def claim_next():
+    """Atomically move the oldest pending transcode to running (as ingest.claim_next_job)."""
+    from .models import SongHLS
+
+    while True:
+        candidate = SongHLS.objects.filter(status=SongHLS.PENDING).order_by('updated_at').values_list('song_id', flat=True).first()
+        if candidate is None:
+            return None
+        claimed = SongHLS.objects.filter(song_id=candidate, status=SongHLS.PENDING).update(
+            status=SongHLS.RUNNING, updated_at=timezone.now()
+        )
+        if claimed:
+            return SongHLS.objects.select_related('song').get(song_id=candidate)
+
+
+def source_path(song):
+    """A local path for the song's audio: LocalStorage files in place, anything else via the stream cache."""
+    from .analysis import local_media_path
+    from .streaming import audio_cache
+
+    url = song.audio_url or (song.audio_file.url if song.audio_file else '')
+    if not url:
+        raise ValueError("song has no audio")
+    return local_media_path(url) or audio_cache.get(url, song.audio_sha256 or None)[0]
+
+
+def _transcode_song(song):
+    # Runs in a pool thread and touches no database; errors come back as values
+    try:
+        return transcode(song.id, source_path(song), ladder_for(song.bitrate)), None
+    except Exception as e:
+        return None, str(e)
+
+
+def record(hls, renditions, error):
+    from .models import SongHLS
+
+    if error:
+        logger.warning("Transcoding song %s failed: %s", hls.song_id, error)
+        hls.status, hls.error = SongHLS.FAILED, error
+    else:
+        hls.status, hls.error, hls.renditions = SongHLS.READY, '', renditions
+    hls.save(update_fields=['status', 'renditions', 'error', 'updated_at'])
+    return not error
+
+
+def run_transcoder(workers=None, limit=None, once=True, poll_interval=5.0, stdout=None):
+    """
+    Drain the SongHLS queue with at most `workers` ffmpeg processes at a
+    time. Each ffmpeg is its own process, so threads are enough to keep
+    them all busy. Returns (ready, failed).
+    """
+    workers = workers or transcode_workers()
+    ready = failed = claimed = 0
+    running = {}  # future -> SongHLS
+    with ThreadPoolExecutor(workers) as pool:
+        while True:
+            requeue_stale()
+            while len(running) < workers and (limit is None or claimed < limit):
+                hls = claim_next()
+                if hls is None:
+                    break
+                claimed += 1
+                running[pool.submit(_transcode_song, hls.song)] = hls
+            if not running:
+                if once or (limit is not None and claimed >= limit):
+                    break
+                time.sleep(poll_interval)
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                if record(running.pop(future), *future.result()):
+                    ready += 1
+                else:
+                    failed += 1
+                if stdout:
+                    stdout.write(f"{ready} ready, {failed} failed")
+    return ready, failed
@@ -0,0 +1,259 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .assets import TransferTooLarge, find_stored_audio, find_stored_image, stream_to_file
+from .models import Album, Artist, AssetTransfer, Song
+from .storage import get_audio_storage
+
+logger = logging.getLogger(__name__)
+
+MODELS = {'artist': Artist, 'album': Album, 'song': Song}
+
+# (model, field) -> (hash field, storage folder); audio has no folder, the backend picks
+TARGETS = {
+    ('artist', 'image'): ('image_sha256', 'artist_art'),
+    ('album', 'cover_image'): ('cover_sha256', 'cover_art'),
+    ('song', 'art'): ('art_sha256', 'song_art'),
+    ('song', 'audio_file'): ('audio_sha256', None),
+}
+
+
+def transfer_workers():
+    return getattr(settings, 'MUSIC_TRANSFER_WORKERS', 8)
+
+
+def transfer_per_host():
+    return getattr(settings, 'MUSIC_TRANSFER_PER_HOST', 4)
+
+
+def transfer_retries():
+    return getattr(settings, 'MUSIC_TRANSFER_RETRIES', 3)
+
+
+def transfer_max_attempts():
+    return getattr(settings, 'MUSIC_TRANSFER_MAX_ATTEMPTS', 3)
+
+
+def transfer_timeout():
+    """requests' (connect, read) timeout for one transfer."""
+    return (
+        getattr(settings, 'MUSIC_TRANSFER_CONNECT_TIMEOUT', 5.0),
+        getattr(settings, 'MUSIC_TRANSFER_TIMEOUT', 30.0),
+    )
+
+
+def transfer_deadline():
+    return getattr(settings, 'MUSIC_TRANSFER_DEADLINE', 600)
+
+
+def transfer_max_bytes(field):
+    if field == 'audio_file':
+        return getattr(settings, 'MUSIC_TRANSFER_MAX_BYTES', 500 * 1024 ** 2)
+    return getattr(settings, 'MUSIC_TRANSFER_MAX_IMAGE_BYTES', 20 * 1024 ** 2)
+
+
+def transfer_buffer_size():
+    return getattr(settings, 'MUSIC_TRANSFER_BUFFER_SIZE', 64 * 1024)
+
+
+def transfer_for(obj, field, *urls):
+    """An unsaved AssetTransfer filling `obj.field` from the first of `urls` that works, or None."""
+    urls = [url for url in urls if url]
+    if not urls:
+        return None
+    return AssetTransfer(model=obj._meta.model_name, object_id=obj.pk, field=field, urls=urls)
+
+
+def queue_transfers(transfers):
+    return AssetTransfer.objects.bulk_create([transfer for transfer in transfers if transfer is not None])
+
+
+def build_session(pool_size, retries=None):
+    """
+    One pooled session for every transfer thread: keep-alive connections
+    per host, and urllib3 retries (with backoff) for connection errors and
+    throttling/5xx responses.
+    """
+    retry = Retry(
+        total=transfer_retries() if retries is None else retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HostLimiter:
+    """At most `limit` concurrent requests per host, whatever the pool size."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.limit))
+
+    def __call__(self, host):
+        with self.lock:
+            return self.semaphores[host]
+
+
+def requeue_stale_transfers():
+    cutoff = timezone.now() - timedelta(seconds=2 * transfer_deadline())
+    return AssetTransfer.objects.filter(status=AssetTransfer.RUNNING, updated_at__lt=cutoff).update(
+        status=AssetTransfer.PENDING
+    )
+
+
+def claim_next_transfer():
+    """Atomically move the oldest pending transfer to running (as ingest.claim_next_job)."""
+    while True:
+        candidate = (
+            AssetTransfer.objects.filter(status=AssetTransfer.PENDING)
+            .order_by('created_at').values_list('id', flat=True).first()
+        )
+        if candidate is None:
+            return None
+        claimed = AssetTransfer.objects.filter(id=candidate, status=AssetTransfer.PENDING).update(
+            status=AssetTransfer.RUNNING, updated_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            return AssetTransfer.objects.get(id=candidate)
+
+
+class AssetTransferrer:
+    """
+    Works through the AssetTransfer queue as a two-stage pipeline on one
+    bounded thread pool: downloads (hashed while they stream to disk), then
+    uploads of whatever storage doesn't already hold. Requests share one
+    pooled session and at most `per_host` run against any one host. The
+    database is only touched from the calling thread: claiming, the
+    dedup lookup between the stages, and attaching the result.
+    """
+
+    def __init__(self, workers=None, per_host=None, storage=None, stdout=None):
+        self.workers = workers or transfer_workers()
+        self.limiter = HostLimiter(per_host or transfer_per_host())
+        self.session = build_session(self.workers)
+        self.storage = storage or get_audio_storage()
+        self.stdout = stdout
+        self.succeeded = self.failed = 0
+
+    def download(self, transfer, directory):
+        """Returns (path, sha256) of the first URL that downloads, streamed to disk in fixed-size blocks."""
+        error = None
+        for url in transfer.urls:
+            fd, path = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(urlparse(url).path)[1])
+            try:
+                with self.limiter(urlparse(url).netloc), os.fdopen(fd, 'wb') as target:
+                    _, sha256 = stream_to_file(
+                        self.session, url, target,
+                        max_bytes=transfer_max_bytes(transfer.field),
+                        timeout=transfer_timeout(),
+                        deadline=transfer_deadline(),
+                        block_size=transfer_buffer_size(),
+                    )
+                return path, sha256
+            except Exception as e:
+                os.remove(path)
+                error = e
+        raise error
+
+    def store(self, transfer, path):
+        """Upload to storage; returns the fields to set on the row."""
+        _, folder = TARGETS[transfer.model, transfer.field]
+        with self.limiter(type(self.storage).__name__):
+            if folder is None:
+                stored = self.storage.upload_audio(path, os.path.basename(urlparse(transfer.urls[0]).path) or None)
+                if stored.get('duration') is not None and not isinstance(stored['duration'], timedelta):
+                    stored['duration'] = timedelta(seconds=float(stored['duration']))
+                return {key: value for key, value in stored.items() if value is not None}
+            return {transfer.field: self.storage.upload_image(path, folder)}
+
+    def already_stored(self, transfer, sha256):
+        _, folder = TARGETS[transfer.model, transfer.field]
+        if folder is None:
+            return find_stored_audio(sha256)
+        existing = find_stored_image(sha256)
+        return {transfer.field: existing} if existing else None
+
+    def attach(self, transfer, fields, sha256):
+        hash_field, _ = TARGETS[transfer.model, transfer.field]
+        fields = {key: value for key, value in fields.items() if value not in (None, '')}
+        MODELS[transfer.model].objects.filter(pk=transfer.object_id).update(**fields, **{hash_field: sha256})
+        transfer.status, transfer.error = AssetTransfer.SUCCEEDED, ''
+        transfer.save(update_fields=['status', 'error', 'updated_at'])
+        self.succeeded += 1
+
+    def record_failure(self, transfer, error):
+        logger.warning("Transfer %s (%s) failed (attempt %s): %s", transfer.id, transfer.urls[0], transfer.attempts, error)
+        # an oversized file won't shrink on a retry
+        final = isinstance(error, TransferTooLarge) or transfer.attempts >= transfer_max_attempts()
+        transfer.status = AssetTransfer.FAILED if final else AssetTransfer.PENDING
+        transfer.error = str(error)
+        transfer.save(update_fields=['status', 'error', 'updated_at'])
+        if final:
+            self.failed += 1
+
+    def run(self, once=False, max_jobs=None, poll_interval=2.0):
+        directory = tempfile.mkdtemp(prefix='transfer-')
+        running = {}  # future -> (stage, transfer, path, sha256)
+        claimed = 0
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                while True:
+                    requeue_stale_transfers()
+                    while len(running) < self.workers and (max_jobs is None or claimed < max_jobs):
+                        transfer = claim_next_transfer()
+                        if transfer is None:
+                            break
+                        claimed += 1
+                        running[pool.submit(self.download, transfer, directory)] = ('download', transfer, None, None)
+                    if not running:
+                        if once or (max_jobs is not None and claimed >= max_jobs):
+                            break
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, transfer, path, sha256 = running.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            if path:
+                                os.remove(path)
+                            self.record_failure(transfer, e)
+                            continue
+                        if stage == 'download':
+                            path, sha256 = result
+                            existing = self.already_stored(transfer, sha256)
+                            if existing is None:
+                                running[pool.submit(self.store, transfer, path)] = ('store', transfer, path, sha256)
+                                continue
+                            result = existing
+                        os.remove(path)
+                        self.attach(transfer, result, sha256)
+                        if self.stdout:
+                            self.stdout.write(f"{transfer.model}.{transfer.field} {transfer.object_id}: done")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return self.succeeded, self.failed
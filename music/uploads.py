@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from .assets import sha256_file
+from .models import UploadSession
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400, received=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.received = received
+
+
+def upload_dir():
+    return getattr(settings, 'MUSIC_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads'))
+
+
+def max_upload_size():
+    return getattr(settings, 'MUSIC_UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'MUSIC_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def buffer_size():
+    return getattr(settings, 'MUSIC_UPLOAD_BUFFER_SIZE', 64 * 1024)
+
+
+def part_path(session):
+    return os.path.join(upload_dir(), f"{session.id}.part")
+
+
+def create_session(user, filename, size, sha256=''):
+    if size <= 0:
+        raise UploadError("size must be a positive number of bytes")
+    if size > max_upload_size():
+        raise UploadError(f"File must be less than {max_upload_size() // (1024 * 1024)}MB")
+    session = UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename) or 'upload',
+        size=size,
+        sha256=(sha256 or '').lower(),
+    )
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def parse_content_range(header, session, content_length):
+    """
+    Returns (start, length). Without a Content-Range header the body is
+    taken to continue from what the server already has.
+    """
+    if not header:
+        return session.received, content_length
+    match = CONTENT_RANGE_RE.match(header.strip())
+    if not match:
+        raise UploadError("Malformed Content-Range header")
+    start, end, total = match.groups()
+    start, end = int(start), int(end)
+    if end < start:
+        raise UploadError("Malformed Content-Range header")
+    if total != '*' and int(total) != session.size:
+        raise UploadError("Content-Range total does not match the session size")
+    length = end - start + 1
+    if content_length is not None and content_length != length:
+        raise UploadError("Content-Length does not match Content-Range")
+    return start, length
+
+
+def write_chunk(session, stream, start, length, checksum=None):
+    """
+    Copy `length` bytes from `stream` into the session's part file at
+    `start`, through a fixed-size buffer, hashing as it goes. The chunk is
+    only written into the part file, and counted as received, once it has
+    arrived in full and passed its checksum. Chunks must arrive in order:
+    anything other than the next expected offset is rejected with the
+    offset to resume from.
+    """
+    if session.status != UploadSession.OPEN:
+        raise UploadError("Upload session is closed", status_code=409, received=session.received)
+    if start != session.received:
+        raise UploadError("Chunk does not start at the next expected byte", status_code=409, received=session.received)
+    if length is None or length <= 0:
+        raise UploadError("Empty chunk")
+    if length > max_chunk_size():
+        raise UploadError(f"Chunks must be at most {max_chunk_size()} bytes")
+    if start + length > session.size:
+        raise UploadError("Chunk runs past the declared size")
+
+    # Each attempt is spooled to its own file, so a concurrent retry of the
+    # same range that fails can't touch bytes another attempt has committed
+    attempt_path = f"{part_path(session)}.{uuid.uuid4().hex}"
+    try:
+        digest = hashlib.sha256()
+        remaining = length
+        with open(attempt_path, 'wb') as attempt:
+            while remaining:
+                block = stream.read(min(buffer_size(), remaining))
+                if not block:
+                    break
+                attempt.write(block)
+                digest.update(block)
+                remaining -= len(block)
+        if remaining:
+            raise UploadError("Chunk body shorter than declared", received=session.received)
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError("Chunk checksum mismatch", received=session.received)
+
+        with transaction.atomic():
+            # The conditional update claims the range and holds the session row
+            # locked until the chunk is in the part file, so only one attempt wins
+            updated = UploadSession.objects.filter(id=session.id, received=start, status=UploadSession.OPEN).update(
+                received=start + length
+            )
+            if not updated:
+                session.refresh_from_db()
+                raise UploadError("Upload session changed concurrently", status_code=409, received=session.received)
+            with open(attempt_path, 'rb') as attempt, open(part_path(session), 'r+b') as part:
+                part.seek(start)
+                shutil.copyfileobj(attempt, part, buffer_size())
+                part.truncate(start + length)
+    finally:
+        try:
+            os.remove(attempt_path)
+        except FileNotFoundError:
+            pass
+    session.received = start + length
+    return session
+
+
+def verify_complete(session):
+    if session.status != UploadSession.OPEN:
+        raise UploadError("Upload session is closed", status_code=409, received=session.received)
+    if session.received != session.size:
+        raise UploadError("Upload is incomplete", status_code=409, received=session.received)
+    if session.sha256 and sha256_file(part_path(session), buffer_size()) != session.sha256:
+        raise UploadError("File checksum mismatch")
+
+
+def abort_session(session):
+    UploadSession.objects.filter(id=session.id).update(status=UploadSession.ABORTED)
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
@@ -2,9 +2,10 @@ from django.urls import re_path as path
 from .views import (
     ArtistAPIView, ArtistDetailAPIView,
     AlbumAPIView, AlbumDetailAPIView,
-    SongAPIView, SongDetailAPIView,
-    PlaylistAPIView, PlaylistDetailAPIView, UnifiedSearch,
-    DiscoverSongsAPIView, UserLoginAPIView, UserProfile, UserRegistrationAPIView, FetchSongTag
+    SongAPIView, SongDetailAPIView, SongLibraryAPIView, SimilarSongsAPIView, SongWaveformAPIView, SongStreamAPIView, SongHLSAPIView, SongHLSFileAPIView, IngestJobAPIView,
+    UploadSessionAPIView, UploadSessionDetailAPIView, UploadSessionCompleteAPIView,
+    PlaylistAPIView, PlaylistDetailAPIView, UnifiedSearch, SuggestAPIView,
+    DiscoverSongsAPIView, UserLoginAPIView, UserProfile, UserRegistrationAPIView, FetchSongTag, FetchSongTagBatch
 )
 
 urlpatterns = [
@@ -23,8 +24,21 @@ urlpatterns = [
     
     # Songs
     path(r'^fetch-song-tag/$', FetchSongTag.as_view(), name='song-tag'),
+    path(r'^fetch-song-tag/batch/$', FetchSongTagBatch.as_view(), name='song-tag-batch'),
     path(r'^songs/$', SongAPIView.as_view(), name='song-list'),
     path(r'^songs/(?P<pk>[\w-]+)/$', SongDetailAPIView.as_view(), name='song-detail'),
+    path(r'^songs/(?P<pk>[\w-]+)/similar/$', SimilarSongsAPIView.as_view(), name='song-similar'),
+    path(r'^songs/(?P<pk>[\w-]+)/waveform/$', SongWaveformAPIView.as_view(), name='song-waveform'),
+    path(r'^songs/(?P<pk>[\w-]+)/library/$', SongLibraryAPIView.as_view(), name='song-library'),
+    path(r'^songs/(?P<pk>[\w-]+)/stream/$', SongStreamAPIView.as_view(), name='song-stream'),
+    path(r'^songs/(?P<pk>[\w-]+)/hls/$', SongHLSAPIView.as_view(), name='song-hls'),
+    path(r'^songs/(?P<pk>[\w-]+)/hls/(?P<rendition>\d+k)/(?P<name>index\.m3u8|seg\d+\.ts)$', SongHLSFileAPIView.as_view(), name='song-hls-file'),
+    path(r'^jobs/(?P<pk>[\w-]+)/$', IngestJobAPIView.as_view(), name='ingest-job-detail'),
+
+    # Resumable uploads
+    path(r'^uploads/$', UploadSessionAPIView.as_view(), name='upload-session-list'),
+    path(r'^uploads/(?P<pk>[\w-]+)/$', UploadSessionDetailAPIView.as_view(), name='upload-session-detail'),
+    path(r'^uploads/(?P<pk>[\w-]+)/complete/$', UploadSessionCompleteAPIView.as_view(), name='upload-session-complete'),
     
     # Playlists
     path(r'^playlists/$', PlaylistAPIView.as_view(), name='playlist-list'),
@@ -35,4 +49,5 @@ urlpatterns = [
     # Discovery
     path(r'^discover/$', DiscoverSongsAPIView.as_view(), name='discover-songs'),
     path(r'^search/$', UnifiedSearch.as_view(), name='search-all'),
+    path(r'^suggest/$', SuggestAPIView.as_view(), name='suggest'),
 ]
\ No newline at end of file
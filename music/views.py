@@ -1,39 +1,41 @@
-from datetime import timedelta
-from io import BytesIO
-import io
+import os
 import requests
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from .api import fetch_jamendo_tracks
 from .response import create_response
-from .models import Artist, Album, Song, Playlist
-from .serializers import ArtistSerializer, AlbumSerializer, SongSerializer, PlaylistSerializer, UserLoginSerializer, UserRegistrationSerializer, UserSerializer
+from .pagination import KeysetPagination
+from .search import document_owner, get_search_backend
+from .suggest import suggestion_index
+from .features import feature_store
+from .waveform import peaks_for, waveform_resolutions
+from .analysis import local_media_path
+from .assets import TransferError
+from .streaming import AudioCache, FileRange, audio_cache, content_type_for, parse_range
+from .transcode import master_playlist, song_directory
+from .discover import note_request, pool_songs
+from .tags import UnsupportedAudio, read_tags, read_tags_batch, tag_batch_max_files
+from .ingest import enqueue_song_upload, enqueue_staged_file, job_payload
+from . import uploads
+from .models import Artist, Album, Song, SongHLS, SongWaveform, LibraryEntry, Playlist, IngestJob, UploadSession
+from .serializers import ArtistSerializer, AlbumSerializer, SongSerializer, PlaylistSerializer, UserLoginSerializer, UserRegistrationSerializer, UserSerializer, IngestJobSerializer, UploadSessionSerializer, parse_field_paths
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from django.core import signing
+from django.core.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q
 from rest_framework_simplejwt.tokens import RefreshToken
-import cloudinary.uploader
 
-def upload_external_file_to_cloudinary(file_url, folder, resource_type):
-    print(file_url)
-    try:
-        # 1. Download the file
-        response = requests.get(file_url)
-        if response.status_code != 200:
-            print(f"Failed to download {file_url}")
-            return None
+HLS_CONTENT_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t'}
 
-        # 2. Upload to Cloudinary
-        result = cloudinary.uploader.upload(
-            BytesIO(response.content),  # Pass file bytes
-            folder=f"{folder}/",
-            resource_type=resource_type
-        )
-        return result['public_id']
-    except Exception as e:
-        print(f"Failed to upload {file_url}: {e}")
-        return None
+def serializer_options(request):
+    """`?fields=` and `?expand=` for the music serializers (see DynamicFieldsMixin)."""
+    return {
+        'fields': parse_field_paths(request.query_params.get('fields')),
+        'expand': parse_field_paths(request.query_params.get('expand')),
+    }
 
 class UserRegistrationAPIView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -112,13 +114,26 @@ class UserProfile(APIView):
 class ArtistAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    ordering = ('name', 'id')
+
     def get(self, request):
-        artists = Artist.objects.filter(user=request.user)
-        serializer = ArtistSerializer(artists, many=True, context={'request': request})
+        options = serializer_options(request)
+        artists = ArtistSerializer.setup_eager_loading(Artist.objects.in_library(request.user), options['expand'])
+        paginator = KeysetPagination(self.ordering)
+        try:
+            artists = paginator.paginate_queryset(artists, request)
+        except KeysetPagination.InvalidCursor:
+            return create_response(
+                success=False,
+                message="Invalid cursor",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = ArtistSerializer(artists, many=True, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Artists retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=paginator.get_pagination()
         )
 
     def post(self, request):
@@ -142,12 +157,15 @@ class ArtistDetailAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
-    def get_object(self, pk, user):
-        return get_object_or_404(Artist, pk=pk, user=user)
+    def get_object(self, pk, user, expand=None):
+        # Only the owner may change it; shared catalog artists are read-only
+        return get_object_or_404(ArtistSerializer.setup_eager_loading(Artist.objects.all(), expand), pk=pk, user=user)
 
     def get(self, request, pk):
-        artist = self.get_object(pk, request.user)
-        serializer = ArtistSerializer(artist, context={'request': request})
+        options = serializer_options(request)
+        artists = ArtistSerializer.setup_eager_loading(Artist.objects.available_to(request.user), options['expand'])
+        artist = get_object_or_404(artists, pk=pk)
+        serializer = ArtistSerializer(artist, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Artist retrieved successfully",
@@ -184,13 +202,26 @@ class AlbumAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
+    ordering = ('-release_date', '-id')
+
     def get(self, request):
-        albums = Album.objects.filter(user=request.user)
-        serializer = AlbumSerializer(albums, many=True, context={'request': request})
+        options = serializer_options(request)
+        albums = AlbumSerializer.setup_eager_loading(Album.objects.in_library(request.user), options['expand'])
+        paginator = KeysetPagination(self.ordering)
+        try:
+            albums = paginator.paginate_queryset(albums, request)
+        except KeysetPagination.InvalidCursor:
+            return create_response(
+                success=False,
+                message="Invalid cursor",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = AlbumSerializer(albums, many=True, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Albums retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=paginator.get_pagination()
         )
 
     def post(self, request):
@@ -214,12 +245,15 @@ class AlbumDetailAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
-    def get_object(self, pk, user):
-        return get_object_or_404(Album, pk=pk, user=user)
+    def get_object(self, pk, user, expand=None):
+        # Only the owner may change it; shared catalog albums are read-only
+        return get_object_or_404(AlbumSerializer.setup_eager_loading(Album.objects.all(), expand), pk=pk, user=user)
 
     def get(self, request, pk):
-        album = self.get_object(pk, request.user)
-        serializer = AlbumSerializer(album, context={'request': request})
+        options = serializer_options(request)
+        albums = AlbumSerializer.setup_eager_loading(Album.objects.available_to(request.user), options['expand'])
+        album = get_object_or_404(albums, pk=pk)
+        serializer = AlbumSerializer(album, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Album retrieved successfully",
@@ -252,13 +286,6 @@ class AlbumDetailAPIView(APIView):
             status_code=status.HTTP_200_OK
         )
 
-from mutagen import File
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
-from mutagen.oggvorbis import OggVorbis
-from mutagen.wave import WAVE
-# from django.core.files.uploadedfile import InMemoryUploadedFile
-
 class FetchSongTag(APIView):
     def post(self, request):
         if 'file' not in request.FILES:
@@ -267,73 +294,89 @@ class FetchSongTag(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        audio_file = request.FILES['file']
-        metadata = {}
-
         try:
-            # Handle both in-memory and temporary file uploads
-            if hasattr(audio_file, 'temporary_file_path'):
-                # File is on disk (Django temporary upload)
-                audio = File(audio_file.temporary_file_path(), easy=True)
-            else:
-                # File is in memory - read into BytesIO
-                file_bytes = audio_file.read()
-                file_io = io.BytesIO(file_bytes)
-                audio_file.seek(0)  # Reset file pointer for future use
-                audio = File(file_io, easy=True)
-
-            if not audio:
-                return Response(
-                    {"success": False, "error": "Unsupported audio format"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Get accurate duration in seconds (float)
-            duration = audio.info.length  # This returns float (seconds)
-
-            # Extract common metadata
-            result = {
-                'duration': round(duration, 2),  # Rounded to 2 decimal places
-                'bitrate': getattr(audio.info, 'bitrate', None),
-                'sample_rate': getattr(audio.info, 'sample_rate', None),
-                'channels': getattr(audio.info, 'channels', 2),
-            }
-
-            # Extract ID3 tags if available
-            if hasattr(audio, 'tags'):
-                tags = audio.tags
-                result.update({
-                    'title': tags.get('title', [''])[0] if tags.get('title') else None,
-                    'artist': tags.get('artist', [''])[0] if tags.get('artist') else None,
-                    'album': tags.get('album', [''])[0] if tags.get('album') else None,
-                    'genre': tags.get('genre', [''])[0] if tags.get('genre') else None,
-                    'track_number': tags.get('tracknumber', [''])[0] if tags.get('tracknumber') else None,
-                    'bpm': tags.get('bpm', [''])[0] if tags.get('bpm') else None,
-                    'year': tags.get('date', [''])[0] if tags.get('date') else None,
-                })
-
+            result = read_tags(request.FILES['file'])
+        except UnsupportedAudio as e:
             return Response(
-                {"success": True, "metadata": result},
-                status=status.HTTP_200_OK
+                {"success": False, "error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
             )
-
         except Exception as e:
             return Response(
                 {"success": False, "error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        return Response(
+            {"success": True, "metadata": result},
+            status=status.HTTP_200_OK
+        )
+
+class FetchSongTagBatch(APIView):
+    """Tags for many files (multipart field `files`, repeated) in one round trip."""
+
+    def post(self, request):
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response(
+                {"success": False, "error": "No audio files provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(files) > tag_batch_max_files():
+            return Response(
+                {"success": False, "error": f"At most {tag_batch_max_files()} files per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {"success": True, "results": read_tags_batch(files)},
+            status=status.HTTP_200_OK
+        )
+
+def validate_song_payload(data):
+    """Check the song fields up front; returns an error response or None."""
+    try:
+        Album.objects.get(id=data.get('album'))
+    except (Album.DoesNotExist, ValidationError):
+        return create_response(success=False, message="Album not found", status_code=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        Artist.objects.get(id=data.get('artist'))
+    except (Artist.DoesNotExist, ValidationError):
+        return create_response(success=False, message="Artist not found", status_code=status.HTTP_400_BAD_REQUEST)
+
+    serializer = SongSerializer(data=job_payload(data))
+    if not serializer.is_valid():
+        return create_response(
+            success=False,
+            message="Invalid song data",
+            errors=serializer.errors,
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    return None
 
 class SongAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
+    ordering = ('-date_added', '-id')
+
     def get(self, request):
-        songs = Song.objects.filter(user=request.user)
-        serializer = SongSerializer(songs, many=True, context={'request': request})
+        options = serializer_options(request)
+        songs = SongSerializer.setup_eager_loading(Song.objects.in_library(request.user), options['expand'])
+        paginator = KeysetPagination(self.ordering)
+        try:
+            songs = paginator.paginate_queryset(songs, request)
+        except KeysetPagination.InvalidCursor:
+            return create_response(
+                success=False,
+                message="Invalid cursor",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = SongSerializer(songs, many=True, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Songs retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=paginator.get_pagination()
         )
     
     def post(self, request, format=None):
@@ -356,103 +399,31 @@ class SongAPIView(APIView):
                 message="Title is required",
                 status_code=status.HTTP_400_BAD_REQUEST
             )
-        
-        # 🔍 Check file size (15MB max)
-        if audio_file.size > 15 * 1024 * 1024:  # 15MB in bytes
-            return create_response(success=False, message="Audio file must be less than 15MB", status_code=status.HTTP_400_BAD_REQUEST)
 
-        
-        # Create song instance with provided data
-        song_data = {
-            'user': user.id,
-            'title': data.get('title', 'Untitled'),
-            'genre': data.get('genre'),
-            'release_date': data.get('release_date'),
-            'is_explicit': data.get('is_explicit', False),
-            'lyrics': data.get('lyrics', ''),
-            'track_number': data.get('track_number'),
-            'audio_file': audio_file,
-            'art': art_file
-        }
-
-        # Handle album foreign key
-        album_id = data.get('album')
-        if album_id:
-            try:
-                album = Album.objects.get(id=album_id)
-                song_data['album'] = album.id
-            except Album.DoesNotExist:
-                return create_response(
-                    success=False,
-                    message=f"Album with ID {album_id} does not exist",
-                    status_code=status.HTTP_400_BAD_REQUEST
-                )
-        
-        # Handle artist foreign key
-        artist_id = data.get('artist')
-        if artist_id:
-            try:
-                artist = Artist.objects.get(id=artist_id)
-                song_data['artist'] = artist.id
-            except Artist.DoesNotExist:
-                return create_response(
-                    success=False,
-                    message=f"Artist with ID {artist_id} does not exist",
-                    status_code=status.HTTP_400_BAD_REQUEST
-                )
-        
-        serializer = SongSerializer(data=song_data, context={'request': request})
-        if not serializer.is_valid():
+        if audio_file is None:
             return create_response(
                 success=False,
-                message="Invalid song data",
-                errors=serializer.errors,
+                message="Audio file is required",
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            album = Album.objects.get(id=data.get('album'))
-            song_data['album'] = album.id
-        except Album.DoesNotExist:
-            return create_response(success=False, message="Album not found", status_code=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            artist = Artist.objects.get(id=data.get('artist'))
-            song_data['artist'] = artist.id
-        except Artist.DoesNotExist:
-            return create_response(success=False, message="Artist not found", status_code=status.HTTP_400_BAD_REQUEST)
-
-        # 🚀 Upload to Cloudinary
-        try:
-            cloudinary_response = cloudinary.uploader.upload_large(
-                audio_file,
-                resource_type="video",  # Cloudinary treats audio as video
-                folder="songs/",
-                use_filename=True,
-                unique_filename=False
-            )
-
-            song_data['audio_url'] = cloudinary_response.get('secure_url')
-            song_data['duration'] = cloudinary_response.get('duration')  # if available
-            song_data['bitrate'] = cloudinary_response['audio']['bit_rate']  # Optional, you can skip extracting locally
-            song_data['audio_file'] = cloudinary_response.get('playback_url')  # Optional, you can skip extracting locally
-            song_data['downloadable_link'] = cloudinary_response.get('secure_url')  # Optional, you can skip extracting locally
-            song_data['title'] = cloudinary_response.get('original_filename')  # Optional, you can skip extracting locally
+        # 🔍 Check file size (15MB max)
+        if audio_file.size > 15 * 1024 * 1024:  # 15MB in bytes
+            return create_response(success=False, message="Audio file must be less than 15MB", status_code=status.HTTP_400_BAD_REQUEST)
 
-        except Exception as e:
-            return create_response(success=False, message="Cloudinary upload failed", errors={"audio_file": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+        error = validate_song_payload(data)
+        if error:
+            return error
 
-        
-        serializer = SongSerializer(data=song_data, context={'request': request})
-        print(song_data)
-        if serializer.is_valid():
-            song = serializer.save()
-            return create_response(success=True, message="Song uploaded successfully", data=SongSerializer(song).data, status_code=status.HTTP_201_CREATED)
-        else:
-            return create_response(success=False, message="Invalid song data", errors=serializer.errors, status_code=status.HTTP_400_BAD_REQUEST)
-        
-        # Process audio file if provided
-        
+        # Stage the file locally and let the ingest worker do the storage
+        # upload, so this worker isn't blocked for the length of the transfer
+        job = enqueue_song_upload(user, data, audio_file, art_file)
+        return create_response(
+            success=True,
+            message="Song upload queued",
+            data=IngestJobSerializer(job, context={'request': request}).data,
+            status_code=status.HTTP_202_ACCEPTED
+        )
 
     # def post(self, request):
     #     serializer = SongSerializer(data=request.data, context={'request': request})
@@ -471,16 +442,319 @@ class SongAPIView(APIView):
     #         status_code=status.HTTP_400_BAD_REQUEST
     #     )
 
+class SimilarSongsAPIView(APIView):
+    """
+    "More like this": the songs in the caller's library closest to this one
+    by cosine similarity of their audio feature vectors (see music.features).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        song = get_object_or_404(Song.objects.available_to(request.user).only('id'), pk=pk)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+
+        candidates = Song.objects.in_library(request.user).filter(has_features=True).values_list('id', flat=True)
+        matches = feature_store.similar(song.id, candidates, limit=limit)
+        if matches is None:
+            return create_response(
+                success=False,
+                message="Song has not been analysed yet",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+
+        options = serializer_options(request)
+        songs = SongSerializer.setup_eager_loading(Song.objects.filter(id__in=[song_id for song_id, _ in matches]), options['expand'])
+        by_id = {row.id: row for row in songs}
+        data = []
+        for song_id, score in matches:
+            if song_id in by_id:
+                item = SongSerializer(by_id[song_id], context={'request': request}, **options).data
+                data.append(dict(item, similarity=round(score, 4)))
+        return create_response(
+            success=True,
+            message="Similar songs retrieved successfully",
+            data=data
+        )
+
+
+class SongWaveformAPIView(APIView):
+    """
+    Waveform peaks for the player, so it can draw before fetching any audio.
+    `?points=N` picks the detail level; the data is immutable until the song
+    is re-analysed, so it is served with an ETag and a long private max-age.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    default_points = 1024
+
+    def get(self, request, pk):
+        waveform = get_object_or_404(SongWaveform.objects.filter(song__in=Song.objects.available_to(request.user)), song_id=pk)
+        try:
+            points = int(request.query_params.get('points', self.default_points))
+        except ValueError:
+            points = self.default_points
+        points = min(max(points, 1), max(waveform_resolutions()))
+
+        etag = quote_etag(f"{waveform.updated_at.timestamp():.6f}-{points}")
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            peaks = peaks_for(waveform.data, points)
+            response = create_response(
+                success=True,
+                message="Waveform retrieved successfully",
+                data={'points': len(peaks) // 2, 'bits': 8, 'peaks': peaks.tolist()}
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
+
+class SongStreamAPIView(APIView):
+    """
+    The song's audio with HTTP range support, so players can seek without
+    going back to the origin. Remote audio is served from the local LRU
+    cache (music.streaming), filled on first request; LocalStorage files are
+    served in place. Responses are FileResponses, so the WSGI server can
+    sendfile them.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        song = get_object_or_404(Song.objects.available_to(request.user).only('id', 'audio_url', 'audio_file', 'audio_sha256'), pk=pk)
+        url = song.audio_url or (song.audio_file.url if song.audio_file else '')
+        if not url:
+            return create_response(success=False, message="Song has no audio", status_code=status.HTTP_404_NOT_FOUND)
+
+        path, cache = local_media_path(url), 'LOCAL'
+        if not path and url.startswith(settings.MEDIA_URL):
+            return create_response(success=False, message="Song audio is missing", status_code=status.HTTP_404_NOT_FOUND)
+        if not path:
+            try:
+                path, hit = audio_cache.get(url, song.audio_sha256 or None)
+            except (requests.RequestException, TransferError) as e:
+                return create_response(
+                    success=False,
+                    message=f"Could not fetch audio: {e}",
+                    status_code=status.HTTP_502_BAD_GATEWAY
+                )
+            cache = 'HIT' if hit else 'MISS'
+
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:  # removed since we looked, e.g. evicted by another process's fill
+            return create_response(success=False, message="Song audio is missing", status_code=status.HTTP_404_NOT_FOUND)
+        size = os.fstat(file.fileno()).st_size
+        etag = quote_etag(AudioCache.key_for(url, song.audio_sha256 or None) + f"-{size}")
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == etag:  # If-Range dates never match: we don't send Last-Modified
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except ValueError:
+                file.close()
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=status.HTTP_206_PARTIAL_CONTENT,
+                                    content_type=content_type_for(path))
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(file, content_type=content_type_for(path))
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=86400'
+        response['X-Cache'] = cache
+        return response
+
+
+class SongHLSAPIView(APIView):
+    """
+    HLS master playlist for adaptive streaming. The variant playlists and
+    segments it points at are relative URLs served by SongHLSFileAPIView.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        hls = get_object_or_404(SongHLS.objects.filter(song__in=Song.objects.available_to(request.user)), song_id=pk)
+        if hls.status != SongHLS.READY:
+            return create_response(
+                success=False,
+                message="HLS renditions are not ready yet",
+                data={'status': hls.status, 'error': hls.error or None},
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        response = HttpResponse(master_playlist(hls.renditions), content_type=HLS_CONTENT_TYPES['.m3u8'])
+        response['Cache-Control'] = 'private, max-age=300'
+        return response
+
+
+class SongHLSFileAPIView(APIView):
+    """A variant playlist or segment of a song's HLS renditions."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk, rendition, name):
+        hls = get_object_or_404(SongHLS.objects.filter(song__in=Song.objects.available_to(request.user), status=SongHLS.READY), song_id=pk)
+        if rendition not in {r['name'] for r in hls.renditions}:
+            return create_response(success=False, message="Rendition not found", status_code=status.HTTP_404_NOT_FOUND)
+        path = os.path.join(song_directory(hls.song_id), rendition, name)
+        if not os.path.isfile(path):
+            return create_response(success=False, message="Segment not found", status_code=status.HTTP_404_NOT_FOUND)
+        response = FileResponse(open(path, 'rb'), content_type=HLS_CONTENT_TYPES[os.path.splitext(name)[1]])
+        # segments never change once written; playlists follow the SongHLS row
+        response['Cache-Control'] = 'private, max-age=86400' if name.endswith('.ts') else 'private, max-age=300'
+        return response
+
+
+class IngestJobAPIView(APIView):
+    """Progress of a queued upload, and the resulting song once it's done."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(IngestJob.objects.select_related('song__album__artist'), pk=pk, user=request.user)
+        return create_response(
+            success=True,
+            message="Job retrieved successfully",
+            data=IngestJobSerializer(job, context={'request': request}).data
+        )
+
+def upload_error_response(error):
+    return create_response(
+        success=False,
+        message=str(error),
+        data={'received': error.received} if error.received is not None else None,
+        status_code=error.status_code
+    )
+
+class UploadSessionAPIView(APIView):
+    """
+    Start a resumable upload. Send the file with PUTs to the session URL
+    (Content-Range: bytes start-end/size, optional X-Chunk-SHA256), then
+    POST the song fields to .../complete/.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            size = int(request.data.get('size', 0))
+        except (TypeError, ValueError):
+            size = 0
+        try:
+            session = uploads.create_session(
+                request.user,
+                request.data.get('filename', ''),
+                size,
+                request.data.get('sha256', '')
+            )
+        except uploads.UploadError as e:
+            return upload_error_response(e)
+        return create_response(
+            success=True,
+            message="Upload session created",
+            data=UploadSessionSerializer(session).data,
+            status_code=status.HTTP_201_CREATED
+        )
+
+class UploadSessionDetailAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_object(self, pk, user):
+        return get_object_or_404(UploadSession, pk=pk, user=user)
+
+    def get(self, request, pk):
+        # Clients resume from `received` after a dropped connection
+        session = self.get_object(pk, request.user)
+        return create_response(
+            success=True,
+            message="Upload session retrieved successfully",
+            data=UploadSessionSerializer(session).data
+        )
+
+    def put(self, request, pk):
+        session = self.get_object(pk, request.user)
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0) or None
+            start, length = uploads.parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), session, content_length)
+            # Read the raw body stream; touching request.data would buffer it
+            uploads.write_chunk(session, request.stream, start, length, request.META.get('HTTP_X_CHUNK_SHA256'))
+        except uploads.UploadError as e:
+            return upload_error_response(e)
+        return create_response(
+            success=True,
+            message="Chunk received",
+            data=UploadSessionSerializer(session).data
+        )
+
+    def delete(self, request, pk):
+        session = self.get_object(pk, request.user)
+        uploads.abort_session(session)
+        return create_response(
+            success=True,
+            message="Upload session aborted",
+            status_code=status.HTTP_200_OK
+        )
+
+class UploadSessionCompleteAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        data = request.data
+
+        if not data.get('title'):
+            return create_response(
+                success=False,
+                message="Title is required",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        error = validate_song_payload(data)
+        if error:
+            return error
+
+        try:
+            uploads.verify_complete(session)
+        except uploads.UploadError as e:
+            return upload_error_response(e)
+
+        # Claim the session so a repeated finalize can't queue it twice
+        if not UploadSession.objects.filter(id=session.id, status=UploadSession.OPEN).update(status=UploadSession.COMPLETE):
+            return create_response(
+                success=False,
+                message="Upload session is closed",
+                status_code=status.HTTP_409_CONFLICT
+            )
+
+        # Same path as a regular upload from here on
+        # verify_complete already hashed the file when a checksum was declared
+        job = enqueue_staged_file(request.user, data, uploads.part_path(session), session.filename, session.sha256 or None)
+        UploadSession.objects.filter(id=session.id).update(job=job)
+        return create_response(
+            success=True,
+            message="Song upload queued",
+            data=IngestJobSerializer(job, context={'request': request}).data,
+            status_code=status.HTTP_202_ACCEPTED
+        )
+
 class SongDetailAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
-    def get_object(self, pk, user):
-        return get_object_or_404(Song, pk=pk, user=user)
+    def get_object(self, pk, user, expand=None):
+        # Only the owner may change a song; shared catalog songs are read-only
+        return get_object_or_404(SongSerializer.setup_eager_loading(Song.objects.all(), expand), pk=pk, user=user)
 
     def get(self, request, pk):
-        song = self.get_object(pk, request.user)
-        serializer = SongSerializer(song, context={'request': request})
+        options = serializer_options(request)
+        songs = SongSerializer.setup_eager_loading(Song.objects.available_to(request.user), options['expand'])
+        song = get_object_or_404(songs, pk=pk)
+        serializer = SongSerializer(song, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Song retrieved successfully",
@@ -505,8 +779,14 @@ class SongDetailAPIView(APIView):
         )
 
     def delete(self, request, pk):
-        # song = self.get_object(pk)
-        song = Song.objects.get(id=pk)
+        # A catalog song is only taken out of the library; the shared row stays
+        if LibraryEntry.objects.filter(user=request.user, song_id=pk).delete()[0]:
+            return create_response(
+                success=True,
+                message="Song removed from library",
+                status_code=status.HTTP_200_OK
+            )
+        song = self.get_object(pk, request.user)
         song.delete()
         return create_response(
             success=True,
@@ -514,17 +794,53 @@ class SongDetailAPIView(APIView):
             status_code=status.HTTP_200_OK
         )
 
+
+class SongLibraryAPIView(APIView):
+    """Add a shared catalog song (from discover or search) to the caller's library, or take it out."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        song = get_object_or_404(Song.objects.available_to(request.user).only('id', 'user'), pk=pk)
+        if song.user_id is None:
+            LibraryEntry.objects.get_or_create(user=request.user, song=song)
+        return create_response(
+            success=True,
+            message="Song added to library",
+            status_code=status.HTTP_200_OK
+        )
+
+    def delete(self, request, pk):
+        LibraryEntry.objects.filter(user=request.user, song_id=pk).delete()
+        return create_response(
+            success=True,
+            message="Song removed from library",
+            status_code=status.HTTP_200_OK
+        )
+
 class PlaylistAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
+    ordering = ('-created_at', '-id')
+
     def get(self, request):
-        playlists = Playlist.objects.filter(user=request.user)
-        serializer = PlaylistSerializer(playlists, many=True, context={'request': request})
+        options = serializer_options(request)
+        playlists = PlaylistSerializer.setup_eager_loading(Playlist.objects.filter(user=request.user), options['expand'])
+        paginator = KeysetPagination(self.ordering)
+        try:
+            playlists = paginator.paginate_queryset(playlists, request)
+        except KeysetPagination.InvalidCursor:
+            return create_response(
+                success=False,
+                message="Invalid cursor",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = PlaylistSerializer(playlists, many=True, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Playlists retrieved successfully",
-            data=serializer.data
+            data=serializer.data,
+            pagination=paginator.get_pagination()
         )
 
     def post(self, request):
@@ -536,7 +852,7 @@ class PlaylistAPIView(APIView):
             song_ids = request.data.get('song_ids', [])
             for song_id in song_ids:
                 try:
-                    song = Song.objects.get(id=song_id, user=request.user)
+                    song = Song.objects.available_to(request.user).get(id=song_id)
                     playlist.songs.add(song)
                 except Song.DoesNotExist:
                     pass
@@ -558,12 +874,13 @@ class PlaylistDetailAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
-    def get_object(self, pk, user):
-        return get_object_or_404(Playlist, pk=pk, user=user)
+    def get_object(self, pk, user, expand=None):
+        return get_object_or_404(PlaylistSerializer.setup_eager_loading(Playlist.objects.all(), expand), pk=pk, user=user)
 
     def get(self, request, pk):
-        playlist = self.get_object(pk, request.user)
-        serializer = PlaylistSerializer(playlist, context={'request': request})
+        options = serializer_options(request)
+        playlist = self.get_object(pk, request.user, options['expand'])
+        serializer = PlaylistSerializer(playlist, context={'request': request}, **options)
         return create_response(
             success=True,
             message="Playlist retrieved successfully",
@@ -611,7 +928,7 @@ class PlaylistDetailAPIView(APIView):
             )
         
         try:
-            song = Song.objects.get(id=song_id, user=request.user)
+            song = Song.objects.available_to(request.user).get(id=song_id)
             
             if action == 'add':
                 if playlist.songs.filter(id=song_id).exists():
@@ -646,7 +963,7 @@ class PlaylistDetailAPIView(APIView):
             return create_response(
                 success=True,
                 message=message,
-                data=PlaylistSerializer(playlist, context={'request': request}).data
+                data=PlaylistSerializer(playlist, context={'request': request}, **serializer_options(request)).data
             )
             
         except Song.DoesNotExist:
@@ -662,50 +979,142 @@ class UnifiedSearch(APIView):
     permission_classes = [permissions.IsAuthenticated]
     """
     Unified Search across Artists, Albums, Songs, and Playlists.
+    Results come from the full-text index (music.search), best match first.
+
+    Without `type` the first page of every section is returned; pass
+    `type` plus the section's `next` cursor to page through one type.
+    `counts` holds the total matches per type. Only the caller's own
+    objects, the shared catalog and public playlists are searched.
     """
+    serializers = {
+        'artist': (Artist, ArtistSerializer),
+        'album': (Album, AlbumSerializer),
+        'song': (Song, SongSerializer),
+        'playlist': (Playlist, PlaylistSerializer),
+    }
+    section_limit = 5       # per type when searching everything
+    page_limit = 20         # when paging a single type
+    max_limit = 50
+    cursor_salt = 'music.search.cursor'
+
+    def encode_cursor(self, query, kind, offset):
+        return signing.dumps({'q': query, 't': kind, 'o': offset}, salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, cursor, query):
+        try:
+            payload = signing.loads(cursor, salt=self.cursor_salt)
+        except signing.BadSignature:
+            return None
+        if payload.get('q') != query or payload.get('t') not in self.serializers:
+            return None
+        return payload['t'], max(int(payload.get('o', 0)), 0)
+
+    def page(self, backend, query, kind, offset, limit, request):
+        # One extra hit tells us whether there is a next page
+        hits = backend.search(query, kinds=[kind], limit=limit + 1, offset=offset, user=request.user)
+        has_next = len(hits) > limit
+        ids = [object_id for _, object_id in hits[:limit]]
+
+        model, serializer_class = self.serializers[kind]
+        objects = serializer_class.setup_eager_loading(model.objects.all()).in_bulk(ids)
+        # The index is only updated on save; re-check against the rows themselves
+        rows = [
+            objects[object_id] for object_id in ids
+            if object_id in objects and document_owner(kind, objects[object_id]) in (None, request.user.pk)
+        ]
+        return {
+            'results': serializer_class(rows, many=True, context={'request': request}).data,
+            'next': self.encode_cursor(query, kind, offset + limit) if has_next else None,
+        }
+
     def get(self, request, *args, **kwargs):
         query = request.query_params.get('q', '').strip()
         result_type = request.query_params.get('type', '').strip().lower()
+        cursor = request.query_params.get('cursor')
 
         if not query:
             return Response({'error': 'Query parameter "q" is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        results = []
-
-        if result_type == 'artist' or result_type == '':
-            artists = Artist.objects.filter(Q(name__icontains=query) | Q(country__icontains=query)).distinct()
-            results += [{
-                'type': 'artist',
-                'data': ArtistSerializer(artist).data
-            } for artist in artists]
-
-        if result_type == 'album' or result_type == '':
-            albums = Album.objects.filter(Q(title__icontains=query) | Q(genre__icontains=query)).distinct()
-            results += [{
-                'type': 'album',
-                'data': AlbumSerializer(album).data
-            } for album in albums]
-
-        if result_type == 'song' or result_type == '':
-            songs = Song.objects.filter(Q(title__icontains=query) | Q(genre__icontains=query) | Q(lyrics__icontains=query)).distinct()
-            results += [{
-                'type': 'song',
-                'data': SongSerializer(song).data
-            } for song in songs]
-
-        if result_type == 'playlist' or result_type == '':
-            playlists = Playlist.objects.filter(Q(name__icontains=query)).distinct()
-            results += [{
-                'type': 'playlist',
-                'data': PlaylistSerializer(playlist).data
-            } for playlist in playlists]
+        if result_type and result_type not in self.serializers:
+            return Response({'error': f'Unknown type "{result_type}".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        offset = 0
+        if cursor:
+            decoded = self.decode_cursor(cursor, query)
+            if decoded is None or (result_type and decoded[0] != result_type):
+                return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+            result_type, offset = decoded
+
+        default_limit = self.page_limit if result_type else self.section_limit
+        try:
+            limit = min(max(int(request.query_params.get('limit', default_limit)), 1), self.max_limit)
+        except ValueError:
+            limit = default_limit
+
+        backend = get_search_backend()
+        kinds = [result_type] if result_type else list(self.serializers)
+        counts = backend.count(query, kinds=kinds, user=request.user)
+
+        sections = {
+            kind: self.page(backend, query, kind, offset, limit, request)
+            for kind in kinds
+            if counts.get(kind)
+        }
 
-        
-        print(results)
         return create_response(
             success=True,
             message='Search Results',
-            data=results,
+            data={
+                'counts': {kind: counts.get(kind, 0) for kind in kinds},
+                'sections': sections,
+            },
+        )
+
+
+class SuggestAPIView(APIView):
+    """
+    Lightweight typeahead for the search box: id, type and display name only,
+    served from the in-process prefix index instead of the database. Like
+    search, it only sees the caller's own names, the shared catalog and
+    public playlists.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    types = ('artist', 'album', 'song', 'playlist')
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        result_type = request.query_params.get('type', '').strip().lower()
+
+        if not query:
+            return create_response(
+                success=False,
+                message='Query parameter "q" is required.',
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        if result_type and result_type not in self.types:
+            return create_response(
+                success=False,
+                message=f'Unknown type "{result_type}".',
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+
+        suggestion_index.ensure_fresh()
+        suggestions = suggestion_index.suggest(
+            query,
+            limit=limit,
+            kinds={result_type} if result_type else None,
+            user=request.user,
+        )
+        return create_response(
+            success=True,
+            message='Suggestions',
+            data=suggestions
         )
 
 
@@ -717,76 +1126,16 @@ class DiscoverSongsAPIView(APIView):
             genre = request.query_params.get('genre', 'pop').lower()
             limit = min(int(request.query_params.get('limit', 20)), 100)  # Add max limit
             
-            # First try to get from our database
-            songs = Song.objects.filter(
-                genre__iexact=genre, 
-                user=request.user
-            ).select_related('artist', 'album')[:limit]
-            
-            if songs.count() < limit:
-                # If not enough, fetch from external API
-                try:
-                    data = fetch_jamendo_tracks(genre=genre, limit=limit)
-                    if not data or not data.get('results'):
-                        raise ValueError("No results from external API")
-                    
-                    new_songs = []
-                    for track in data.get('results', []):
-                        # Process artist
-                        artist, _ = Artist.objects.get_or_create(
-                            name=track['artist_name'],
-                            user=request.user,
-                            image=upload_external_file_to_cloudinary(track['image'], 'artist_art', 'image'),
-                            defaults={
-                                'country': track.get('artist_country', '')
-                            }
-                        )
-                        
-                        # Process album
-                        album = None
-                        if track.get('album_name'):
-                            album, _ = Album.objects.get_or_create(
-                                title=track['album_name'],
-                                artist=artist,
-                                user=request.user,
-                                cover_image=upload_external_file_to_cloudinary(track['album_image'], 'cover_art', 'image'),
-                                defaults={
-                                    'release_date': track.get('releasedate', '2020-01-01'),
-                                    'genre': track.get('musicinfo', {}).get('tags', {}).get('genres', ['Pop'])[0] if isinstance(track.get('musicinfo', {}).get('tags', {}), dict) else 'Pop'
-                                }
-                            )
-                        
-                        # Process song
-                        song, created = Song.objects.get_or_create(
-                            external_id=track['id'],
-                            user=request.user,
-                            source='jamendo',
-                            defaults={
-                                'title': track['name'],
-                                'artist': artist,
-                                'album': album,
-                                'downloadable_link': track['audiodownload'] or track['audio'] or None,
-                                'duration': timedelta(seconds=track['duration']),
-                                'audio_url': track['audio'],
-                                'audio_file': upload_external_file_to_cloudinary(track['audiodownload'], 'songs', 'auto') or upload_external_file_to_cloudinary(track['audio'], 'songs', 'auto') or None,
-                                'art': upload_external_file_to_cloudinary(track['image'], 'song_art', 'image'),
-                                'genre': track.get('musicinfo', {}).get('tags', {}).get('genres', ['Pop'])[0] if isinstance(track.get('musicinfo', {}).get('tags', {}), dict) else 'Pop',
-                                'release_date': track.get('releasedate', '2020-01-01')
-                            }
-                        )
-                        if created:
-                            new_songs.append(song)
-                    
-                    # Get the updated queryset with prefetching
-                    songs = Song.objects.filter(
-                        user=request.user
-                    ).select_related('artist', 'album').order_by("-date_added")[:limit]
-                    
-                except Exception as api_error:
-                    # Log the error but continue with existing songs
-                    import logging
-                    logging.error(f"Failed to fetch from external API: {str(api_error)}")
-            
+            # Answered from the prefetched pool (manage.py prefetch_discover),
+            # never from Jamendo, so latency doesn't depend on the API
+            note_request(genre)
+            songs = list(SongSerializer.setup_eager_loading(pool_songs(genre))[:limit])
+            if len(songs) < limit:
+                # Pool cold or short: top up from the user's library
+                songs += SongSerializer.setup_eager_loading(
+                    Song.objects.in_library(request.user).filter(genre__iexact=genre).exclude(id__in=[song.id for song in songs])
+                )[:limit - len(songs)]
+
             # Serialize with request context for absolute URLs
             serializer = SongSerializer(
                 songs, 
@@ -0,0 +1,146 @@
+import struct
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b'WVF1'
+BASE_BUCKET = 256  # samples per peak before any compaction
+
+
+def waveform_resolutions():
+    return tuple(getattr(settings, 'MUSIC_WAVEFORM_RESOLUTIONS', (256, 1024, 4096)))
+
+
+class WaveformAccumulator:
+    """
+    Min/max peaks over streamed blocks. Completed buckets are kept until
+    there are more than twice `max_points` of them, then neighbours are
+    merged and the bucket size doubles, so memory is bounded however long
+    the track is and the result always has at least `max_points` peaks
+    (when the track is long enough).
+    """
+
+    def __init__(self, max_points=None):
+        self.max_points = max_points or max(waveform_resolutions())
+        self.bucket = BASE_BUCKET
+        self.mins = np.zeros(0, dtype=np.float32)
+        self.maxs = np.zeros(0, dtype=np.float32)
+        self.partial_min = self.partial_max = 0.0
+        self.partial_size = 0
+
+    def _extend_partial(self, samples, lo=None, hi=None):
+        lo = float(samples.min()) if lo is None else lo
+        hi = float(samples.max()) if hi is None else hi
+        if self.partial_size:
+            lo, hi = min(lo, self.partial_min), max(hi, self.partial_max)
+        self.partial_min, self.partial_max = lo, hi
+
+    def update(self, block):
+        if self.partial_size:
+            take = min(self.bucket - self.partial_size, len(block))
+            if take:
+                self._extend_partial(block[:take])
+                self.partial_size += take
+            block = block[take:]
+            if self.partial_size == self.bucket:
+                self.mins = np.append(self.mins, self.partial_min)
+                self.maxs = np.append(self.maxs, self.partial_max)
+                self.partial_size = 0
+
+        full = len(block) // self.bucket
+        if full:
+            buckets = block[:full * self.bucket].reshape(full, self.bucket)
+            self.mins = np.concatenate([self.mins, buckets.min(axis=1)])
+            self.maxs = np.concatenate([self.maxs, buckets.max(axis=1)])
+        tail = block[full * self.bucket:]
+        if len(tail):
+            self._extend_partial(tail)
+            self.partial_size = len(tail)
+
+        while len(self.mins) > 2 * self.max_points:
+            self._compact()
+
+    def _compact(self):
+        if len(self.mins) % 2:
+            # The odd bucket out becomes the start of the (twice as long) partial one
+            self._extend_partial(None, float(self.mins[-1]), float(self.maxs[-1]))
+            self.partial_size += self.bucket
+            self.mins, self.maxs = self.mins[:-1], self.maxs[:-1]
+        self.mins = self.mins.reshape(-1, 2).min(axis=1)
+        self.maxs = self.maxs.reshape(-1, 2).max(axis=1)
+        self.bucket *= 2
+
+    def peaks(self):
+        mins, maxs = self.mins, self.maxs
+        if self.partial_size:
+            mins = np.append(mins, self.partial_min)
+            maxs = np.append(maxs, self.partial_max)
+        return mins, maxs
+
+    def encode(self, resolutions=None):
+        mins, maxs = self.peaks()
+        if not len(mins):
+            return None
+        return encode_levels([resample(mins, maxs, points) for points in resolutions or waveform_resolutions()])
+
+
+def resample(mins, maxs, points):
+    """Reduce peaks to at most `points` buckets (min of mins, max of maxs)."""
+    if len(mins) <= points:
+        return mins, maxs
+    edges = np.linspace(0, len(mins), points + 1).astype(np.int64)[:-1]
+    return np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges)
+
+
+def encode_levels(levels):
+    """
+    Blob layout (little endian): b'WVF1', u8 level count, then per level a
+    u32 point count followed by interleaved int8 (min, max) pairs.
+    """
+    parts = [MAGIC, struct.pack('<B', len(levels))]
+    for mins, maxs in levels:
+        pairs = np.empty(2 * len(mins), dtype=np.int8)
+        pairs[0::2] = np.clip(np.round(mins * 127), -128, 127)
+        pairs[1::2] = np.clip(np.round(maxs * 127), -128, 127)
+        parts += [struct.pack('<I', len(mins)), pairs.tobytes()]
+    return b''.join(parts)
+
+
+def decode_levels(blob):
+    """[int8 array of interleaved (min, max) pairs] per level, coarsest first."""
+    blob = bytes(blob)
+    if blob[:4] != MAGIC:
+        raise ValueError("Not a waveform blob")
+    count, = struct.unpack_from('<B', blob, 4)
+    offset = 5
+    levels = []
+    for _ in range(count):
+        points, = struct.unpack_from('<I', blob, offset)
+        offset += 4
+        levels.append(np.frombuffer(blob, dtype=np.int8, count=2 * points, offset=offset))
+        offset += 2 * points
+    return sorted(levels, key=len)
+
+
+def peaks_for(blob, points):
+    """
+    Interleaved (min, max) int8 peaks with at most `points` pairs, from the
+    smallest stored level that has enough detail.
+    """
+    levels = decode_levels(blob)
+    level = next((level for level in levels if len(level) >= 2 * points), levels[-1])
+    mins, maxs = resample(level[0::2], level[1::2], points)
+    pairs = np.empty(2 * len(mins), dtype=np.int8)
+    pairs[0::2], pairs[1::2] = mins, maxs
+    return pairs
+
+
+def save_waveforms(blobs):
+    """Upsert {song_id: blob} in one statement."""
+    from .models import SongWaveform
+
+    rows = [SongWaveform(song_id=song_id, data=blob) for song_id, blob in blobs.items() if blob]
+    if rows:
+        SongWaveform.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['song'], update_fields=['data', 'updated_at']
+        )
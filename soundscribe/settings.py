@@ -157,6 +157,128 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
 }
 
+# Full-text search backend used by UnifiedSearch. When unset, SQLite uses the
+# FTS5 index and other databases fall back to music.search.DatabaseSearchBackend.
+# MUSIC_SEARCH_BACKEND = 'music.search.SQLiteFTSBackend'
+
+# Song uploads are staged on local disk and pushed to storage by
+# `manage.py run_ingest_worker`. Use 'music.storage.LocalStorage' to run the
+# pipeline without Cloudinary.
+MUSIC_AUDIO_STORAGE = config('MUSIC_AUDIO_STORAGE', default='music.storage.CloudinaryStorage')
+MUSIC_INGEST_STAGING_DIR = os.path.join(MEDIA_ROOT, 'ingest')
+MUSIC_INGEST_MAX_ATTEMPTS = 3
+MUSIC_INGEST_JOB_TIMEOUT = 600  # seconds before a running job is handed to another worker
+
+# Resumable chunked uploads (/api/uploads/)
+MUSIC_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'uploads')
+MUSIC_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+MUSIC_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Song.extract_metadata decodes once to mono at this rate, in blocks of this
+# many seconds, so memory stays flat however long the track is.
+MUSIC_ANALYSIS_SAMPLE_RATE = 22050
+MUSIC_ANALYSIS_BLOCK_SECONDS = 30
+
+# Audio feature vectors for /api/songs/<id>/similar/, appended by the analysis
+# stage. Above MUSIC_FEATURE_COARSE_MIN_ROWS candidates, queries only scan the
+# MUSIC_FEATURE_NPROBE nearest clusters (`manage.py build_feature_index`).
+MUSIC_FEATURE_STORE_DIR = os.path.join(MEDIA_ROOT, 'features')
+MUSIC_FEATURE_COARSE_MIN_ROWS = 20000
+MUSIC_FEATURE_NPROBE = 8
+
+# Peak counts stored per song for /api/songs/<id>/waveform/
+MUSIC_WAVEFORM_RESOLUTIONS = (256, 1024, 4096)
+
+# Acoustic fingerprint matching (`manage.py find_duplicates`): aligned hashes
+# needed, and the share of the shorter fingerprint they must cover.
+MUSIC_FINGERPRINT_MIN_MATCHES = 20
+MUSIC_FINGERPRINT_MIN_RATIO = 0.1
+
+# Loudness normalisation: the playback level replay_gain_db aims for (LUFS)
+# and the true peak it must not push the track over (dBTP).
+MUSIC_LOUDNESS_TARGET = -14.0
+MUSIC_TRUE_PEAK_CEILING = -1.0
+
+# /api/fetch-song-tag/batch/: files accepted per request and parsed at once
+MUSIC_TAG_BATCH_MAX_FILES = 50
+MUSIC_TAG_WORKERS = 8
+
+# /api/songs/<id>/stream/ keeps remote audio in a local LRU cache of this size.
+# Audio is only fetched from these hosts (and their subdomains), never from
+# an arbitrary audio_url, and a fill gives up after the timeout. Each process
+# logs its cache hits and misses every MUSIC_AUDIO_CACHE_STATS_INTERVAL seconds.
+MUSIC_AUDIO_CACHE_DIR = os.path.join(MEDIA_ROOT, 'audio_cache')
+MUSIC_AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3
+MUSIC_AUDIO_CACHE_TIMEOUT = 30.0
+MUSIC_AUDIO_CACHE_STATS_INTERVAL = 300
+MUSIC_AUDIO_FETCH_HOSTS = ('res.cloudinary.com', 'jamendo.com')
+
+# HLS renditions (`manage.py transcode_songs`): bitrate ladder in kbit/s
+# (rungs above the source bitrate are skipped), segment length, and how many
+# ffmpeg processes run at once.
+MUSIC_HLS_DIR = os.path.join(MEDIA_ROOT, 'hls')
+MUSIC_HLS_LADDER = (64, 128, 192)
+MUSIC_HLS_SEGMENT_SECONDS = 6
+MUSIC_TRANSCODE_WORKERS = 2
+MUSIC_TRANSCODE_TIMEOUT = 600
+
+# Remote artwork/audio copied into storage by `manage.py run_transfer_worker`:
+# concurrent transfers, concurrent requests per host, HTTP retries (with
+# backoff) per request, and attempts per transfer before it is given up.
+MUSIC_TRANSFER_WORKERS = 8
+MUSIC_TRANSFER_PER_HOST = 4
+MUSIC_TRANSFER_RETRIES = 3
+MUSIC_TRANSFER_MAX_ATTEMPTS = 3
+MUSIC_TRANSFER_CONNECT_TIMEOUT = 5.0
+MUSIC_TRANSFER_TIMEOUT = 30.0  # between reads
+# Each transfer streams to disk through one fixed-size buffer; files over the
+# size limits are refused, and none may take longer than the deadline.
+MUSIC_TRANSFER_BUFFER_SIZE = 64 * 1024
+MUSIC_TRANSFER_MAX_BYTES = 500 * 1024 ** 2  # audio
+MUSIC_TRANSFER_MAX_IMAGE_BYTES = 20 * 1024 ** 2
+MUSIC_TRANSFER_DEADLINE = 600
+
+# Jamendo API client (music.api). Set MUSIC_JAMENDO_CLIENT to
+# music.api.FixtureJamendoClient to answer from the recorded responses in
+# music/fixtures/jamendo/ instead (offline development and tests); set
+# MUSIC_JAMENDO_RECORD_DIR to record fresh ones. Responses are cached for
+# CACHE_TTL seconds, then served stale for up to STALE_TTL more while they
+# refresh in the background. Hit/miss counts are logged every STATS_INTERVAL
+# seconds.
+MUSIC_JAMENDO_CLIENT = config('MUSIC_JAMENDO_CLIENT', default='music.api.JamendoClient')
+MUSIC_JAMENDO_CLIENT_ID = config('JAMENDO_CLIENT_ID', default='684b7cdc')
+MUSIC_JAMENDO_TIMEOUT = (5.0, 15.0)  # connect, read
+MUSIC_JAMENDO_RETRIES = 3
+MUSIC_JAMENDO_CACHE_TTL = 300
+MUSIC_JAMENDO_STALE_TTL = 3600
+MUSIC_JAMENDO_STATS_INTERVAL = 300
+
+# Discover is answered from per-genre pools of prefetched Jamendo tracks,
+# kept warm by `manage.py prefetch_discover --loop` (music.discover). The
+# configured genres are always kept; others that have a pool (see
+# `prefetch_discover --genre`) for as long as somebody asks for them, until
+# nobody has for REQUESTED_TTL seconds. Each process records a request at
+# most once every REQUEST_INTERVAL seconds per genre. A pool is refreshed
+# when it is older than MAX_AGE seconds, or RETRY_AFTER seconds after a
+# failed refresh.
+MUSIC_DISCOVER_GENRES = ('pop', 'rock', 'electronic', 'hiphop', 'jazz', 'classical', 'ambient', 'lounge')
+MUSIC_DISCOVER_POOL_SIZE = 100
+MUSIC_DISCOVER_MAX_AGE = 6 * 3600
+MUSIC_DISCOVER_RETRY_AFTER = 600
+MUSIC_DISCOVER_REQUESTED_TTL = 7 * 24 * 3600
+MUSIC_DISCOVER_REQUEST_INTERVAL = 300
+
+# `manage.py fetch_songs` crawls Jamendo into the catalog (music.crawl):
+# CONCURRENCY requests in flight, at most RATE per second between them
+# (token bucket), pages of PAGE_SIZE tracks written BATCH_SIZE at a time.
+# Progress per genre is checkpointed, so an interrupted crawl resumes.
+MUSIC_CRAWL_GENRES = MUSIC_DISCOVER_GENRES
+MUSIC_CRAWL_CONCURRENCY = 4
+MUSIC_CRAWL_RATE = 4.0
+MUSIC_CRAWL_PAGE_SIZE = 200
+MUSIC_CRAWL_BATCH_SIZE = 1000
+MUSIC_CRAWL_ORDER = 'id'
+
 AUTH_USER_MODEL = 'music.User'  # Replace 'music' with your app name
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 cloudinary.config(